@@ -1,10 +1,17 @@
 """
 Agents模块
+
+Agent类在第一次访问时才导入，导入 agents.response_cache 等轻量模块时
+不会加载OpenAI SDK
 """
-from .symptom_analyzer import SymptomAnalyzer
-from .appointment_agent import AppointmentAgent
-from .guidance_agent import GuidanceAgent
-from .medication_guide import MedicationGuide
+import importlib
+
+_EXPORTS = {
+    "SymptomAnalyzer": ".symptom_analyzer",
+    "AppointmentAgent": ".appointment_agent",
+    "GuidanceAgent": ".guidance_agent",
+    "MedicationGuide": ".medication_guide",
+}
 
 __all__ = [
     "SymptomAnalyzer",
@@ -14,6 +21,10 @@ __all__ = [
 ]
 
 
-
-
-
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -4,72 +4,59 @@
 """
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
-import requests
 from config import settings
+from agents.hospital_catalog import HospitalCatalog
+from agents.hospital_client import get_hospital_client, HospitalAPIError
+from slot_inventory import SLOT_TIMES, DEFAULT_SCHEDULE
+from id_generator import new_appointment_number
 from loguru import logger
+from logging_config import debug_sampled
 
 
 class AppointmentAgent:
     """预约挂号代理"""
     
     def __init__(self):
-        self.hospital_api_base = settings.hospital_api_base_url
-        self.api_key = settings.hospital_api_key
+        self.hospital_catalog = HospitalCatalog(
+            settings.hospital_catalog_path,
+            reload_interval=settings.hospital_catalog_reload_interval
+        )
     
     def search_hospitals(
         self,
-        location: str,
-        department: Optional[str] = None
+        location: Optional[str] = None,
+        department: Optional[str] = None,
+        lat: Optional[float] = None,
+        lng: Optional[float] = None,
+        limit: Optional[int] = None
     ) -> List[Dict]:
         """
         搜索附近的医院
         
         Args:
-            location: 地理位置
-            department: 科室（可选）
+            location: 地理位置，"纬度,经度" 或地名（如"城区"）
+            department: 科室（可选），支持别名和模糊匹配
+            lat: 纬度（可选），优先于 location
+            lng: 经度（可选）
+            limit: 返回数量，默认 settings.hospital_search_limit
         
         Returns:
-            医院列表
-        """
-        # 这里是模拟数据，实际应对接真实的医院系统API
-        hospitals = [
-            {
-                "id": "h001",
-                "name": "市人民医院",
-                "address": "城区人民路123号",
-                "level": "三甲",
-                "distance": "2.5公里",
-                "departments": ["内科", "外科", "心血管内科", "消化内科", "骨科"],
-                "available_dates": self._get_available_dates(7)
-            },
-            {
-                "id": "h002",
-                "name": "市中医院",
-                "address": "城区中山路456号",
-                "level": "三甲",
-                "distance": "3.8公里",
-                "departments": ["中医内科", "针灸科", "康复科", "骨伤科"],
-                "available_dates": self._get_available_dates(7)
-            },
-            {
-                "id": "h003",
-                "name": "区中心医院",
-                "address": "新区建设路789号",
-                "level": "二甲",
-                "distance": "4.2公里",
-                "departments": ["内科", "外科", "儿科", "妇科"],
-                "available_dates": self._get_available_dates(5)
-            }
-        ]
+            医院列表，能确定位置时按距离由近到远排序
+        """
+        if lat is None or lng is None:
+            point = self.hospital_catalog.resolve_location(location)
+            lat, lng = point if point else (None, None)
         
-        # 如果指定了科室，过滤医院
-        if department:
-            hospitals = [
-                h for h in hospitals 
-                if department in h["departments"] or any(department in d for d in h["departments"])
-            ]
+        hospitals = self.hospital_catalog.search(
+            department,
+            lat=lat,
+            lng=lng,
+            limit=limit or settings.hospital_search_limit
+        )
+        for hospital in hospitals:
+            hospital["available_dates"] = self._get_available_dates(hospital.pop("booking_days"))
         
-        logger.info(f"搜索医院: 地点={location}, 科室={department}, 找到{len(hospitals)}家")
+        debug_sampled("搜索医院: 地点={}, 科室={}, 找到{}家", location, department, len(hospitals))
         return hospitals
     
     def get_available_slots(
@@ -89,30 +76,15 @@ class AppointmentAgent:
         Returns:
             可用时间段列表
         """
-        # 模拟号源数据
-        slots = []
-        
-        # 上午时段
-        morning_slots = [
-            {"time": "08:00-08:30", "available": True, "doctor": "张主任", "title": "主任医师"},
-            {"time": "08:30-09:00", "available": True, "doctor": "李医生", "title": "副主任医师"},
-            {"time": "09:00-09:30", "available": False, "doctor": "王医生", "title": "主治医师"},
-            {"time": "09:30-10:00", "available": True, "doctor": "赵医生", "title": "主治医师"},
-            {"time": "10:00-10:30", "available": True, "doctor": "张主任", "title": "主任医师"},
+        # 默认排班，不包含预约占用情况；实际号源由 slot_inventory 按天管理
+        slots = [
+            {"time": SLOT_TIMES[i], "available": True, "doctor": doctor, "title": title}
+            for doctor, title, indexes in DEFAULT_SCHEDULE
+            for i in indexes
         ]
+        slots.sort(key=lambda s: s["time"])
         
-        # 下午时段
-        afternoon_slots = [
-            {"time": "14:00-14:30", "available": True, "doctor": "孙医生", "title": "副主任医师"},
-            {"time": "14:30-15:00", "available": True, "doctor": "周医生", "title": "主治医师"},
-            {"time": "15:00-15:30", "available": False, "doctor": "吴医生", "title": "主任医师"},
-            {"time": "15:30-16:00", "available": True, "doctor": "郑医生", "title": "主治医师"},
-        ]
-        
-        slots.extend(morning_slots)
-        slots.extend(afternoon_slots)
-        
-        logger.info(f"获取号源: 医院={hospital_id}, 科室={department}, 日期={date}")
+        debug_sampled("获取号源: 医院={}, 科室={}, 日期={}", hospital_id, department, date)
         return slots
     
     def make_appointment(
@@ -139,27 +111,16 @@ class AppointmentAgent:
             预约结果
         """
         try:
-            # 在实际应用中，这里会调用医院的预约API
-            # 模拟预约成功
-            appointment_number = f"GH{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            # 未对接医院接口时模拟预约成功
+            # 全局唯一，同一秒内的多个预约不会重复
+            appointment_number = new_appointment_number()
             
-            result = {
-                "success": True,
-                "appointment_number": appointment_number,
-                "hospital_id": hospital_id,
-                "hospital_name": hospital_name,
-                "department": department,
-                "doctor": doctor,
-                "appointment_time": appointment_time,
-                "patient_name": user_info.get("name"),
-                "patient_phone": user_info.get("phone"),
-                "qr_code": f"QR_{appointment_number}",  # 就诊二维码
-                "instructions": self._generate_appointment_instructions(
-                    hospital_name, department, appointment_time
-                )
-            }
+            result = self._booking_result(
+                appointment_number, user_info, hospital_id, hospital_name,
+                department, doctor, appointment_time
+            )
             
-            logger.info(f"预约成功: {appointment_number} - {user_info.get('name')} - {hospital_name}/{department}")
+            logger.info("预约成功: {} - {} - {}/{}", appointment_number, user_info.get('name'), hospital_name, department)
             
             return result
             
@@ -170,6 +131,60 @@ class AppointmentAgent:
                 "error": str(e)
             }
     
+    async def make_appointment_async(
+        self,
+        user_info: Dict,
+        hospital_id: str,
+        hospital_name: str,
+        department: str,
+        doctor: str,
+        appointment_time: str
+    ) -> Dict:
+        """
+        创建预约，配置了医院接口时调用医院HIS挂号
+        
+        Args:
+            同 make_appointment
+        
+        Returns:
+            预约结果
+        """
+        client = get_hospital_client()
+        if client is None:
+            return self.make_appointment(
+                user_info, hospital_id, hospital_name, department, doctor, appointment_time
+            )
+        
+        appointment_number = new_appointment_number()
+        try:
+            # 单号同时作为幂等键，超时重试不会重复挂号
+            data = await client.book(
+                hospital_id,
+                {
+                    "department": department,
+                    "doctor": doctor,
+                    "appointment_time": appointment_time,
+                    "patient_name": user_info.get("name"),
+                    "patient_phone": user_info.get("phone"),
+                    "patient_id_card": user_info.get("id_card")
+                },
+                idempotency_key=appointment_number
+            )
+        except HospitalAPIError as e:
+            logger.error(f"预约失败: {hospital_name}/{department} - {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        
+        appointment_number = data.get("appointment_number") or appointment_number
+        logger.info("预约成功: {} - {} - {}/{}", appointment_number, user_info.get('name'), hospital_name, department)
+        
+        return self._booking_result(
+            appointment_number, user_info, hospital_id, hospital_name,
+            department, doctor, appointment_time
+        )
+    
     def cancel_appointment(self, appointment_number: str) -> Dict:
         """
         取消预约
@@ -182,7 +197,7 @@ class AppointmentAgent:
         """
         try:
             # 实际应用中调用医院API取消预约
-            logger.info(f"取消预约: {appointment_number}")
+            logger.info("取消预约: {}", appointment_number)
             
             return {
                 "success": True,
@@ -197,6 +212,41 @@ class AppointmentAgent:
                 "error": str(e)
             }
     
+    async def cancel_appointment_async(
+        self,
+        appointment_number: str,
+        hospital_id: Optional[str] = None
+    ) -> Dict:
+        """
+        取消预约，配置了医院接口时通知医院HIS
+        
+        Args:
+            appointment_number: 预约单号
+            hospital_id: 医院ID
+        
+        Returns:
+            取消结果
+        """
+        client = get_hospital_client()
+        if client is None or not hospital_id:
+            return self.cancel_appointment(appointment_number)
+        
+        try:
+            await client.cancel(hospital_id, appointment_number)
+        except HospitalAPIError as e:
+            logger.error(f"取消预约失败: {appointment_number} - {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        
+        logger.info("取消预约: {}", appointment_number)
+        return {
+            "success": True,
+            "message": "预约已取消",
+            "appointment_number": appointment_number
+        }
+    
     def get_appointment_status(self, appointment_number: str) -> Dict:
         """
         查询预约状态
@@ -215,6 +265,99 @@ class AppointmentAgent:
             "estimated_wait_time": "30分钟"
         }
     
+    async def get_appointment_status_async(
+        self,
+        appointment_number: str,
+        hospital_id: Optional[str] = None
+    ) -> Dict:
+        """
+        查询预约状态，配置了医院接口时从医院HIS查询
+        
+        Args:
+            appointment_number: 预约单号
+            hospital_id: 医院ID
+        
+        Returns:
+            预约状态信息，查询失败时包含 error
+        """
+        client = get_hospital_client()
+        if client is None or not hospital_id:
+            return self.get_appointment_status(appointment_number)
+        
+        try:
+            data = await client.get_status(hospital_id, appointment_number)
+        except HospitalAPIError as e:
+            logger.error(f"查询预约状态失败: {appointment_number} - {str(e)}")
+            return {
+                "appointment_number": appointment_number,
+                "status": "unknown",
+                "error": str(e)
+            }
+        
+        return {
+            "appointment_number": appointment_number,
+            "status": data.get("status", "unknown"),
+            "queue_number": data.get("queue_number"),
+            "estimated_wait_time": data.get("estimated_wait_time")
+        }
+    
+    async def get_available_slots_async(
+        self,
+        hospital_id: str,
+        department: str,
+        date: str
+    ) -> Optional[Dict]:
+        """
+        从医院HIS查询号源，相同的查询同时只发送一次
+        
+        Returns:
+            {"success": True, "slots": [...]}；未配置医院接口时返回None，使用本地号源库存
+        """
+        client = get_hospital_client()
+        if client is None:
+            return None
+        
+        try:
+            data = await client.get_slots(hospital_id, department, date)
+        except HospitalAPIError as e:
+            logger.error(f"查询号源失败: 医院={hospital_id}, 科室={department}, 日期={date} - {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        
+        return {
+            "success": True,
+            "slots": data.get("slots", [])
+        }
+    
+    def _booking_result(
+        self,
+        appointment_number: str,
+        user_info: Dict,
+        hospital_id: str,
+        hospital_name: str,
+        department: str,
+        doctor: str,
+        appointment_time: str
+    ) -> Dict:
+        """预约成功的返回结果"""
+        return {
+            "success": True,
+            "appointment_number": appointment_number,
+            "hospital_id": hospital_id,
+            "hospital_name": hospital_name,
+            "department": department,
+            "doctor": doctor,
+            "appointment_time": appointment_time,
+            "patient_name": user_info.get("name"),
+            "patient_phone": user_info.get("phone"),
+            "qr_code": f"QR_{appointment_number}",  # 就诊二维码
+            "instructions": self._generate_appointment_instructions(
+                hospital_name, department, appointment_time
+            )
+        }
+    
     def _get_available_dates(self, days: int) -> List[str]:
         """生成未来可预约的日期"""
         dates = []
@@ -0,0 +1,266 @@
+"""
+药物相互作用索引
+从本地数据文件加载药品、相互作用和过敏信息，建立按药名/成分/类别的哈希索引，
+不需要调用AI即可完成药物相互作用和过敏检查
+"""
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from loguru import logger
+from agents.triage_index import _NEGATIONS
+
+
+DEFAULT_DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data",
+    "drug_interactions.json"
+)
+
+# 严重程度排序，用于结果排序
+SEVERITY_ORDER = {"contraindicated": 0, "major": 1, "moderate": 2, "minor": 3}
+
+# 药名中的规格和剂型，归一化时去掉（如"阿司匹林肠溶片 100mg"）
+_STRENGTH = re.compile(r"\d+(\.\d+)?\s*(mg|g|ml|μg|ug|iu|万单位)")
+_DOSAGE_FORM = re.compile(
+    r"(缓释片|控释片|肠溶片|分散片|咀嚼片|泡腾片|片剂|片|缓释胶囊|肠溶胶囊|胶囊|颗粒|口服液|"
+    r"注射液|注射剂|滴丸|软膏|乳膏|糖浆|混悬液|干混悬剂|散)$"
+)
+
+# 过敏史中的分句，否定词在分句开头时整句都是否定（如"无青霉素、头孢类过敏"）
+_ALLERGY_CLAUSES = re.compile(r"[,;。\n]")
+_NEGATED_ALLERGY = tuple(f"{neg}过敏" for neg in _NEGATIONS)
+
+# 名称中包含别名时，参与匹配的别名最短长度
+_MIN_CONTAINED_ALIAS_LENGTH = 3
+
+
+def _severity_rank(rule: Dict) -> int:
+    return SEVERITY_ORDER.get(rule["severity"], 9)
+
+
+def normalize_drug_name(name: str) -> str:
+    """归一化药名：全角转半角、小写、去空白和剂型规格"""
+    name = unicodedata.normalize("NFKC", name or "").lower().strip()
+    name = _STRENGTH.sub("", name)
+    name = re.sub(r"\s+", " ", name).strip()
+    return _DOSAGE_FORM.sub("", name).strip()
+
+
+class DrugInteractionIndex:
+    """药物相互作用索引，数据文件变化后自动重新加载"""
+
+    def __init__(self, path: Optional[str] = None, reload_interval: float = 5.0):
+        self.path = path or DEFAULT_DATA_PATH
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+
+        self.version = None
+        self._aliases: Dict[str, str] = {}  # 归一化名称/别名 -> 标准药名
+        self._contained: List[Tuple[str, Optional[re.Pattern], str]] = []  # 包含匹配用的别名，长的在前
+        self._tags: Dict[str, frozenset] = {}  # 标准药名 -> 药名、成分和类别
+        self._pairs: Dict[frozenset, Dict] = {}  # 药品对 -> 最严重的相互作用
+        self._allergens: List[Tuple[str, Dict]] = []  # (过敏原别名, 过敏信息)
+
+        self.load()
+
+    def load(self):
+        """加载数据文件并重建索引"""
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        aliases = {}
+        tags = {}
+        for drug in data.get("drugs", []):
+            name = drug["name"]
+            tags[name] = frozenset(
+                [name] + drug.get("ingredients", []) + drug.get("classes", [])
+            )
+            for alias in [name] + drug.get("aliases", []):
+                aliases[normalize_drug_name(alias)] = name
+
+        # 名称中包含别名时的匹配：太短的别名容易出现在无关药名中（如"再林"和"克林霉素"），不参与；
+        # 英文别名按整词匹配（"smz"不匹配"asmza"）
+        contained = []
+        for alias, name in aliases.items():
+            if len(alias) < _MIN_CONTAINED_ALIAS_LENGTH:
+                continue
+            pattern = None
+            if alias.isascii():
+                pattern = re.compile(rf"(?<![a-z0-9]){re.escape(alias)}(?![a-z0-9])")
+            contained.append((alias, pattern, name))
+        contained.sort(key=lambda item: len(item[0]), reverse=True)
+
+        # 标签对 -> 相互作用
+        tag_rules: Dict[frozenset, Dict] = {}
+        for rule in data.get("interactions", []):
+            tag_rules[frozenset((rule["a"], rule["b"]))] = {
+                "severity": rule["severity"],
+                "advice": rule["advice"]
+            }
+
+        # 预先展开为药品对，检查时只需一次哈希查找。一种药属于多个类别时
+        # （如阿司匹林既是NSAIDs也是抗血小板药）同一药品对可能命中多条规则，只保留最严重的一条
+        pairs = {}
+        names = list(tags)
+        for i, first in enumerate(names):
+            for second in names[i + 1:]:
+                found = None
+                for tag_a in tags[first]:
+                    for tag_b in tags[second]:
+                        rule = tag_rules.get(frozenset((tag_a, tag_b)))
+                        if rule and (found is None or _severity_rank(rule) < _severity_rank(found)):
+                            found = rule
+                if found:
+                    pairs[frozenset((first, second))] = found
+
+        allergens = []
+        for group in data.get("allergies", []):
+            for alias in group.get("aliases", []):
+                allergens.append((normalize_drug_name(alias), group))
+        # 长的别名优先匹配
+        allergens.sort(key=lambda item: len(item[0]), reverse=True)
+
+        with self._lock:
+            self.version = data.get("version")
+            self._aliases = aliases
+            self._contained = contained
+            self._tags = tags
+            self._pairs = pairs
+            self._allergens = allergens
+            self._mtime = mtime
+
+        logger.info(f"加载药物相互作用数据: {len(tags)}种药品, {len(pairs)}组相互作用")
+
+    def reload_if_changed(self):
+        """数据文件更新后重新加载，最多每 reload_interval 秒检查一次"""
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            if os.path.getmtime(self.path) != self._mtime:
+                self.load()
+        except Exception as e:
+            # 新文件有问题时继续使用旧索引
+            logger.error(f"重新加载药物相互作用数据失败: {str(e)}")
+
+    def resolve(self, name: str) -> Optional[str]:
+        """把药名、商品名或英文名解析为标准药名"""
+        key = normalize_drug_name(name)
+        drug = self._aliases.get(key)
+        if drug:
+            return drug
+        # 名称中包含已知别名（如"拜阿司匹灵(阿司匹林肠溶片)"），取最长的匹配
+        for alias, pattern, candidate in self._contained:
+            if alias in key and (pattern is None or pattern.search(key)):
+                return candidate
+        return None
+
+    def check(self, medications: List[str], allergies: Optional[str] = None) -> Dict:
+        """
+        检查药品之间的相互作用，以及与过敏史的冲突
+
+        Args:
+            medications: 药品名称列表
+            allergies: 过敏史文本，如"青霉素过敏、磺胺类药物过敏"
+
+        Returns:
+            相互作用和过敏警告
+        """
+        self.reload_if_changed()
+
+        resolved = []
+        unknown = []
+        for name in medications:
+            drug = self.resolve(name)
+            if drug:
+                resolved.append((name, drug))
+            else:
+                unknown.append(name)
+
+        warnings = []
+        for i, (name_a, drug_a) in enumerate(resolved):
+            for name_b, drug_b in resolved[i + 1:]:
+                if drug_a == drug_b:
+                    warnings.append({
+                        "type": "duplicate",
+                        "medications": [name_a, name_b],
+                        "severity": "moderate",
+                        "advice": f"{name_a}和{name_b}是同一种药，注意不要重复服用"
+                    })
+                    continue
+                rule = self._pairs.get(frozenset((drug_a, drug_b)))
+                if rule:
+                    warnings.append({
+                        "type": "interaction",
+                        "medications": [name_a, name_b],
+                        "severity": rule["severity"],
+                        "advice": rule["advice"]
+                    })
+
+        if allergies:
+            warnings.extend(self._check_allergies(resolved, allergies))
+
+        warnings.sort(key=_severity_rank)
+
+        return {
+            "warnings": warnings,
+            "unknown_medications": unknown,
+            "data_version": self.version
+        }
+
+    @staticmethod
+    def _mentions(text: str, alias: str) -> bool:
+        """文本中出现了没有被否定的过敏原（前面有否定词，或后面紧跟"不过敏"时不算）"""
+        start = text.find(alias)
+        while start != -1:
+            end = start + len(alias)
+            negated = any(text[max(0, start - len(neg)):start] == neg for neg in _NEGATIONS)
+            if not negated and not text.startswith(_NEGATED_ALLERGY, end):
+                return True
+            start = text.find(alias, start + 1)
+        return False
+
+    def _check_allergies(self, resolved: List[Tuple[str, str]], allergies: str) -> List[Dict]:
+        """根据过敏史检查药品"""
+        groups = []
+        for clause in _ALLERGY_CLAUSES.split(normalize_drug_name(allergies)):
+            clause = clause.strip()
+            if not clause or clause.startswith(_NEGATIONS):
+                continue
+            for alias, group in self._allergens:
+                if group not in groups and self._mentions(clause, alias):
+                    groups.append(group)
+
+        warnings = []
+        for name, drug in resolved:
+            tags = self._tags.get(drug, frozenset())
+            # 检查全部过敏原：直接属于过敏药物类别优先于交叉过敏，
+            # 如"头孢过敏，青霉素过敏"时阿莫西林应为禁用而不是可能交叉过敏
+            direct = next((g for g in groups if tags & set(g.get("classes", []))), None)
+            if direct is not None:
+                warnings.append({
+                    "type": "allergy",
+                    "medications": [name],
+                    "allergen": direct["allergen"],
+                    "severity": "contraindicated",
+                    "advice": f"您对{direct['allergen']}过敏，{name}属于同类药物，请勿服用并告知医生"
+                })
+                continue
+            cross = next((g for g in groups if tags & set(g.get("cross_classes", []))), None)
+            if cross is not None:
+                warnings.append({
+                    "type": "allergy",
+                    "medications": [name],
+                    "allergen": cross["allergen"],
+                    "severity": "moderate",
+                    "advice": f"您对{cross['allergen']}过敏，{name}可能存在交叉过敏，服用前请咨询医生"
+                })
+        return warnings
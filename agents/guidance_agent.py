@@ -4,9 +4,32 @@
 """
 from typing import Dict, List, Optional
 from datetime import datetime
+import hashlib
+import json
 from loguru import logger
 
 
+# 就医流程步骤顺序
+STEP_ORDER = (
+    "registration", "waiting", "consultation",
+    "examination", "payment", "pharmacy", "follow_up"
+)
+
+# 就医重要提醒
+IMPORTANT_REMINDERS = (
+    "请提前30分钟到达医院",
+    "携带身份证、医保卡",
+    "带上以前的病历和检查报告",
+    "如果不舒服可随时告诉医护人员",
+    "遇到困难可以找医院的志愿者或导医台"
+)
+
+
+def _dumps(data) -> bytes:
+    """与FastAPI默认输出一致的JSON编码（不转义中文）"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
 class GuidanceAgent:
     """就医流程引导代理"""
     
@@ -78,6 +101,63 @@ class GuidanceAgent:
                 ]
             }
         }
+        
+        self._precompile()
+    
+    def _precompile(self):
+        """
+        预先生成各步骤的静态指导内容和JSON字节
+        
+        步骤、提示、语音文本和时间线都是固定的，只在启动时生成一次，
+        请求时只需合并个性化信息。修改 process_steps 后需要重新调用
+        """
+        self._voice_texts: Dict[str, str] = {}
+        self._step_payloads: Dict[str, Dict] = {}
+        self._step_json: Dict[str, bytes] = {}
+        self._voice_json: Dict[str, bytes] = {}
+        
+        for step, step_info in self.process_steps.items():
+            instructions = "".join(
+                f"第{i}步，{instruction}。\n"
+                for i, instruction in enumerate(step_info["steps"], 1)
+            )
+            self._voice_texts[step] = (
+                f"现在需要进行{step_info['name']}。请按照以下步骤操作：\n{instructions}"
+            )
+            payload = {
+                "success": True,
+                "step_name": step_info["name"],
+                "steps": tuple(step_info["steps"]),
+                "tips": tuple(self._get_step_tips(step)),
+                "next_step": self._get_next_step(step),
+                "voice_guidance": self._generate_voice_guidance(step, step_info)
+            }
+            self._step_payloads[step] = payload
+            self._step_json[step] = _dumps(payload)
+            self._voice_json[step] = _dumps({
+                "success": True,
+                "step": step,
+                "language": "zh-CN",
+                "text": self._voice_texts[step]
+            })
+        
+        # 完整指导中除预约信息外的部分
+        self._full_guidance_static = {
+            "timeline": tuple(self._generate_timeline("")),
+            "process": self.process_steps,
+            "important_reminders": IMPORTANT_REMINDERS,
+            "emergency_contacts": self._get_emergency_info("")
+        }
+        self._full_guidance_prefix = _dumps({"title": "就医流程完整指导"})[:-1] + b',"appointment_info":'
+        self._full_guidance_suffix = b"," + _dumps(self._full_guidance_static)[1:]
+        
+        self.steps_json = _dumps({"success": True, "steps": self.process_steps})
+        self.steps_etag = self.etag(self.steps_json)
+    
+    @staticmethod
+    def etag(body: bytes) -> str:
+        """根据响应内容生成ETag"""
+        return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
     
     def get_full_guidance(
         self,
@@ -94,27 +174,25 @@ class GuidanceAgent:
         """
         hospital_name = appointment_info.get("hospital_name", "医院")
         department = appointment_info.get("department", "相关科室")
-        appointment_time = appointment_info.get("appointment_time", "预约时间")
         
         guidance = {
             "title": "就医流程完整指导",
             "appointment_info": appointment_info,
-            "timeline": self._generate_timeline(appointment_time),
-            "process": self.process_steps,
-            "important_reminders": [
-                "请提前30分钟到达医院",
-                "携带身份证、医保卡",
-                "带上以前的病历和检查报告",
-                "如果不舒服可随时告诉医护人员",
-                "遇到困难可以找医院的志愿者或导医台"
-            ],
-            "emergency_contacts": self._get_emergency_info(hospital_name)
+            **self._full_guidance_static
         }
         
-        logger.info(f"生成完整就医指导: {hospital_name}/{department}")
+        logger.info("生成完整就医指导: {}/{}", hospital_name, department)
         
         return guidance
     
+    def get_full_guidance_json(self, appointment_info: Dict) -> bytes:
+        """
+        获取完整的就医流程指导（JSON字节）
+        
+        只序列化预约信息，其余部分使用预先生成的JSON
+        """
+        return self._full_guidance_prefix + _dumps(appointment_info) + self._full_guidance_suffix
+    
     def get_current_step_guidance(
         self,
         current_step: str,
@@ -136,16 +214,7 @@ class GuidanceAgent:
                 "error": "未知步骤"
             }
         
-        step_info = self.process_steps[current_step]
-        
-        guidance = {
-            "success": True,
-            "step_name": step_info["name"],
-            "steps": step_info["steps"],
-            "tips": self._get_step_tips(current_step),
-            "next_step": self._get_next_step(current_step),
-            "voice_guidance": self._generate_voice_guidance(current_step, step_info)
-        }
+        guidance = dict(self._step_payloads[current_step])
         
         # 根据上下文添加个性化信息
         if context:
@@ -153,6 +222,27 @@ class GuidanceAgent:
         
         return guidance
     
+    def get_step_guidance_json(
+        self,
+        current_step: str,
+        context: Optional[Dict] = None
+    ) -> Optional[bytes]:
+        """
+        获取当前步骤的详细指导（JSON字节）
+        
+        Args:
+            current_step: 当前步骤
+            context: 上下文信息
+        
+        Returns:
+            预先生成的JSON，有上下文时在末尾合并个性化信息；未知步骤返回None
+        """
+        body = self._step_json.get(current_step)
+        if body is None or not context:
+            return body
+        overlay = _dumps(self._personalize_guidance(current_step, context))
+        return body[:-1] + b',"personalized_info":' + overlay + b"}"
+    
     def get_location_guidance(
         self,
         hospital_id: str,
@@ -223,18 +313,19 @@ class GuidanceAgent:
         Returns:
             语音指导文本
         """
-        if step not in self.process_steps:
-            return "请按照医院指示进行操作"
-        
-        step_info = self.process_steps[step]
-        
-        voice_text = f"现在需要进行{step_info['name']}。"
-        voice_text += "请按照以下步骤操作：\n"
-        
-        for i, instruction in enumerate(step_info["steps"], 1):
-            voice_text += f"第{i}步，{instruction}。\n"
-        
-        return voice_text
+        return self._voice_texts.get(step, "请按照医院指示进行操作")
+    
+    def get_voice_guidance_json(self, step: str, language: str = "zh-CN") -> bytes:
+        """获取语音指导接口的JSON字节，默认语言直接使用预先生成的内容"""
+        body = self._voice_json.get(step)
+        if body is not None and language == "zh-CN":
+            return body
+        return _dumps({
+            "success": True,
+            "step": step,
+            "language": language,
+            "text": self.generate_voice_guidance(step, language)
+        })
     
     def _generate_timeline(self, appointment_time: str) -> List[Dict]:
         """生成就医时间线"""
@@ -294,15 +385,10 @@ class GuidanceAgent:
     
     def _get_next_step(self, current_step: str) -> Optional[str]:
         """获取下一步骤"""
-        step_order = [
-            "registration", "waiting", "consultation", 
-            "examination", "payment", "pharmacy", "follow_up"
-        ]
-        
         try:
-            current_index = step_order.index(current_step)
-            if current_index < len(step_order) - 1:
-                next_step = step_order[current_index + 1]
+            current_index = STEP_ORDER.index(current_step)
+            if current_index < len(STEP_ORDER) - 1:
+                next_step = STEP_ORDER[current_index + 1]
                 return self.process_steps[next_step]["name"]
         except ValueError:
             pass
@@ -0,0 +1,163 @@
+"""
+LLM对冲请求
+调用超过近期耗时的分位数（默认P90）仍未返回时，再发出一个相同的请求（可以使用备用模型或接口），
+使用先成功返回的结果并取消另一个，减少慢请求造成的长尾等待
+"""
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+from collections import deque
+import asyncio
+import threading
+from config import settings
+from metrics import llm_hedge_delay_seconds, llm_hedged_requests_total
+
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """最近若干次调用的耗时，用于计算对冲等待时间"""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+class RequestHedger:
+    """
+    对冲请求
+
+    按 key（通常是模型名）分别统计主请求耗时；主请求在等待时间内没有返回时发出备用请求，
+    主请求失败时立即发出备用请求
+
+    Args:
+        agent: Agent名称，用于指标标签
+        percentile: 对冲等待时间取最近耗时的分位数
+        window: 统计的最近调用数
+        min_samples: 样本少于该数量时使用 initial_delay
+        initial_delay: 初始等待时间（秒）
+        min_delay: 等待时间下限（秒）
+    """
+
+    def __init__(
+        self,
+        agent: str,
+        percentile: float = 0.9,
+        window: int = 200,
+        min_samples: int = 20,
+        initial_delay: float = 8.0,
+        min_delay: float = 0.5
+    ):
+        self.agent = agent
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self._trackers: Dict[str, LatencyTracker] = {}
+
+    def _tracker(self, key: str) -> LatencyTracker:
+        tracker = self._trackers.get(key)
+        if tracker is None:
+            tracker = self._trackers.setdefault(key, LatencyTracker(self.window))
+        return tracker
+
+    def delay(self, key: str) -> float:
+        """发出备用请求前等待的时间（秒）"""
+        tracker = self._tracker(key)
+        if len(tracker) < self.min_samples:
+            return self.initial_delay
+        return max(tracker.percentile(self.percentile), self.min_delay)
+
+    async def call(
+        self,
+        key: str,
+        primary: Callable[[], Awaitable[T]],
+        backup: Callable[[], Awaitable[T]],
+        failover: Callable[[BaseException], bool] = lambda e: True
+    ) -> Tuple[T, str]:
+        """
+        执行对冲请求
+
+        Args:
+            key: 统计耗时使用的键
+            primary: 创建主请求的函数
+            backup: 创建备用请求的函数
+            failover: 主请求抛出该异常时是否发出备用请求（如参数错误不需要再试）
+
+        Returns:
+            (结果, "primary" 或 "backup")
+
+        Raises:
+            两个请求都失败时抛出主请求的异常
+        """
+        loop = asyncio.get_running_loop()
+        delay = self.delay(key)
+        llm_hedge_delay_seconds.set(delay, agent=self.agent, model=key)
+
+        start = loop.time()
+        primary_task = asyncio.ensure_future(primary())
+        tasks = {primary_task: "primary"}
+        outcome = "failed"
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=delay)
+            if done:
+                error = primary_task.exception()
+                if error is None:
+                    outcome = "not_hedged"
+                    return primary_task.result(), "primary"
+                if not failover(error):
+                    raise error
+
+            tasks[asyncio.ensure_future(backup())] = "backup"
+            pending = {task for task in tasks if not task.done()}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        outcome = f"{tasks[task]}_won"
+                        return task.result(), tasks[task]
+            raise primary_task.exception()
+        finally:
+            primary_unfinished = not primary_task.done()
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            # 主请求被取消时实际耗时至少为已等待的时间，同样计入，避免慢请求从统计中消失
+            if primary_unfinished or (not primary_task.cancelled() and primary_task.exception() is None):
+                self._tracker(key).record(loop.time() - start)
+            llm_hedged_requests_total.inc(agent=self.agent, outcome=outcome)
+
+    def stats(self) -> Dict:
+        """各模型的样本数和当前对冲等待时间"""
+        return {
+            key: {"samples": len(tracker), "delay": round(self.delay(key), 3)}
+            for key, tracker in list(self._trackers.items())
+        }
+
+
+def create_request_hedger(agent: str) -> Optional[RequestHedger]:
+    """按配置创建对冲请求，未启用时返回None"""
+    if not settings.llm_hedge_enabled:
+        return None
+    return RequestHedger(
+        agent,
+        percentile=settings.llm_hedge_percentile,
+        window=settings.llm_hedge_window,
+        min_samples=settings.llm_hedge_min_samples,
+        initial_delay=settings.llm_hedge_initial_delay,
+        min_delay=settings.llm_hedge_min_delay
+    )
@@ -0,0 +1,357 @@
+"""
+医院目录索引
+从本地数据文件（或数据库等其他来源）加载医院信息，建立科室倒排索引和坐标网格索引，
+按科室查找最近的K家医院时不需要遍历全部医院
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import difflib
+import heapq
+from itertools import islice
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from loguru import logger
+
+
+DEFAULT_DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data",
+    "hospitals.json"
+)
+
+EARTH_RADIUS_KM = 6371.0088
+# 每纬度对应的距离（公里）
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# 候选医院不多时直接逐个计算距离，比按网格逐圈查找更快
+BRUTE_FORCE_LIMIT = 64
+
+# 缓存的科室查询词数量上限
+MATCH_CACHE_SIZE = 4096
+
+_COORDINATES = re.compile(r"^\s*(-?\d+(\.\d+)?)\s*[,，]\s*(-?\d+(\.\d+)?)\s*$")
+
+
+def normalize_name(name: str) -> str:
+    """归一化科室名和地名：全角转半角、去空白"""
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", name or ""))
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """两点间的球面距离（公里）"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class HospitalCatalog:
+    """
+    医院目录
+
+    - 科室倒排索引：科室 -> 医院编号集合，支持别名、包含和近似匹配
+    - 网格索引：按经纬度划分网格，从所在网格向外逐圈查找最近的医院
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        reload_interval: float = 5.0,
+        cell_size: float = 0.02
+    ):
+        self.path = path or DEFAULT_DATA_PATH
+        self.reload_interval = reload_interval
+        self.cell_size = cell_size  # 网格大小（度），0.02度约2公里
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+
+        self.version = None
+        self._hospitals: List[Dict] = []
+        self._coords: List[Optional[Tuple[float, float]]] = []
+        self._by_department: Dict[str, frozenset] = {}  # 科室 -> 医院编号
+        self._department_aliases: Dict[str, str] = {}
+        self._department_matches: Dict[str, frozenset] = {}  # 查询词 -> 匹配到的医院编号
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        self._grid_bounds = (0, 0, 0, 0)
+        self._areas: List[Tuple[str, Tuple[float, float]]] = []
+
+        self.load()
+
+    def load(self):
+        """加载数据文件并重建索引"""
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.load_records(
+            data.get("hospitals", []),
+            areas=data.get("areas", []),
+            department_aliases=data.get("department_aliases", {}),
+            version=data.get("version")
+        )
+        self._mtime = mtime
+
+    def load_records(
+        self,
+        hospitals: Iterable[Dict],
+        areas: Optional[List[Dict]] = None,
+        department_aliases: Optional[Dict[str, str]] = None,
+        version: Optional[str] = None
+    ):
+        """
+        用医院记录重建索引，数据库等其他数据来源也通过这里加载
+
+        Args:
+            hospitals: 医院记录，包含 id、name、lat、lng、departments 等字段
+            areas: 地名及其坐标，用于解析 location 参数
+            department_aliases: 科室别名 -> 标准科室名
+            version: 数据版本
+        """
+        records = []
+        coords = []
+        by_department: Dict[str, set] = {}
+        grid: Dict[Tuple[int, int], List[int]] = {}
+
+        for hospital in hospitals:
+            index = len(records)
+            record = {
+                "id": hospital["id"],
+                "name": hospital["name"],
+                "address": hospital.get("address"),
+                "level": hospital.get("level"),
+                "departments": tuple(hospital.get("departments", [])),
+                "booking_days": hospital.get("booking_days", 7)
+            }
+            records.append(record)
+
+            for department in record["departments"]:
+                by_department.setdefault(normalize_name(department), set()).add(index)
+
+            if hospital.get("lat") is None or hospital.get("lng") is None:
+                coords.append(None)
+                continue
+            point = (float(hospital["lat"]), float(hospital["lng"]))
+            record["lat"], record["lng"] = point
+            coords.append(point)
+            grid.setdefault(self._cell(*point), []).append(index)
+
+        area_points = []
+        for area in areas or []:
+            point = (float(area["lat"]), float(area["lng"]))
+            for name in [area["name"]] + area.get("aliases", []):
+                area_points.append((normalize_name(name), point))
+        # 长的地名优先匹配
+        area_points.sort(key=lambda item: len(item[0]), reverse=True)
+
+        aliases = {
+            normalize_name(alias): normalize_name(name)
+            for alias, name in (department_aliases or {}).items()
+        }
+
+        if grid:
+            rows = [cell[0] for cell in grid]
+            cols = [cell[1] for cell in grid]
+            bounds = (min(rows), max(rows), min(cols), max(cols))
+        else:
+            bounds = (0, 0, 0, 0)
+
+        with self._lock:
+            self.version = version
+            self._hospitals = records
+            self._coords = coords
+            self._by_department = {name: frozenset(ids) for name, ids in by_department.items()}
+            self._department_aliases = aliases
+            self._department_matches = {}
+            self._grid = grid
+            self._grid_bounds = bounds
+            self._areas = area_points
+
+        logger.info(f"加载医院目录: {len(records)}家医院, {len(by_department)}个科室")
+
+    def reload_if_changed(self):
+        """数据文件更新后重新加载，最多每 reload_interval 秒检查一次"""
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            if os.path.getmtime(self.path) != self._mtime:
+                self.load()
+        except Exception as e:
+            # 新文件有问题时继续使用旧索引
+            logger.error(f"重新加载医院目录失败: {str(e)}")
+
+    def __len__(self) -> int:
+        return len(self._hospitals)
+
+    def resolve_location(self, location: Optional[str]) -> Optional[Tuple[float, float]]:
+        """
+        把 location 解析为坐标
+
+        支持 "纬度,经度" 和数据文件中配置的地名（如"城区"、"火车站"），无法解析时返回None
+        """
+        if not location:
+            return None
+        match = _COORDINATES.match(location)
+        if match:
+            return float(match.group(1)), float(match.group(3))
+        text = normalize_name(location)
+        for name, point in self._areas:
+            if name in text:
+                return point
+        return None
+
+    def match_departments(self, department: str) -> frozenset:
+        """
+        按科室查找医院编号
+
+        依次尝试：别名、包含关系（"内科"匹配"内科"和"心血管内科"）、
+        前缀（缩写，如"心内"匹配别名"心内科"）、近似匹配
+        """
+        key = normalize_name(department)
+        cached = self._department_matches.get(key)
+        if cached is not None:
+            return cached
+
+        name = self._department_aliases.get(key, key)
+        # 与原来的过滤规则一致：完全相同或包含查询词的科室都算匹配
+        names = [d for d in self._by_department if name in d]
+        if not names:
+            # 查询词包含科室名，如"心血管内科门诊"，取最长的科室名
+            contained = [d for d in self._by_department if d in name]
+            if contained:
+                names = [max(contained, key=len)]
+        if not names:
+            # 缩写与完整名称相差较多，近似匹配的分数不够（如"心内"），按科室名和别名的前缀匹配
+            names = sorted(
+                {d for d in self._by_department if d.startswith(name)}
+                | {
+                    target for alias, target in self._department_aliases.items()
+                    if alias.startswith(name) and target in self._by_department
+                }
+            )
+        if not names:
+            names = difflib.get_close_matches(name, list(self._by_department), n=3, cutoff=0.6)
+
+        ids = frozenset().union(*(self._by_department[d] for d in names)) if names else frozenset()
+        if len(self._department_matches) >= MATCH_CACHE_SIZE:
+            self._department_matches.clear()
+        self._department_matches[key] = ids
+        return ids
+
+    def search(
+        self,
+        department: Optional[str] = None,
+        lat: Optional[float] = None,
+        lng: Optional[float] = None,
+        limit: int = 10
+    ) -> List[Dict]:
+        """
+        查找提供某科室的最近医院
+
+        Args:
+            department: 科室（可选），支持模糊匹配
+            lat: 纬度（可选），与 lng 同时提供时按距离排序
+            lng: 经度（可选）
+            limit: 返回数量
+
+        Returns:
+            医院列表，有坐标时包含 distance_km 并按距离由近到远排序
+        """
+        self.reload_if_changed()
+
+        hospitals = self._hospitals
+        candidates = self.match_departments(department) if department else None
+
+        if lat is None or lng is None:
+            ids = sorted(candidates) if candidates is not None else range(len(hospitals))
+            return [dict(hospitals[i], distance_km=None, distance=None) for i in islice(ids, limit)]
+
+        if candidates is not None and len(candidates) <= BRUTE_FORCE_LIMIT:
+            nearest = self._nearest_brute_force(candidates, lat, lng, limit)
+        else:
+            nearest = self._nearest_from_grid(candidates, lat, lng, limit)
+
+        return [
+            dict(hospitals[i], distance_km=round(distance, 2), distance=f"{distance:.1f}公里")
+            for distance, i in nearest
+        ]
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+
+    def _nearest_brute_force(
+        self,
+        candidates: Iterable[int],
+        lat: float,
+        lng: float,
+        limit: int
+    ) -> List[Tuple[float, int]]:
+        coords = self._coords
+        distances = [
+            (haversine_km(lat, lng, *coords[i]), i)
+            for i in candidates
+            if coords[i] is not None
+        ]
+        return heapq.nsmallest(limit, distances)
+
+    def _nearest_from_grid(
+        self,
+        candidates: Optional[frozenset],
+        lat: float,
+        lng: float,
+        limit: int
+    ) -> List[Tuple[float, int]]:
+        """从所在网格向外逐圈查找，直到下一圈不可能有更近的医院"""
+        coords = self._coords
+        grid = self._grid
+        row, col = self._cell(lat, lng)
+        bounds = self._grid_bounds
+        min_row, max_row, min_col, max_col = bounds
+        # 位置在所有医院范围之外时，直接从最近的有效网格圈开始
+        first_ring = max(min_row - row, row - max_row, min_col - col, col - max_col, 0)
+        max_ring = max(row - min_row, max_row - row, col - min_col, max_col - col, 0)
+
+        # 一圈网格在经度方向上的最小宽度（公里），纬度越高越窄
+        ring_km = self.cell_size * KM_PER_DEGREE * max(math.cos(math.radians(min(abs(lat) + 1, 90))), 0.01)
+
+        heap: List[Tuple[float, int]] = []  # 大顶堆，保存当前最近的 limit 家
+        for ring in range(first_ring, max_ring + 1):
+            for cell in self._ring_cells(row, col, ring, bounds):
+                for i in grid.get(cell, ()):
+                    if candidates is not None and i not in candidates:
+                        continue
+                    distance = haversine_km(lat, lng, *coords[i])
+                    if len(heap) < limit:
+                        heapq.heappush(heap, (-distance, i))
+                    elif distance < -heap[0][0]:
+                        heapq.heapreplace(heap, (-distance, i))
+            # 下一圈中的点距离至少为 ring * ring_km
+            if len(heap) >= limit and ring * ring_km >= -heap[0][0]:
+                break
+
+        return sorted((-distance, i) for distance, i in heap)
+
+    @staticmethod
+    def _ring_cells(row: int, col: int, ring: int, bounds: Tuple[int, int, int, int]):
+        """以 (row, col) 为中心、距离为 ring 的一圈网格，只返回 bounds 范围内的网格"""
+        min_row, max_row, min_col, max_col = bounds
+        if ring == 0:
+            yield row, col
+            return
+        cols = range(max(col - ring, min_col), min(col + ring, max_col) + 1)
+        for r in (row - ring, row + ring):
+            if min_row <= r <= max_row:
+                for c in cols:
+                    yield r, c
+        rows = range(max(row - ring + 1, min_row), min(row + ring - 1, max_row) + 1)
+        for c in (col - ring, col + ring):
+            if min_col <= c <= max_col:
+                for r in rows:
+                    yield r, c
@@ -0,0 +1,361 @@
+"""
+医院HIS接口客户端
+所有Agent共享一个 aiohttp 会话，连接按主机复用；每次调用有总的截止时间，
+失败时带随机抖动重试，每家医院一个熔断器，相同的号源查询同时只向医院发送一次
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional, TYPE_CHECKING
+import asyncio
+import random
+import time
+from config import settings
+from loguru import logger
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+class HospitalAPIError(Exception):
+    """医院接口调用失败"""
+
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class CircuitOpenError(HospitalAPIError):
+    """医院接口熔断中，不发送请求"""
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败达到 failure_threshold 次后打开，reset_timeout 秒内直接拒绝请求；
+    之后进入半开状态，只放行一个试探请求，成功则关闭，失败则重新打开。
+    一次调用（包括其中的重试）只记录一次成功或失败
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """是否可以发送请求"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+            self._probing = False
+        # 半开状态只放行一个试探请求
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def release(self):
+        """结束试探但不改变状态（如请求被取消或医院返回4xx），下一个请求可以继续试探"""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        return {"state": self.state, "failures": self.failures}
+
+
+class HospitalAPIClient:
+    """医院HIS接口客户端"""
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str] = None,
+        timeout: float = 5.0,
+        connect_timeout: float = 2.0,
+        max_retries: int = 2,
+        retry_backoff: float = 0.2,
+        max_connections: int = 100,
+        max_connections_per_host: int = 20,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+
+        self.requests = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        """第一次调用时创建会话，连接池在所有请求间共享"""
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                ttl_dns_cache=300
+            )
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            self._session = aiohttp.ClientSession(connector=connector, headers=headers)
+        return self._session
+
+    def breaker(self, hospital_id: str) -> CircuitBreaker:
+        breaker = self._breakers.get(hospital_id)
+        if breaker is None:
+            breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            self._breakers[hospital_id] = breaker
+        return breaker
+
+    async def request(
+        self,
+        method: str,
+        hospital_id: str,
+        path: str,
+        params: Optional[Dict] = None,
+        json: Optional[Dict] = None,
+        headers: Optional[Dict] = None,
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        调用医院接口
+
+        Args:
+            method: HTTP方法
+            hospital_id: 医院ID，用于选择熔断器
+            path: 接口路径，如 /hospitals/h001/slots
+            params: 查询参数
+            json: 请求体
+            headers: 额外的请求头
+            timeout: 本次调用的总截止时间（秒，包含重试），默认 self.timeout
+
+        Returns:
+            响应JSON
+
+        Raises:
+            CircuitOpenError: 该医院接口熔断中
+            HospitalAPIError: 重试后仍然失败，或医院返回4xx
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        breaker = self.breaker(hospital_id)
+        if not breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError(f"医院接口暂不可用: {hospital_id}", retryable=False)
+
+        try:
+            data = await self._send(method, hospital_id, path, deadline, params, json, headers)
+        except HospitalAPIError as e:
+            if e.retryable:
+                # 重试后仍然失败，每次调用只计一次失败
+                breaker.record_failure()
+            else:
+                # 请求本身有问题（4xx），医院接口正常，不改变熔断状态
+                breaker.release()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+        return data
+
+    async def _send(
+        self,
+        method: str,
+        hospital_id: str,
+        path: str,
+        deadline: float,
+        params: Optional[Dict],
+        json: Optional[Dict],
+        headers: Optional[Dict]
+    ) -> Any:
+        """发送请求，超时、连接失败、5xx和429时在截止时间内重试"""
+        import aiohttp
+
+        url = f"{self.base_url}{path}"
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HospitalAPIError(f"医院接口超时: {method} {path}", retryable=True)
+
+            self.requests += 1
+            try:
+                async with self._get_session().request(
+                    method,
+                    url,
+                    params=params,
+                    json=json,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(
+                        total=remaining,
+                        connect=min(self.connect_timeout, remaining)
+                    )
+                ) as response:
+                    if response.status >= 500 or response.status == 429:
+                        raise HospitalAPIError(
+                            f"医院接口错误: {response.status}", status=response.status, retryable=True
+                        )
+                    if response.status >= 400:
+                        raise HospitalAPIError(
+                            f"医院接口拒绝请求: {response.status} {await response.text()}",
+                            status=response.status
+                        )
+                    return await response.json()
+            except HospitalAPIError as e:
+                if not e.retryable:
+                    raise
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = HospitalAPIError(
+                    f"医院接口连接失败: {type(e).__name__} {str(e)}", retryable=True
+                )
+
+            if attempt >= self.max_retries:
+                logger.warning(f"调用医院接口失败: {hospital_id} {method} {path} - {error}")
+                raise error
+
+            # 指数退避 + 全抖动，不超过剩余时间
+            delay = random.uniform(0, self.retry_backoff * (2 ** attempt))
+            if time.monotonic() + delay >= deadline:
+                raise error
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def coalesce(self, key: tuple, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        相同key的请求正在进行时等待它的结果，不重复发送
+
+        请求在客户端持有的任务中执行，某个调用方被取消时只停止它自己的等待，
+        不影响其他等待同一结果的调用方
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish_inflight(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish_inflight(self, key: tuple, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 调用方都已取消时避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    async def get_slots(self, hospital_id: str, department: str, date: str) -> Dict:
+        """查询号源，相同的查询同时只发送一次"""
+        return await self.coalesce(
+            ("slots", hospital_id, department, date),
+            lambda: self.request(
+                "GET",
+                hospital_id,
+                f"/hospitals/{hospital_id}/slots",
+                params={"department": department, "date": date}
+            )
+        )
+
+    async def book(self, hospital_id: str, payload: Dict, idempotency_key: str) -> Dict:
+        """预约挂号，重试时使用相同的幂等键，医院不会重复挂号"""
+        return await self.request(
+            "POST",
+            hospital_id,
+            f"/hospitals/{hospital_id}/appointments",
+            json=payload,
+            headers={"Idempotency-Key": idempotency_key}
+        )
+
+    async def cancel(self, hospital_id: str, appointment_number: str) -> Dict:
+        """取消预约"""
+        return await self.request(
+            "DELETE",
+            hospital_id,
+            f"/hospitals/{hospital_id}/appointments/{appointment_number}"
+        )
+
+    async def get_status(self, hospital_id: str, appointment_number: str) -> Dict:
+        """查询预约状态"""
+        return await self.request(
+            "GET",
+            hospital_id,
+            f"/hospitals/{hospital_id}/appointments/{appointment_number}"
+        )
+
+    def stats(self) -> Dict:
+        """调用统计和各医院熔断状态"""
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "breakers": {hospital_id: b.snapshot() for hospital_id, b in self._breakers.items()}
+        }
+
+    async def close(self):
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+_client: Optional[HospitalAPIClient] = None
+
+
+def get_hospital_client() -> Optional[HospitalAPIClient]:
+    """获取共享的医院接口客户端，未配置 HOSPITAL_API_BASE_URL 时返回None"""
+    global _client
+    if _client is None and settings.hospital_api_base_url:
+        _client = HospitalAPIClient(
+            settings.hospital_api_base_url,
+            api_key=settings.hospital_api_key,
+            timeout=settings.hospital_api_timeout,
+            connect_timeout=settings.hospital_api_connect_timeout,
+            max_retries=settings.hospital_api_max_retries,
+            retry_backoff=settings.hospital_api_retry_backoff,
+            max_connections=settings.hospital_api_max_connections,
+            max_connections_per_host=settings.hospital_api_max_connections_per_host,
+            failure_threshold=settings.hospital_breaker_failure_threshold,
+            reset_timeout=settings.hospital_breaker_reset_timeout
+        )
+    return _client
+
+
+async def close_hospital_client():
+    """关闭共享客户端，释放连接池"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
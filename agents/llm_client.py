@@ -0,0 +1,93 @@
+"""
+LLM客户端管理
+所有Agent共享同一个AsyncOpenAI客户端，复用底层HTTP连接池；
+同步接口使用的OpenAI客户端同样共享，第一次调用同步接口时才创建
+"""
+from typing import Optional, TYPE_CHECKING
+import threading
+from config import settings
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+
+_client: Optional["OpenAI"] = None
+_client_lock = threading.Lock()
+_async_client: Optional["AsyncOpenAI"] = None
+_backup_async_client: Optional["AsyncOpenAI"] = None
+
+
+def _create_async_client(base_url: Optional[str], api_key: str) -> "AsyncOpenAI":
+    import httpx
+    from openai import AsyncOpenAI
+
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.openai_max_connections,
+            max_keepalive_connections=settings.openai_max_keepalive_connections
+        ),
+        timeout=httpx.Timeout(settings.openai_timeout, connect=10.0)
+    )
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+
+def get_openai_client() -> "OpenAI":
+    """获取共享的同步OpenAI客户端，第一次调用时才创建（同步接口在线程池中调用，需要加锁）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                from openai import OpenAI
+
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=settings.openai_max_connections,
+                        max_keepalive_connections=settings.openai_max_keepalive_connections
+                    ),
+                    timeout=httpx.Timeout(settings.openai_timeout, connect=10.0)
+                )
+                _client = OpenAI(
+                    api_key=settings.openai_api_key,
+                    base_url=settings.openai_base_url,
+                    http_client=http_client
+                )
+    return _client
+
+
+def get_async_openai_client() -> "AsyncOpenAI":
+    """获取共享的异步OpenAI客户端，第一次调用时才导入OpenAI SDK"""
+    global _async_client
+    if _async_client is None:
+        _async_client = _create_async_client(settings.openai_base_url, settings.openai_api_key)
+    return _async_client
+
+
+def get_backup_async_openai_client() -> "AsyncOpenAI":
+    """
+    对冲请求使用的客户端
+
+    配置了 LLM_HEDGE_BASE_URL 时连接备用接口（使用独立的连接池），否则与主客户端相同
+    """
+    global _backup_async_client
+    if not settings.llm_hedge_base_url:
+        return get_async_openai_client()
+    if _backup_async_client is None:
+        _backup_async_client = _create_async_client(
+            settings.llm_hedge_base_url,
+            settings.llm_hedge_api_key or settings.openai_api_key
+        )
+    return _backup_async_client
+
+
+async def close_async_openai_client():
+    """关闭共享客户端（包括同步客户端），释放连接池"""
+    global _client, _async_client, _backup_async_client
+    for client in (_async_client, _backup_async_client):
+        if client is not None:
+            await client.close()
+    if _client is not None:
+        _client.close()
+    _client = None
+    _async_client = None
+    _backup_async_client = None
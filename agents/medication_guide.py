@@ -2,19 +2,67 @@
 用药指导Agent
 提供取药指导和用药提醒
 """
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
-from openai import OpenAI
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+from datetime import date, datetime, time, timedelta
+import asyncio
+import base64
+import heapq
+import json
+import random
+import re
 from config import settings
+from schemas import Medication
 from loguru import logger
+from metrics import track_llm_call
+from .llm_client import get_openai_client, get_async_openai_client
+from .prompt_builder import create_prompt_builder, report_llm_call
+from .drug_interactions import DrugInteractionIndex
+
+
+PRESCRIPTION_SYSTEM_PROMPT = """你是一个专业的药师助手，帮助解析和解释处方信息。
+
+请解析用户给出的处方信息，提取药品名称、用法用量，以JSON格式返回，包含以下字段：
+- medications: 药品列表，每个药品包含：
+  - name: 药品名称
+  - dosage: 剂量
+  - frequency: 服用频率（如：每日3次）
+  - timing: 服用时间（如：饭后）
+  - duration: 疗程（如：7天）
+  - notes: 注意事项"""
+
+INSTRUCTION_SYSTEM_PROMPT = (
+    "你是一个耐心的药师，用简单的话讲解用药知识，避免使用专业术语。"
+    "请用简单易懂的语言，为老年人讲解用户给出的药品的用法用量和注意事项。"
+)
+
+# 提醒时间点
+REMINDER_TIMES = {
+    "morning": "08:00",
+    "noon": "12:00",
+    "evening": "18:00",
+    "bedtime": "21:00"
+}
 
 
 class MedicationGuide:
     """用药指导助手"""
     
     def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        self.async_client = get_async_openai_client()
         self.model = settings.openai_model
+        self.prescription_prompt = create_prompt_builder(PRESCRIPTION_SYSTEM_PROMPT)
+        self.instruction_prompt = create_prompt_builder(INSTRUCTION_SYSTEM_PROMPT)
+        
+        # 药物相互作用索引，启动时加载一次
+        self.interaction_index = DrugInteractionIndex(
+            settings.drug_interaction_data_path,
+            reload_interval=settings.drug_interaction_reload_interval
+        )
+    
+    @property
+    def client(self):
+        """parse_prescription 等同步方法使用的OpenAI客户端（共享，用到时才创建）"""
+        return get_openai_client()
     
     def parse_prescription(
         self,
@@ -33,45 +81,57 @@ class MedicationGuide:
         """
         try:
             # 使用AI解析处方
-            prompt = f"""
-请解析以下处方信息，提取药品名称、用法用量：
-
-{prescription_text}
-
-请以JSON格式返回，包含以下字段：
-- medications: 药品列表，每个药品包含：
-  - name: 药品名称
-  - dosage: 剂量
-  - frequency: 服用频率（如：每日3次）
-  - timing: 服用时间（如：饭后）
-  - duration: 疗程（如：7天）
-  - notes: 注意事项
-"""
+            request = self._prepare_prescription_request(prescription_text)
+            with track_llm_call("MedicationGuide", "parse_prescription", request["model"]) as timer:
+                response = self.client.chat.completions.create(
+                    model=request["model"],
+                    messages=request["messages"],
+                    temperature=0.2
+                )
+            llm_info = report_llm_call("MedicationGuide", request, response.usage, timer.elapsed)
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的药师助手，帮助解析和解释处方信息。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.2
+            result = self._build_prescription_result(
+                prescription_text, response.choices[0].message.content
             )
+            result["llm"] = llm_info
+            return result
             
-            # 解析响应（实际应该解析JSON）
-            result = {
-                "success": True,
-                "raw_text": prescription_text,
-                "ai_response": response.choices[0].message.content,
-                "parsed_at": datetime.now().isoformat()
+        except Exception as e:
+            logger.error(f"处方解析失败: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
             }
+    
+    async def parse_prescription_async(
+        self,
+        prescription_text: str,
+        prescription_image: Optional[str] = None
+    ) -> Dict:
+        """
+        解析处方信息（异步版本，不阻塞事件循环）
+        
+        Args:
+            prescription_text: 处方文本
+            prescription_image: 处方图片（可选）
+        
+        Returns:
+            解析后的处方信息
+        """
+        try:
+            request = self._prepare_prescription_request(prescription_text)
+            with track_llm_call("MedicationGuide", "parse_prescription", request["model"]) as timer:
+                response = await self.async_client.chat.completions.create(
+                    model=request["model"],
+                    messages=request["messages"],
+                    temperature=0.2
+                )
+            llm_info = report_llm_call("MedicationGuide", request, response.usage, timer.elapsed)
             
-            logger.info("处方解析完成")
+            result = self._build_prescription_result(
+                prescription_text, response.choices[0].message.content
+            )
+            result["llm"] = llm_info
             return result
             
         except Exception as e:
@@ -81,6 +141,79 @@ class MedicationGuide:
                 "error": str(e)
             }
     
+    async def parse_prescriptions_batch(
+        self,
+        prescriptions: List[str],
+        concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        批量解析处方，限制并发数，按完成顺序逐条返回
+        
+        Args:
+            prescriptions: 处方文本列表
+            concurrency: 同时进行的AI调用数
+            max_retries: 单条处方的最大重试次数
+        
+        Yields:
+            单条处方的解析结果，带有 index（在输入中的位置）和 attempts（尝试次数）
+        """
+        semaphore = asyncio.Semaphore(concurrency or settings.prescription_batch_concurrency)
+        if max_retries is None:
+            max_retries = settings.prescription_batch_max_retries
+        
+        async def run(index: int, text: str) -> Dict:
+            async with semaphore:
+                result = await self._parse_prescription_with_retry(text, max_retries)
+            result["index"] = index
+            return result
+        
+        tasks = [asyncio.create_task(run(i, text)) for i, text in enumerate(prescriptions)]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            # 调用方提前停止读取时取消剩余任务
+            for task in tasks:
+                task.cancel()
+        
+        logger.info("批量处方解析完成: {}条", len(prescriptions))
+    
+    async def _parse_prescription_with_retry(self, prescription_text: str, max_retries: int) -> Dict:
+        """解析单条处方，AI调用失败或JSON不合法时指数退避重试"""
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                request = self._prepare_prescription_request(prescription_text)
+                with track_llm_call("MedicationGuide", "parse_prescription", request["model"]) as timer:
+                    response = await self.async_client.chat.completions.create(
+                        model=request["model"],
+                        messages=request["messages"],
+                        temperature=0.2
+                    )
+                llm_info = report_llm_call("MedicationGuide", request, response.usage, timer.elapsed)
+                ai_response = response.choices[0].message.content
+                medications = self._extract_medications(ai_response)
+                
+                result = self._build_prescription_result(prescription_text, ai_response, medications)
+                result["attempts"] = attempts
+                result["llm"] = llm_info
+                return result
+                
+            except Exception as e:
+                if attempts > max_retries:
+                    logger.error(f"处方解析失败（已尝试{attempts}次）: {str(e)}")
+                    return {
+                        "success": False,
+                        "raw_text": prescription_text,
+                        "error": str(e),
+                        "attempts": attempts
+                    }
+                
+                delay = settings.prescription_retry_backoff * (2 ** (attempts - 1))
+                await asyncio.sleep(delay + random.uniform(0, delay))
+    
     def get_medication_instructions(
         self,
         medication_name: str,
@@ -97,39 +230,57 @@ class MedicationGuide:
             用药说明
         """
         try:
-            prompt = f"请用简单易懂的语言，为老年人讲解{medication_name}的用法用量和注意事项。"
-            
-            if patient_info:
-                if patient_info.get("allergies"):
-                    prompt += f"\n患者过敏史：{patient_info['allergies']}"
-                if patient_info.get("chronic_diseases"):
-                    prompt += f"\n患者病史：{patient_info['chronic_diseases']}"
+            request = self._prepare_instruction_request(medication_name, patient_info)
+            with track_llm_call("MedicationGuide", "get_medication_instructions", request["model"]) as timer:
+                response = self.client.chat.completions.create(
+                    model=request["model"],
+                    messages=request["messages"],
+                    temperature=0.3
+                )
+            llm_info = report_llm_call("MedicationGuide", request, response.usage, timer.elapsed)
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个耐心的药师，用简单的话讲解用药知识，避免使用专业术语。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.3
+            result = self._build_instruction_result(
+                medication_name, response.choices[0].message.content
             )
+            result["llm"] = llm_info
+            return result
             
-            instructions = response.choices[0].message.content
-            
-            result = {
-                "success": True,
-                "medication_name": medication_name,
-                "instructions": instructions,
-                "voice_guide": self._generate_voice_instructions(medication_name, instructions)
+        except Exception as e:
+            logger.error(f"获取用药说明失败: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
             }
+    
+    async def get_medication_instructions_async(
+        self,
+        medication_name: str,
+        patient_info: Optional[Dict] = None
+    ) -> Dict:
+        """
+        获取药品使用说明（异步版本，不阻塞事件循环）
+        
+        Args:
+            medication_name: 药品名称
+            patient_info: 患者信息
+        
+        Returns:
+            用药说明
+        """
+        try:
+            request = self._prepare_instruction_request(medication_name, patient_info)
+            with track_llm_call("MedicationGuide", "get_medication_instructions", request["model"]) as timer:
+                response = await self.async_client.chat.completions.create(
+                    model=request["model"],
+                    messages=request["messages"],
+                    temperature=0.3
+                )
+            llm_info = report_llm_call("MedicationGuide", request, response.usage, timer.elapsed)
             
-            logger.info(f"生成用药说明: {medication_name}")
+            result = self._build_instruction_result(
+                medication_name, response.choices[0].message.content
+            )
+            result["llm"] = llm_info
             return result
             
         except Exception as e:
@@ -139,6 +290,58 @@ class MedicationGuide:
                 "error": str(e)
             }
     
+    async def get_medication_instructions_stream(
+        self,
+        medication_name: str,
+        patient_info: Optional[Dict] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        流式获取药品使用说明
+        
+        Args:
+            medication_name: 药品名称
+            patient_info: 患者信息
+        
+        Yields:
+            事件 {"event": 类型, "data": 数据}，类型包括：
+            token（AI输出片段）、error（调用失败）、result（与 get_medication_instructions 相同的完整结果）
+        """
+        try:
+            request = self._prepare_instruction_request(medication_name, patient_info)
+            with track_llm_call("MedicationGuide", "get_medication_instructions_stream", request["model"]) as timer:
+                stream = await self.async_client.chat.completions.create(
+                    model=request["model"],
+                    messages=request["messages"],
+                    temperature=0.3,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+            
+                chunks = []
+                usage = None
+                async for chunk in stream:
+                    # 最后一个数据块只有 usage，没有 choices
+                    usage = getattr(chunk, "usage", None) or usage
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    chunks.append(delta)
+                    yield {"event": "token", "data": delta}
+            
+            result = self._build_instruction_result(medication_name, "".join(chunks))
+            result["llm"] = report_llm_call("MedicationGuide", request, usage, timer.elapsed)
+            yield {"event": "result", "data": result}
+            
+        except Exception as e:
+            logger.error(f"获取用药说明失败: {str(e)}")
+            yield {
+                "event": "error",
+                "data": {
+                    "success": False,
+                    "error": str(e)
+                }
+            }
+    
     def create_medication_schedule(
         self,
         medications: List[Dict]
@@ -181,7 +384,7 @@ class MedicationGuide:
             elif "必要时" in frequency or "prn" in frequency:
                 schedule["as_needed"].append(med)
         
-        logger.info(f"创建用药时间表: {len(medications)}种药品")
+        logger.info("创建用药时间表: {}种药品", len(medications))
         
         return {
             "success": True,
@@ -195,56 +398,236 @@ class MedicationGuide:
         start_date: Optional[str] = None
     ) -> List[Dict]:
         """
-        生成用药提醒
+        生成用药提醒（完整列表，疗程较长时请使用 get_reminder_page 分页获取）
+        
+        Args:
+            medications: 药品列表
+            start_date: 开始日期
+        
+        Returns:
+            按时间排序的提醒列表
+        """
+        rules = self.build_reminder_rules(medications, start_date)
+        reminders = list(self.iter_reminders(rules))
+        
+        logger.info("生成{}条用药提醒", len(reminders))
+        
+        return reminders
+    
+    def build_reminder_rules(
+        self,
+        medications: List[Dict],
+        start_date: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        把药品列表转换为紧凑的提醒规则，每种药品一条
         
         Args:
             medications: 药品列表
             start_date: 开始日期
         
         Returns:
-            提醒列表
+            提醒规则列表，包含药品、每日提醒时间、开始日期和天数
         """
-        reminders = []
         start = datetime.now() if not start_date else datetime.fromisoformat(start_date)
         
-        # 定义提醒时间点
-        reminder_times = {
-            "morning": "08:00",
-            "noon": "12:00",
-            "evening": "18:00",
-            "bedtime": "21:00"
+        rules = []
+        for med in medications:
+            times = self._get_reminder_times(med.get("frequency", ""))
+            if not times:
+                continue
+            rules.append({
+                "medication": med.get("name"),
+                "dosage": med.get("dosage"),
+                "timing": med.get("timing"),
+                "times": times,
+                "start_date": start.strftime("%Y-%m-%d"),
+                "days": self._parse_duration(med.get("duration", "7天"))
+            })
+        
+        return rules
+    
+    def iter_reminders(
+        self,
+        rules: List[Dict],
+        window_start: Optional[datetime] = None,
+        window_end: Optional[datetime] = None
+    ) -> Iterator[Dict]:
+        """
+        按时间顺序逐条生成提醒，不一次性展开整个疗程
+        
+        Args:
+            rules: build_reminder_rules 生成的提醒规则
+            window_start: 起始时间（包含）
+            window_end: 结束时间（不包含）
+        """
+        for when, _, rule in self._iter_reminder_events(rules, window_start, window_end):
+            yield self._format_reminder(when, rule)
+    
+    def get_reminder_page(
+        self,
+        rules: List[Dict],
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100
+    ) -> Dict:
+        """
+        分页获取时间窗口内的提醒
+        
+        Args:
+            rules: 提醒规则
+            from_date: 窗口开始（日期或时间，包含）
+            to_date: 窗口结束（日期表示包含当天，时间表示不包含该时刻）
+            cursor: 上一页返回的 next_cursor
+            limit: 每页条数
+        
+        Returns:
+            当前页提醒、窗口内总数和下一页游标
+        
+        Raises:
+            ValueError: 日期或游标格式错误
+        """
+        window_start = self._parse_window_bound(from_date)
+        window_end = self._parse_window_bound(to_date, is_end=True)
+        total = sum(self._count_rule_reminders(rule, window_start, window_end) for rule in rules)
+        
+        after = None
+        scan_start = window_start
+        if cursor:
+            after = self._decode_reminder_cursor(cursor)
+            scan_start = max(window_start, after[0]) if window_start else after[0]
+        
+        page = []
+        next_cursor = None
+        for when, index, rule in self._iter_reminder_events(rules, scan_start, window_end):
+            if after and (when, index) <= after:
+                continue
+            if len(page) == limit:
+                last_when, last_index, _ = page[-1]
+                next_cursor = self._encode_reminder_cursor(last_when, last_index)
+                break
+            page.append((when, index, rule))
+        
+        return {
+            "total": total,
+            "count": len(page),
+            "reminders": [self._format_reminder(when, rule) for when, _, rule in page],
+            "next_cursor": next_cursor
         }
+    
+    def _get_reminder_times(self, frequency: str) -> List[str]:
+        """根据服用频率确定每日提醒时间点"""
+        frequency = frequency.lower()
+        if "每日3次" in frequency:
+            slots = ["morning", "noon", "evening"]
+        elif "每日2次" in frequency:
+            slots = ["morning", "evening"]
+        elif "每日1次" in frequency:
+            slots = ["morning"]
+        else:
+            slots = []
+        return [REMINDER_TIMES[slot] for slot in slots]
+    
+    def _iter_rule_events(
+        self,
+        index: int,
+        rule: Dict,
+        window_start: Optional[datetime],
+        window_end: Optional[datetime]
+    ) -> Iterator[tuple]:
+        """逐条生成单条规则在窗口内的提醒时间"""
+        first_day, last_day = self._rule_day_range(rule, window_start, window_end)
+        times = [time.fromisoformat(t) for t in rule["times"]]
         
-        # 为每种药品生成提醒
-        for med in medications:
-            duration_days = self._parse_duration(med.get("duration", "7天"))
-            frequency = med.get("frequency", "").lower()
-            
-            # 确定需要提醒的时间点
-            times = []
-            if "每日3次" in frequency:
-                times = ["morning", "noon", "evening"]
-            elif "每日2次" in frequency:
-                times = ["morning", "evening"]
-            elif "每日1次" in frequency:
-                times = ["morning"]
-            
-            # 生成具体提醒
-            for day in range(duration_days):
-                date = start + timedelta(days=day)
-                for time_slot in times:
-                    reminders.append({
-                        "date": date.strftime("%Y-%m-%d"),
-                        "time": reminder_times[time_slot],
-                        "medication": med.get("name"),
-                        "dosage": med.get("dosage"),
-                        "timing": med.get("timing"),
-                        "message": f"该吃药了：{med.get('name')} {med.get('dosage')}"
-                    })
-        
-        logger.info(f"生成{len(reminders)}条用药提醒")
+        day = first_day
+        while day <= last_day:
+            for t in times:
+                when = datetime.combine(day, t)
+                if window_start and when < window_start:
+                    continue
+                if window_end and when >= window_end:
+                    return
+                yield when, index, rule
+            day += timedelta(days=1)
+    
+    def _iter_reminder_events(
+        self,
+        rules: List[Dict],
+        window_start: Optional[datetime],
+        window_end: Optional[datetime]
+    ) -> Iterator[tuple]:
+        """合并所有规则的提醒，按 (时间, 规则序号) 排序"""
+        streams = [
+            self._iter_rule_events(index, rule, window_start, window_end)
+            for index, rule in enumerate(rules)
+        ]
+        return heapq.merge(*streams, key=lambda event: (event[0], event[1]))
+    
+    def _rule_day_range(
+        self,
+        rule: Dict,
+        window_start: Optional[datetime],
+        window_end: Optional[datetime]
+    ) -> tuple:
+        """规则在窗口内的首末日期"""
+        first_day = date.fromisoformat(rule["start_date"])
+        last_day = first_day + timedelta(days=rule["days"] - 1)
+        if window_start:
+            first_day = max(first_day, window_start.date())
+        if window_end:
+            last_day = min(last_day, window_end.date())
+        return first_day, last_day
+    
+    def _count_rule_reminders(
+        self,
+        rule: Dict,
+        window_start: Optional[datetime],
+        window_end: Optional[datetime]
+    ) -> int:
+        """计算规则在窗口内的提醒数量，只检查首末两天，不逐条生成"""
+        first_day, last_day = self._rule_day_range(rule, window_start, window_end)
+        days = (last_day - first_day).days + 1
+        if days <= 2:
+            return sum(1 for _ in self._iter_rule_events(0, rule, window_start, window_end))
         
-        return reminders
+        times = [time.fromisoformat(t) for t in rule["times"]]
+        first = sum(1 for t in times if not window_start or datetime.combine(first_day, t) >= window_start)
+        last = sum(1 for t in times if not window_end or datetime.combine(last_day, t) < window_end)
+        return first + last + (days - 2) * len(times)
+    
+    def _format_reminder(self, when: datetime, rule: Dict) -> Dict:
+        """生成单条提醒"""
+        return {
+            "date": when.strftime("%Y-%m-%d"),
+            "time": when.strftime("%H:%M"),
+            "medication": rule["medication"],
+            "dosage": rule["dosage"],
+            "timing": rule["timing"],
+            "message": f"该吃药了：{rule['medication']} {rule['dosage']}"
+        }
+    
+    def _parse_window_bound(self, value: Optional[str], is_end: bool = False) -> Optional[datetime]:
+        """解析窗口边界，结束边界只给日期时包含当天"""
+        if not value:
+            return None
+        bound = datetime.fromisoformat(value)
+        if is_end and len(value) == 10:
+            bound += timedelta(days=1)
+        return bound
+    
+    def _encode_reminder_cursor(self, when: datetime, index: int) -> str:
+        """把最后一条提醒的位置编码为游标"""
+        raw = f"{when.isoformat()}|{index}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+    
+    def _decode_reminder_cursor(self, cursor: str) -> tuple:
+        """解析游标，格式错误时抛出ValueError"""
+        try:
+            when, index = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(when), int(index)
+        except Exception as e:
+            raise ValueError("无效的分页游标") from e
     
     def get_pharmacy_guidance(
         self,
@@ -300,30 +683,148 @@ class MedicationGuide:
     
     def check_drug_interactions(
         self,
-        medications: List[str]
+        medications: List[str],
+        allergies: Optional[str] = None
     ) -> Dict:
         """
         检查药物相互作用
         
         Args:
             medications: 药品名称列表
+            allergies: 患者过敏史（可选），用于检查药品与过敏史的冲突
         
         Returns:
             相互作用检查结果
         """
-        # 这应该对接专业的药物数据库
-        # 这里返回简化的结果
+        result = self.interaction_index.check(medications, allergies)
+        warnings = result["warnings"]
+        
+        if any(w["severity"] in ("contraindicated", "major") for w in warnings):
+            advice = "发现严重的用药风险，请在服药前咨询医生或药师"
+        elif warnings:
+            advice = "存在需要注意的用药问题，请按提示服用，如有不适请及时就医"
+        else:
+            advice = "建议按医嘱服药，如有不适请及时就医"
+        if result["unknown_medications"]:
+            advice += f"。以下药品不在药品库中，请向药师确认：{'、'.join(result['unknown_medications'])}"
+        
         return {
             "success": True,
             "checked_medications": medications,
-            "has_interactions": False,
-            "warnings": [],
-            "advice": "建议按医嘱服药，如有不适请及时就医"
+            "has_interactions": bool(warnings),
+            "warnings": warnings,
+            "unknown_medications": result["unknown_medications"],
+            "advice": advice
+        }
+    
+    def _prepare_prescription_request(self, prescription_text: str) -> Dict:
+        """
+        构建处方解析的对话消息并选择模型，处方文本较短时使用快速模型
+        
+        Returns:
+            {"messages", "model", "prompt_tokens", "tokens_saved"}
+        """
+        builder = self.prescription_prompt
+        messages, prompt_tokens = builder.build(f"处方信息：\n{prescription_text}")
+        return {
+            "messages": messages,
+            "model": builder.select_model(builder.counter.count(prescription_text)),
+            "prompt_tokens": prompt_tokens,
+            "tokens_saved": 0
         }
     
+    def _build_prescription_result(
+        self,
+        prescription_text: str,
+        ai_response: str,
+        medications: Optional[List[Dict]] = None
+    ) -> Dict:
+        """组装处方解析结果"""
+        result = {
+            "success": True,
+            "raw_text": prescription_text,
+            "ai_response": ai_response,
+            "parsed_at": datetime.now().isoformat()
+        }
+        
+        if medications is None:
+            try:
+                medications = self._extract_medications(ai_response)
+            except ValueError as e:
+                logger.warning(f"处方JSON解析失败: {str(e)}")
+                result["parse_error"] = str(e)
+                medications = []
+        result["medications"] = medications
+        
+        logger.info("处方解析完成")
+        return result
+    
+    def _extract_medications(self, ai_response: str) -> List[Dict]:
+        """
+        从AI响应中提取药品列表并按Medication模型校验
+        
+        Raises:
+            ValueError: 响应中没有合法的JSON或字段不符合要求
+        """
+        match = re.search(r"\{.*\}|\[.*\]", ai_response or "", re.S)
+        if not match:
+            raise ValueError("AI响应中没有JSON内容")
+        
+        data = json.loads(match.group(0))
+        items = data.get("medications") if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            raise ValueError("JSON中缺少medications列表")
+        
+        return [Medication.model_validate(item).model_dump() for item in items]
+    
+    def _prepare_instruction_request(
+        self,
+        medication_name: str,
+        patient_info: Optional[Dict] = None
+    ) -> Dict:
+        """
+        构建用药说明的对话消息并选择模型
+        
+        过敏史、病史按token预算压缩；有过敏史或病史时需要结合病情讲解，使用默认模型
+        
+        Returns:
+            {"messages", "model", "prompt_tokens", "tokens_saved"}
+        """
+        builder = self.instruction_prompt
+        prompt = f"药品：{medication_name}"
+        tokens_saved = 0
+        complex_request = False
+        
+        if patient_info:
+            for field, label in (("allergies", "患者过敏史"), ("chronic_diseases", "患者病史")):
+                value, saved = builder.compact(patient_info.get(field))
+                if value:
+                    prompt += f"\n{label}：{value}"
+                    tokens_saved += saved
+                    complex_request = True
+        
+        messages, prompt_tokens = builder.build(prompt)
+        return {
+            "messages": messages,
+            "model": builder.select_model(builder.counter.count(medication_name), complex_request),
+            "prompt_tokens": prompt_tokens,
+            "tokens_saved": tokens_saved
+        }
+    
+    def _build_instruction_result(self, medication_name: str, instructions: str) -> Dict:
+        """组装用药说明结果"""
+        result = {
+            "success": True,
+            "medication_name": medication_name,
+            "instructions": instructions,
+            "voice_guide": self._generate_voice_instructions(medication_name, instructions)
+        }
+        
+        logger.info("生成用药说明: {}", medication_name)
+        return result
+    
     def _parse_duration(self, duration_str: str) -> int:
         """解析疗程天数"""
-        import re
         match = re.search(r'(\d+)', duration_str)
         if match:
             return int(match.group(1))
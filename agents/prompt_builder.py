@@ -0,0 +1,247 @@
+"""
+提示词构建
+静态的系统提示词（角色、科室列表、输出格式）只生成和计数一次；患者病史、过敏史等自由文本
+按token预算压缩后再拼入提示词；token数在本地计算，不需要调用接口。
+同时根据请求的复杂程度选择模型：简单请求使用更便宜、更快的模型
+"""
+from typing import Dict, List, Optional, Tuple
+import functools
+import math
+import re
+from config import settings
+from loguru import logger
+from metrics import llm_prompt_tokens_saved_total, record_llm_usage
+
+
+# 本地估算token数：中日韩文字按每字1个，英文单词约4个字母1个，数字约3位1个，其他符号各1个
+_TOKEN_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]|[A-Za-z]+|\d+|[^\sA-Za-z\d\u3400-\u9fff\uf900-\ufaff]")
+# 每条消息的格式开销（role、分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+# 病史、过敏史的分隔符
+_ITEM_SEPARATORS = re.compile(r"[，,、；;。\n]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """不依赖分词器的token数估算，中文文本与 cl100k_base 的误差一般在20%以内"""
+    total = 0
+    for piece in _TOKEN_PATTERN.findall(text or ""):
+        if piece[0].isascii() and piece[0].isalpha():
+            total += math.ceil(len(piece) / 4)
+        elif piece[0].isdigit():
+            total += math.ceil(len(piece) / 3)
+        else:
+            total += 1
+    return total
+
+
+@functools.lru_cache(maxsize=None)
+def _load_encoding(model: str):
+    """加载模型对应的tiktoken编码，同一模型只尝试一次，失败时返回None"""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"加载tiktoken编码失败，使用估算的token数: {type(e).__name__}")
+        return None
+
+
+class TokenCounter:
+    """
+    本地token计数
+
+    LLM_TOKENIZER=auto 时优先使用 tiktoken（需要本地已有编码文件，离线环境可设置
+    TIKTOKEN_CACHE_DIR），加载失败时使用估算；estimate 时只使用估算
+    """
+
+    def __init__(self, model: Optional[str] = None, tokenizer: str = "auto"):
+        self.model = model
+        self.tokenizer = tokenizer
+
+    def _get_encoding(self):
+        if self.tokenizer != "auto":
+            return None
+        return _load_encoding(self.model or "")
+
+    @property
+    def exact(self) -> bool:
+        """是否使用分词器精确计数"""
+        return self._get_encoding() is not None
+
+    def count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return estimate_tokens(text)
+        return len(encoding.encode(text or "", disallowed_special=()))
+
+    def count_messages(self, messages: List[Dict]) -> int:
+        """对话消息的提示词token数"""
+        return sum(
+            self.count(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages
+        ) + REPLY_PRIMING_TOKENS
+
+    def truncate(self, text: str, budget: int) -> str:
+        """截断到不超过 budget 个token"""
+        if self.count(text) <= budget:
+            return text
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return encoding.decode(encoding.encode(text, disallowed_special=())[:budget])
+        # 估算时按字符二分查找
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if estimate_tokens(text[:mid]) <= budget:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+
+class PromptBuilder:
+    """
+    提示词构建器
+
+    Args:
+        system_prompt: 静态系统提示词，构建时生成一次
+        model: 默认模型，用于选择分词器
+        fast_model: 简单请求使用的模型，为空时不切换
+        field_budget: 每个患者信息字段（病史、过敏史）的token预算
+        simple_max_tokens: 不超过该token数的请求视为简单请求
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        model: Optional[str] = None,
+        fast_model: Optional[str] = None,
+        field_budget: int = 60,
+        simple_max_tokens: int = 80,
+        tokenizer: str = "auto"
+    ):
+        self.model = model or settings.openai_model
+        self.fast_model = fast_model
+        self.field_budget = field_budget
+        self.simple_max_tokens = simple_max_tokens
+        self.counter = TokenCounter(self.model, tokenizer)
+
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.system_tokens = self.counter.count(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+
+    def compact(self, text: Optional[str], budget: Optional[int] = None) -> Tuple[str, int]:
+        """
+        把病史、过敏史等自由文本压缩到token预算内
+
+        按分隔符拆成条目，去掉重复条目后按原顺序保留，超出预算的条目省略为"等N项"；
+        单个条目就超出预算时截断
+
+        Returns:
+            (压缩后的文本, 节省的token数)
+        """
+        text = (text or "").strip()
+        if not text:
+            return "", 0
+        budget = budget or self.field_budget
+        original = self.counter.count(text)
+        if original <= budget:
+            return text, 0
+
+        items = []
+        seen = set()
+        for item in _ITEM_SEPARATORS.split(text):
+            item = item.strip()
+            if item and item not in seen:
+                seen.add(item)
+                items.append(item)
+
+        kept = []
+        used = 0
+        for item in items:
+            cost = self.counter.count(item) + 1  # 分隔符
+            if used + cost > budget - 4:  # 给"等N项"留出空间
+                break
+            kept.append(item)
+            used += cost
+
+        if kept:
+            compacted = "、".join(kept)
+            if len(kept) < len(items):
+                compacted += f"等{len(items)}项"
+        else:
+            compacted = self.counter.truncate(items[0] if items else text, budget - 1) + "…"
+        return compacted, max(original - self.counter.count(compacted), 0)
+
+    def build(self, user_content: str) -> Tuple[List[Dict], int]:
+        """
+        组装对话消息
+
+        Returns:
+            (消息列表, 提示词token数)
+        """
+        tokens = (
+            self.system_tokens
+            + self.counter.count(user_content)
+            + MESSAGE_OVERHEAD_TOKENS
+            + REPLY_PRIMING_TOKENS
+        )
+        return [self.system_message, {"role": "user", "content": user_content}], tokens
+
+    def select_model(self, request_tokens: int, complex_request: bool = False) -> str:
+        """
+        选择模型
+
+        Args:
+            request_tokens: 请求中可变部分（症状、处方文本等）的token数
+            complex_request: 调用方判断为复杂的请求（如有慢性病史），始终使用默认模型
+        """
+        if self.fast_model and not complex_request and request_tokens <= self.simple_max_tokens:
+            return self.fast_model
+        return self.model
+
+
+def create_prompt_builder(system_prompt: str) -> PromptBuilder:
+    """按配置创建提示词构建器"""
+    return PromptBuilder(
+        system_prompt,
+        model=settings.openai_model,
+        fast_model=settings.openai_fast_model,
+        field_budget=settings.llm_patient_field_token_budget,
+        simple_max_tokens=settings.llm_simple_max_tokens,
+        tokenizer=settings.llm_tokenizer
+    )
+
+
+def report_llm_call(agent: str, request: Dict, usage, elapsed: float) -> Dict:
+    """
+    记录一次LLM调用的token用量、压缩节省的token数和耗时
+
+    Args:
+        agent: Agent名称
+        request: 调用参数，包含 model、prompt_tokens（本地计数）、tokens_saved
+        usage: 响应中的 usage 字段，可能为空
+        elapsed: 调用耗时（秒）
+
+    Returns:
+        {"model", "prompt_tokens", "completion_tokens", "tokens_saved", "latency_ms"}
+    """
+    record_llm_usage(agent, request["model"], usage)
+    if request["tokens_saved"]:
+        llm_prompt_tokens_saved_total.inc(request["tokens_saved"], agent=agent)
+
+    info = {
+        "model": request["model"],
+        "prompt_tokens": getattr(usage, "prompt_tokens", None) or request["prompt_tokens"],
+        "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+        "tokens_saved": request["tokens_saved"],
+        "latency_ms": round(elapsed * 1000)
+    }
+    logger.info(
+        "{} LLM调用: 模型={}, 提示词{}tokens（压缩节省{}）, 输出{}tokens, 耗时{}ms",
+        agent, info["model"], info["prompt_tokens"], info["tokens_saved"],
+        info["completion_tokens"], info["latency_ms"]
+    )
+    return info
@@ -0,0 +1,219 @@
+"""
+响应缓存
+为症状分析等AI调用提供两级缓存：进程内LRU/TTL缓存 + 可选的共享缓存（Redis或SQLite）
+"""
+from typing import Dict, Optional
+from collections import OrderedDict
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+# 症状、病史等文本的分隔符
+_SEPARATORS = re.compile(r"[,，、;；。\s/]+")
+# 末尾无意义的语气词和标点
+_TRAILING = re.compile(r"[!！?？~～了啊呀吧呢]+$")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """
+    归一化文本：全角转半角、去空白、统一分隔符并排序去重
+
+    "咳嗽，发烧" 与 "发烧 咳嗽" 会得到相同结果
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).lower()
+    parts = []
+    for part in _SEPARATORS.split(text):
+        part = _TRAILING.sub("", part)
+        if part:
+            parts.append(part)
+    return ",".join(sorted(set(parts)))
+
+
+def age_band(age: Optional[int]) -> str:
+    """年龄分段（每10岁一段），避免相近年龄各自缓存"""
+    if not age:
+        return ""
+    return f"{int(age) // 10 * 10}s"
+
+
+def symptom_cache_key(symptoms: str, patient_info: Optional[Dict] = None) -> str:
+    """根据症状和影响提示词的患者信息生成缓存键"""
+    patient_info = patient_info or {}
+    payload = [
+        normalize_text(symptoms),
+        age_band(patient_info.get("age")),
+        normalize_text(patient_info.get("gender")),
+        normalize_text(patient_info.get("chronic_diseases")),
+        normalize_text(patient_info.get("allergies"))
+    ]
+    raw = json.dumps(payload, ensure_ascii=False)
+    return "symptom:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SQLiteCacheBackend:
+    """基于SQLite文件的共享缓存，可作为本地Redis的替代"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+            self._conn.commit()
+
+
+class RedisCacheBackend:
+    """基于Redis的共享缓存（需要安装redis包）"""
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("使用Redis缓存需要先安装redis: pip install redis") from e
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._client.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, ttl: int):
+        self._client.set(key, value, ex=ttl)
+
+    def delete(self, key: str):
+        self._client.delete(key)
+
+    def clear(self):
+        for key in self._client.scan_iter("symptom:*"):
+            self._client.delete(key)
+
+
+def create_cache_backend(url: Optional[str]):
+    """
+    根据URL创建共享缓存后端
+
+    Args:
+        url: redis://... 或 sqlite:///path/to/cache.db，为空时不启用共享缓存
+    """
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://")):
+        return RedisCacheBackend(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteCacheBackend(url[len("sqlite:///"):])
+    raise ValueError(f"不支持的缓存地址: {url}")
+
+
+class ResponseCache:
+    """两级响应缓存：进程内LRU/TTL + 可选共享缓存"""
+
+    def __init__(self, max_size: int = 1024, ttl: int = 3600, backend=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        """读取缓存，未命中返回None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(entry[1])
+                del self._entries[key]
+
+        if self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self._put_local(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.shared_hits += 1
+                return json.loads(value)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Dict):
+        """写入缓存"""
+        serialized = json.dumps(value, ensure_ascii=False)
+        self._put_local(key, serialized)
+        if self.backend is not None:
+            self.backend.set(key, serialized, self.ttl)
+
+    def delete(self, key: str):
+        """删除单条缓存，数据变更后调用"""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> Dict:
+        """缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "shared_backend": type(self.backend).__name__ if self.backend else None
+            }
+
+    def _put_local(self, key: str, serialized: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, serialized)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
@@ -2,19 +2,62 @@
 症状分析Agent
 基于AI分析患者症状，推荐合适的科室和医生
 """
-from typing import Dict, List, Optional
-from openai import OpenAI
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import json
+import re
+from openai import BadRequestError
 from config import settings
 from loguru import logger
+from logging_config import debug_sampled
+from metrics import llm_response_parse_total, track_llm_call
+from .hedging import create_request_hedger
+from .llm_client import get_openai_client, get_async_openai_client, get_backup_async_openai_client
+from .prompt_builder import create_prompt_builder, report_llm_call
+from .response_cache import ResponseCache, create_cache_backend, symptom_cache_key
+from .triage_index import TriageIndex
+
+
+URGENCY_LEVELS = ("urgent", "semi-urgent", "normal")
+
+# 文本格式回答中的标记，如 "【推荐科室】呼吸内科" 或 "推荐科室：呼吸内科"
+_MARKER_PATTERN = re.compile(
+    r"(?:【\s*(推荐科室|紧急程度|就医建议)\s*】|^[ \t]*(推荐科室|紧急程度|就医建议)[ \t]*[:：])[ \t]*",
+    re.M
+)
+_MARKER_FIELDS = {"推荐科室": "department", "紧急程度": "urgency", "就医建议": "advice"}
+# 较急必须先于紧急匹配，"不紧急"在"紧急"之前的位置匹配
+_URGENCY_PATTERN = re.compile(
+    r"(semi[\s_-]*urgent|较急|较紧急)|(urgent|紧急|危急)|(normal|普通|一般|不紧急|不急)", re.I
+)
+_JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.S)
+_DEPARTMENT_SEPARATORS = re.compile(r"[,，、/；;]|或者?|和|及")
+_DEPARTMENT_STRIP = " \t*#（）()。.：:\"'“”"
 
 
 class SymptomAnalyzer:
     """症状分析器"""
     
     def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        self.async_client = get_async_openai_client()
         self.model = settings.openai_model
         
+        # 对冲请求：主请求超过近期P90耗时仍未返回时，向备用模型或接口再发一个请求
+        self.hedger = create_request_hedger("SymptomAnalyzer")
+        self.backup_client = get_backup_async_openai_client()
+        self.hedge_model = settings.llm_hedge_model
+        # 等待AI的总时间，超时后使用本地分诊结果
+        self.deadline = settings.symptom_analysis_deadline
+        
+        # 相同症状的分析结果缓存
+        self.cache = None
+        if settings.symptom_cache_enabled:
+            self.cache = ResponseCache(
+                max_size=settings.symptom_cache_size,
+                ttl=settings.symptom_cache_ttl,
+                backend=create_cache_backend(settings.symptom_cache_url)
+            )
+        
         # 常见科室列表
         self.departments = [
             "内科", "外科", "妇科", "儿科", "骨科", "神经内科", "心血管内科",
@@ -22,6 +65,123 @@ class SymptomAnalyzer:
             "耳鼻喉科", "口腔科", "泌尿外科", "胸外科", "神经外科", "肿瘤科",
             "精神科", "中医科", "康复科", "急诊科"
         ]
+        
+        # 校验AI返回的科室名称；文本中查找科室时较长的名称优先（"神经内科"不会匹配成"内科"）
+        self.department_set = frozenset(self.departments)
+        self.department_pattern = re.compile(
+            "|".join(re.escape(d) for d in sorted(self.departments, key=len, reverse=True))
+        )
+        
+        # 结构化输出：json_schema（严格按schema生成）、json_object（JSON模式）或 text（【推荐科室】等标记）
+        self.output_format = settings.symptom_output_format
+        self.response_format = self._build_response_format()
+        # 返回过 response_format 不支持错误的模型，之后改用文本格式
+        self.text_only_models = set()
+        
+        # 角色、科室列表和回答格式不随请求变化，只生成一次；流式分析使用文本格式，便于边生成边展示
+        self.prompt_builder = create_prompt_builder(
+            self._build_system_prompt(structured=self.output_format != "text")
+        )
+        self.text_prompt_builder = create_prompt_builder(self._build_system_prompt(structured=False))
+        
+        # 科室信息，这里可以扩展为从数据库或API获取
+        self.department_guides = {
+            "内科": {
+                "description": "诊治内科常见疾病，如感冒、发烧、咳嗽、腹泻等",
+                "common_symptoms": ["发热", "咳嗽", "乏力", "头痛", "腹痛"],
+                "preparation": "无需特殊准备，如需抽血检查建议空腹"
+            },
+            "心血管内科": {
+                "description": "诊治心脏和血管相关疾病",
+                "common_symptoms": ["胸闷", "胸痛", "心慌", "气短", "高血压"],
+                "preparation": "携带近期心电图和血压记录"
+            },
+            "消化内科": {
+                "description": "诊治消化系统疾病",
+                "common_symptoms": ["胃痛", "腹泻", "便秘", "恶心", "呕吐", "便血"],
+                "preparation": "如需胃镜检查，需提前预约并空腹"
+            },
+            "呼吸内科": {
+                "description": "诊治肺部和呼吸道疾病",
+                "common_symptoms": ["咳嗽", "咳痰", "气喘", "呼吸困难", "发热"],
+                "preparation": "携带以前的胸片或CT报告"
+            },
+            "神经内科": {
+                "description": "诊治脑血管病、头晕头痛、睡眠障碍等",
+                "common_symptoms": ["头晕", "头痛", "手脚麻木", "失眠", "记忆力下降", "肢体无力"],
+                "preparation": "记下头晕、头痛发作的时间和次数"
+            },
+            "骨科": {
+                "description": "诊治骨骼、关节和颈腰椎疾病",
+                "common_symptoms": ["腰痛", "关节痛", "颈椎痛", "腿痛", "骨折"],
+                "preparation": "穿宽松的衣服，携带以前的X光片"
+            },
+            "内分泌科": {
+                "description": "诊治糖尿病、甲状腺疾病等",
+                "common_symptoms": ["口渴", "多尿", "血糖高", "消瘦", "甲状腺肿大"],
+                "preparation": "查血糖需空腹，携带血糖记录"
+            },
+            "肾内科": {
+                "description": "诊治肾脏相关疾病",
+                "common_symptoms": ["水肿", "泡沫尿", "尿少"],
+                "preparation": "可能需要留取晨尿"
+            },
+            "泌尿外科": {
+                "description": "诊治泌尿系统和前列腺疾病",
+                "common_symptoms": ["尿频", "尿急", "尿痛", "血尿", "排尿困难"],
+                "preparation": "检查前适当憋尿"
+            },
+            "皮肤科": {
+                "description": "诊治皮肤相关疾病",
+                "common_symptoms": ["皮疹", "瘙痒", "湿疹", "脱发"],
+                "preparation": "就诊前不要在患处涂药"
+            },
+            "眼科": {
+                "description": "诊治眼部疾病",
+                "common_symptoms": ["视力模糊", "眼痛", "眼干", "流泪"],
+                "preparation": "携带正在使用的眼镜和眼药水"
+            },
+            "耳鼻喉科": {
+                "description": "诊治耳、鼻、咽喉疾病",
+                "common_symptoms": ["耳鸣", "听力下降", "鼻塞", "咽痛", "流鼻血"],
+                "preparation": "无需特殊准备"
+            },
+            "口腔科": {
+                "description": "诊治牙齿和口腔疾病",
+                "common_symptoms": ["牙痛", "牙龈出血", "口腔溃疡"],
+                "preparation": "就诊前刷牙，携带假牙"
+            },
+            "妇科": {
+                "description": "诊治女性生殖系统疾病",
+                "common_symptoms": ["月经不调", "白带异常", "下腹痛"],
+                "preparation": "检查前一天避免同房和阴道用药"
+            },
+            "精神科": {
+                "description": "诊治情绪和精神心理问题",
+                "common_symptoms": ["情绪低落", "焦虑", "幻觉"],
+                "preparation": "最好有家人陪同"
+            },
+            "急诊科": {
+                "description": "处理急危重症",
+                "common_symptoms": ["昏迷", "抽搐", "大出血", "呕血"],
+                "preparation": "立即前往，不要耽误"
+            },
+        }
+        
+        # 本地分诊索引，明确的症状无需调用AI
+        self.triage_index = None
+        if settings.local_triage_enabled:
+            self.triage_index = TriageIndex(
+                self.department_guides,
+                self.departments,
+                min_score=settings.local_triage_min_score,
+                min_confidence=settings.local_triage_min_confidence
+            )
+    
+    @property
+    def client(self):
+        """同步接口使用的共享OpenAI客户端，第一次调用同步接口时才创建"""
+        return get_openai_client()
     
     def analyze_symptoms(
         self,
@@ -38,64 +198,442 @@ class SymptomAnalyzer:
         Returns:
             分析结果，包含推荐科室、紧急程度、就医建议等
         """
+        triage = self._local_triage(symptoms)
+        if triage and triage["confident"]:
+            return self._build_triage_result(symptoms, triage)
+        
+        cache_key = symptom_cache_key(symptoms, patient_info)
+        cached = self._get_cached(cache_key, symptoms)
+        if cached is not None:
+            return cached
+        
         try:
-            # 构建提示词
-            prompt = self._build_prompt(symptoms, patient_info)
-            
             # 调用AI进行分析
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的医疗导诊助手，帮助患者分析症状并推荐合适的就医科室。"
-                                 "你的回答要简洁明了，适合老年人理解。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=1000
+            request = self._prepare_request(symptoms, patient_info, triage)
+            try:
+                content, llm_info = self._complete(request)
+            except BadRequestError as e:
+                if not self._disable_structured_output(request, e):
+                    raise
+                request = self._prepare_request(symptoms, patient_info, triage)
+                content, llm_info = self._complete(request)
+            
+            result = self._handle_response(content, symptoms, request["structured"])
+            result["llm"] = llm_info
+            self._set_cached(cache_key, result)
+            return result
+            
+        except Exception as e:
+            logger.error(f"症状分析失败: {str(e)}")
+            return self._fallback_result(symptoms, triage, e)
+    
+    async def analyze_symptoms_async(
+        self,
+        symptoms: str,
+        patient_info: Optional[Dict] = None
+    ) -> Dict:
+        """
+        分析症状并推荐科室（异步版本，不阻塞事件循环）
+        
+        Args:
+            symptoms: 症状描述
+            patient_info: 患者信息（年龄、性别、病史等）
+        
+        Returns:
+            分析结果，与 analyze_symptoms 相同
+        """
+        triage = self._local_triage(symptoms)
+        if triage and triage["confident"]:
+            return self._build_triage_result(symptoms, triage)
+        
+        cache_key = symptom_cache_key(symptoms, patient_info)
+        cached = self._get_cached(cache_key, symptoms)
+        if cached is not None:
+            return cached
+        
+        try:
+            result = await asyncio.wait_for(
+                self._analyze_with_ai(symptoms, patient_info, triage),
+                timeout=self.deadline or None
             )
+            self._set_cached(cache_key, result)
+            return result
             
-            ai_response = response.choices[0].message.content
+        except asyncio.TimeoutError:
+            error = TimeoutError(f"AI分析超过{self.deadline:g}秒未完成")
+            logger.warning("症状分析超时: {}...", symptoms[:50])
+            return self._fallback_result(symptoms, triage, error)
+        except Exception as e:
+            logger.error(f"症状分析失败: {str(e)}")
+            return self._fallback_result(symptoms, triage, e)
+    
+    async def analyze_symptoms_stream(
+        self,
+        symptoms: str,
+        patient_info: Optional[Dict] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        流式分析症状，边生成边推送
+        
+        Args:
+            symptoms: 症状描述
+            patient_info: 患者信息（年龄、性别、病史等）
+        
+        Yields:
+            事件 {"event": 类型, "data": 数据}，类型包括：
+            token（AI输出片段）、department（推荐科室）、urgency（紧急程度）、
+            error（AI调用失败）、result（与 analyze_symptoms 相同的完整结果）
+        """
+        triage = self._local_triage(symptoms)
+        if triage and triage["confident"]:
+            for event in self._summary_events(self._build_triage_result(symptoms, triage)):
+                yield event
+            return
+        
+        cache_key = symptom_cache_key(symptoms, patient_info)
+        cached = self._get_cached(cache_key, symptoms)
+        if cached is not None:
+            for event in self._summary_events(cached):
+                yield event
+            return
+        
+        try:
+            request = self._prepare_request(symptoms, patient_info, triage, structured=False)
+            with track_llm_call("SymptomAnalyzer", "analyze_symptoms_stream", request["model"]) as timer:
+                stream = await self.async_client.chat.completions.create(
+                    model=request["model"],
+                    messages=request["messages"],
+                    temperature=0.3,
+                    max_tokens=1000,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
             
-            # 解析AI响应
-            result = self._parse_ai_response(ai_response, symptoms)
+                chunks = []
+                pending = ""
+                emitted = set()
+                usage = None
+                async for chunk in stream:
+                    # 最后一个数据块只有 usage，没有 choices
+                    usage = getattr(chunk, "usage", None) or usage
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    chunks.append(delta)
+                    yield {"event": "token", "data": delta}
+                
+                    # 逐行解析标记，科室和紧急程度一出现就推送
+                    pending += delta
+                    *lines, pending = pending.split('\n')
+                    for line in lines:
+                        event = self._parse_marker_line(line, emitted)
+                        if event:
+                            yield event
             
-            logger.info(f"症状分析完成: {symptoms[:50]}... -> {result['recommended_department']}")
+            llm_info = report_llm_call("SymptomAnalyzer", request, usage, timer.elapsed)
+            event = self._parse_marker_line(pending, emitted)
+            if event:
+                yield event
             
-            return result
+            result = self._handle_response("".join(chunks), symptoms, structured=False)
+            result["llm"] = llm_info
+            self._set_cached(cache_key, result)
+            yield {"event": "result", "data": result}
             
         except Exception as e:
             logger.error(f"症状分析失败: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "recommended_department": "内科",  # 默认推荐
-                "urgency": "normal",
-                "advice": "建议先挂内科，由医生进一步诊断。"
-            }
+            yield {"event": "error", "data": {"error": str(e)}}
+            for event in self._summary_events(self._fallback_result(symptoms, triage, e)):
+                yield event
+    
+    def _summary_events(self, result: Dict) -> List[Dict]:
+        """无需流式生成时（本地分诊、缓存命中）直接推送的事件"""
+        return [
+            {
+                "event": "department",
+                "data": {
+                    "recommended_department": result["recommended_department"],
+                    "alternative_departments": result.get("alternative_departments", [])
+                }
+            },
+            {"event": "urgency", "data": {"urgency": result["urgency"]}},
+            {"event": "result", "data": result}
+        ]
+    
+    def _prepare_request(
+        self,
+        symptoms: str,
+        patient_info: Optional[Dict] = None,
+        triage: Optional[Dict] = None,
+        structured: Optional[bool] = None
+    ) -> Dict:
+        """
+        构建对话消息并选择模型
+        
+        症状描述简短、没有慢性病史且本地分诊未提示紧急时使用快速模型
+        
+        Args:
+            structured: 是否要求JSON输出，默认按配置，模型不支持时使用文本格式
+        
+        Returns:
+            {"messages", "model", "structured", "prompt_tokens", "tokens_saved"}
+        """
+        complex_request = bool(
+            (patient_info and patient_info.get("chronic_diseases"))
+            or (triage and triage["urgency"] == "urgent")
+        )
+        model = self.prompt_builder.select_model(
+            self.prompt_builder.counter.count(symptoms), complex_request
+        )
+        if structured is None:
+            structured = self.output_format != "text" and model not in self.text_only_models
+        
+        builder = self.prompt_builder if structured else self.text_prompt_builder
+        content, tokens_saved = self._build_prompt(symptoms, patient_info)
+        messages, prompt_tokens = builder.build(content)
+        return {
+            "messages": messages,
+            "model": model,
+            "structured": structured,
+            "prompt_tokens": prompt_tokens,
+            "tokens_saved": tokens_saved
+        }
+    
+    def _completion_params(self, request: Dict) -> Dict:
+        """chat.completions.create 的参数"""
+        params = {
+            "model": request["model"],
+            "messages": request["messages"],
+            "temperature": 0.3,
+            "max_tokens": 1000
+        }
+        if request["structured"]:
+            params["response_format"] = self.response_format
+        return params
+    
+    def _complete(self, request: Dict) -> Tuple[str, Dict]:
+        """调用AI，返回 (回答内容, 调用信息)"""
+        with track_llm_call("SymptomAnalyzer", "analyze_symptoms", request["model"]) as timer:
+            response = self.client.chat.completions.create(**self._completion_params(request))
+        llm_info = report_llm_call("SymptomAnalyzer", request, response.usage, timer.elapsed)
+        return response.choices[0].message.content, llm_info
+    
+    async def _complete_async(self, request: Dict, client=None) -> Tuple[str, Dict]:
+        """调用AI（异步），返回 (回答内容, 调用信息)"""
+        client = client or self.async_client
+        with track_llm_call("SymptomAnalyzer", "analyze_symptoms", request["model"]) as timer:
+            response = await client.chat.completions.create(**self._completion_params(request))
+        llm_info = report_llm_call("SymptomAnalyzer", request, response.usage, timer.elapsed)
+        return response.choices[0].message.content, llm_info
     
-    def _build_prompt(self, symptoms: str, patient_info: Optional[Dict] = None) -> str:
-        """构建AI提示词"""
-        prompt = f"患者症状：{symptoms}\n\n"
+    async def _analyze_with_ai(
+        self,
+        symptoms: str,
+        patient_info: Optional[Dict] = None,
+        triage: Optional[Dict] = None
+    ) -> Dict:
+        """调用AI分析症状，模型不支持结构化输出时以文本格式重试一次"""
+        request = self._prepare_request(symptoms, patient_info, triage)
+        try:
+            return await self._request_hedged(request, symptoms)
+        except BadRequestError as e:
+            if not self._disable_structured_output(request, e):
+                raise
+            request = self._prepare_request(symptoms, patient_info, triage)
+            return await self._request_hedged(request, symptoms)
+    
+    async def _request_hedged(self, request: Dict, symptoms: str) -> Dict:
+        """
+        发出请求，主请求超过对冲等待时间未返回、调用失败或回答无法解析时向备用模型或接口再发一个，
+        使用先得到的有效结果
+        """
+        if self.hedger is None:
+            return await self._request_analysis(request, symptoms)
+        
+        backup_request = dict(request, model=self.hedge_model or request["model"])
+        result, winner = await self.hedger.call(
+            request["model"],
+            lambda: self._request_analysis(request, symptoms),
+            lambda: self._request_analysis(backup_request, symptoms, self.backup_client),
+            # 参数错误（如不支持 response_format）换一个请求也不会成功
+            failover=lambda e: not isinstance(e, BadRequestError)
+        )
+        result["llm"]["hedge_winner"] = winner
+        return result
+    
+    async def _request_analysis(self, request: Dict, symptoms: str, client=None) -> Dict:
+        """调用一次AI并解析回答"""
+        content, llm_info = await self._complete_async(request, client)
+        result = self._handle_response(content, symptoms, request["structured"])
+        result["llm"] = llm_info
+        return result
+    
+    def _disable_structured_output(self, request: Dict, error: BadRequestError) -> bool:
+        """
+        模型不支持 response_format 时，之后对该模型改用文本格式
+        
+        Returns:
+            是否应该以文本格式重试
+        """
+        if not request["structured"] or "response_format" not in str(error):
+            return False
+        self.text_only_models.add(request["model"])
+        logger.warning(
+            "模型{}不支持{}输出，改用文本格式: {}", request["model"], self.output_format, str(error)
+        )
+        return True
+    
+    def _handle_response(self, ai_response: str, symptoms: str, structured: bool = False) -> Dict:
+        """解析AI响应并记录日志"""
+        result = self._parse_ai_response(ai_response, symptoms, structured)
+        
+        logger.info("症状分析完成: {}... -> {}", symptoms[:50], result['recommended_department'])
+        
+        return result
+    
+    def _local_triage(self, symptoms: str) -> Optional[Dict]:
+        """本地规则分诊"""
+        if self.triage_index is None:
+            return None
+        return self.triage_index.triage(symptoms)
+    
+    def _build_triage_result(
+        self,
+        symptoms: str,
+        triage: Dict,
+        error: Optional[Exception] = None
+    ) -> Dict:
+        """根据本地分诊结果组装与AI分析相同格式的结果"""
+        department = triage["department"]
+        matched = "、".join(triage["matched_symptoms"])
+        
+        if triage["urgency"] == "urgent":
+            advice = (
+                f"您的症状（{matched}）提示{triage['red_flag']}，情况紧急。"
+                "请立即拨打120，或由家人陪同尽快到最近医院的急诊科就诊，不要独自前往。"
+            )
+        else:
+            guide = self.get_department_info(department)
+            advice = f"根据您描述的{matched}，建议到{department}就诊。{guide['description']}。"
+            if guide.get("preparation"):
+                advice += f"就诊前：{guide['preparation']}。"
+            if triage["urgency"] == "semi-urgent":
+                advice += "您的情况需要尽快就医，建议今天就去医院。"
+        
+        result = {
+            "success": True,
+            "original_symptoms": symptoms,
+            "recommended_department": department,
+            "alternative_departments": triage["alternative_departments"],
+            "urgency": triage["urgency"],
+            "advice": advice,
+            "source": "local_triage",
+            "matched_symptoms": triage["matched_symptoms"],
+            "confidence": triage["confidence"]
+        }
+        if error is not None:
+            result["ai_error"] = str(error)
+        
+        logger.info("本地分诊完成: {}... -> {} ({})", symptoms[:50], department, triage['urgency'])
+        
+        return result
+    
+    def _get_cached(self, cache_key: str, symptoms: str) -> Optional[Dict]:
+        """读取缓存的分析结果"""
+        if self.cache is None:
+            return None
+        try:
+            result = self.cache.get(cache_key)
+        except Exception as e:
+            logger.warning(f"读取症状分析缓存失败: {str(e)}")
+            return None
+        if result is None:
+            return None
+        result["original_symptoms"] = symptoms
+        result["from_cache"] = True
+        debug_sampled("症状分析命中缓存: {}", symptoms[:50])
+        return result
+    
+    def _set_cached(self, cache_key: str, result: Dict):
+        """缓存成功的分析结果"""
+        if self.cache is None or not result.get("success"):
+            return
+        try:
+            # 本次调用的模型、token数和耗时不属于分析结果
+            self.cache.set(cache_key, {k: v for k, v in result.items() if k != "llm"})
+        except Exception as e:
+            logger.warning(f"写入症状分析缓存失败: {str(e)}")
+    
+    def get_cache_stats(self) -> Dict:
+        """获取缓存命中统计"""
+        if self.cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.cache.stats()}
+    
+    def _fallback_result(self, symptoms: str, triage: Optional[Dict], error: Exception) -> Dict:
+        """AI不可用、超时或回答无法解析时，有本地分诊结果则使用，否则返回默认结果"""
+        if triage and triage["department"]:
+            return self._build_triage_result(symptoms, triage, error=error)
+        return self._default_result(error)
+    
+    def _default_result(self, error: Exception) -> Dict:
+        """AI调用失败时的默认结果"""
+        return {
+            "success": False,
+            "error": str(error),
+            "recommended_department": "内科",  # 默认推荐
+            "urgency": "normal",
+            "advice": "建议先挂内科，由医生进一步诊断。"
+        }
+    
+    def _build_prompt(self, symptoms: str, patient_info: Optional[Dict] = None) -> Tuple[str, int]:
+        """
+        构建每次请求的提示词：症状和患者信息，病史、过敏史按token预算压缩
+        
+        Returns:
+            (提示词, 压缩节省的token数)
+        """
+        prompt = f"患者症状：{symptoms}\n"
+        tokens_saved = 0
         
         if patient_info:
-            prompt += "患者信息：\n"
+            lines = []
             if patient_info.get("age"):
-                prompt += f"- 年龄：{patient_info['age']}岁\n"
+                lines.append(f"- 年龄：{patient_info['age']}岁")
             if patient_info.get("gender"):
-                prompt += f"- 性别：{patient_info['gender']}\n"
-            if patient_info.get("chronic_diseases"):
-                prompt += f"- 既往病史：{patient_info['chronic_diseases']}\n"
-            if patient_info.get("allergies"):
-                prompt += f"- 过敏史：{patient_info['allergies']}\n"
-            prompt += "\n"
-        
-        prompt += f"""请根据症状分析并回答以下问题：
+                lines.append(f"- 性别：{patient_info['gender']}")
+            for field, label in (("chronic_diseases", "既往病史"), ("allergies", "过敏史")):
+                value, saved = self.prompt_builder.compact(patient_info.get(field))
+                if value:
+                    lines.append(f"- {label}：{value}")
+                    tokens_saved += saved
+            if lines:
+                prompt += "\n患者信息：\n" + "\n".join(lines) + "\n"
+        
+        return prompt, tokens_saved
+    
+    def _build_system_prompt(self, structured: bool = False) -> str:
+        """
+        系统提示词：角色、可选科室和回答格式
+        
+        Args:
+            structured: 是否要求以JSON格式回答
+        """
+        if structured:
+            answer_format = """请以JSON格式回答，包含以下字段：
+- recommended_department: 推荐科室，必须是上面列出的科室之一
+- alternative_departments: 备选科室列表，可以为空
+- urgency: urgent、semi-urgent 或 normal
+- advice: 就医建议"""
+        else:
+            answer_format = """请用以下格式回答：
+【推荐科室】科室名称
+【紧急程度】urgent/semi-urgent/normal
+【就医建议】具体建议内容"""
+        
+        return f"""你是一个专业的医疗导诊助手，帮助患者分析症状并推荐合适的就医科室。你的回答要简洁明了，适合老年人理解。
+
+请根据患者症状分析并回答以下问题：
 
 1. 推荐科室：从以下科室中选择最合适的（可以列出1-2个）
    {', '.join(self.departments)}
@@ -107,82 +645,186 @@ class SymptomAnalyzer:
    - 去医院前需要注意什么
    - 大概的就诊流程
 
-请用以下格式回答：
-【推荐科室】科室名称
-【紧急程度】urgent/semi-urgent/normal
-【就医建议】具体建议内容"""
-        
-        return prompt
+{answer_format}"""
     
-    def _parse_ai_response(self, ai_response: str, symptoms: str) -> Dict:
-        """解析AI响应"""
-        result = {
+    def _build_response_format(self) -> Optional[Dict]:
+        """结构化输出的 response_format 参数，科室和紧急程度限定为可选值"""
+        if self.output_format == "json_object":
+            return {"type": "json_object"}
+        if self.output_format != "json_schema":
+            return None
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "symptom_analysis",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "recommended_department": {"type": "string", "enum": self.departments},
+                        "alternative_departments": {
+                            "type": "array",
+                            "items": {"type": "string", "enum": self.departments}
+                        },
+                        "urgency": {"type": "string", "enum": list(URGENCY_LEVELS)},
+                        "advice": {"type": "string"}
+                    },
+                    "required": ["recommended_department", "alternative_departments", "urgency", "advice"],
+                    "additionalProperties": False
+                }
+            }
+        }
+    
+    def _parse_ai_response(self, ai_response: str, symptoms: str, structured: bool = False) -> Dict:
+        """
+        解析AI响应
+        
+        先按JSON解析（要求了结构化输出，或回答本身是JSON），失败时按【推荐科室】等标记解析
+        
+        Raises:
+            ValueError: 两种方式都没有解析出有效的推荐科室
+        """
+        parsed = None
+        if structured or ai_response.lstrip().startswith(("{", "```")):
+            try:
+                parsed = self._parse_json_response(ai_response)
+                llm_response_parse_total.inc(agent="SymptomAnalyzer", parser="json", outcome="success")
+            except ValueError as e:
+                llm_response_parse_total.inc(agent="SymptomAnalyzer", parser="json", outcome="failure")
+                logger.warning(f"症状分析JSON解析失败，按文本格式解析: {str(e)}")
+        
+        if parsed is None:
+            try:
+                parsed = self._parse_marked_response(ai_response)
+            except ValueError:
+                llm_response_parse_total.inc(agent="SymptomAnalyzer", parser="text", outcome="failure")
+                raise
+            llm_response_parse_total.inc(agent="SymptomAnalyzer", parser="text", outcome="success")
+        
+        return {
             "success": True,
             "original_symptoms": symptoms,
-            "recommended_department": "内科",
-            "alternative_departments": [],
-            "urgency": "normal",
-            "advice": "",
+            **parsed,
             "ai_analysis": ai_response
         }
+    
+    def _parse_json_response(self, ai_response: str) -> Dict:
+        """
+        解析JSON格式的回答
         
-        lines = ai_response.split('\n')
+        Raises:
+            ValueError: 不是合法的JSON，或科室、紧急程度不在可选值中
+        """
+        # 部分兼容接口会把JSON放在代码块中
+        match = _JSON_OBJECT_PATTERN.search(ai_response)
+        if match is None:
+            raise ValueError("回答中没有JSON对象")
+        try:
+            data = json.loads(match.group(0))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"不是合法的JSON: {str(e)}")
+        if not isinstance(data, dict):
+            raise ValueError("JSON不是对象")
         
-        for line in lines:
-            line = line.strip()
-            
-            if '【推荐科室】' in line or '推荐科室：' in line:
-                dept = line.split('】')[-1].split('：')[-1].strip()
-                # 提取主要科室和备选科室
-                depts = [d.strip() for d in dept.replace('或', ',').split(',')]
-                if depts:
-                    result["recommended_department"] = depts[0]
-                    if len(depts) > 1:
-                        result["alternative_departments"] = depts[1:]
-            
-            elif '【紧急程度】' in line or '紧急程度：' in line:
-                urgency = line.split('】')[-1].split('：')[-1].strip().lower()
-                if 'urgent' in urgency or '紧急' in urgency:
-                    result["urgency"] = "urgent" if 'semi' not in urgency else "semi-urgent"
-                else:
-                    result["urgency"] = "normal"
-            
-            elif '【就医建议】' in line or '就医建议：' in line:
-                advice_start = ai_response.find(line)
-                result["advice"] = ai_response[advice_start + len(line):].strip()
-                break
+        department = data.get("recommended_department")
+        if department not in self.department_set:
+            raise ValueError(f"未知科室: {department}")
+        urgency = data.get("urgency")
+        if urgency not in URGENCY_LEVELS:
+            raise ValueError(f"未知紧急程度: {urgency}")
         
-        return result
+        alternatives = data.get("alternative_departments") or []
+        if not isinstance(alternatives, list):
+            alternatives = []
+        return {
+            "recommended_department": department,
+            "alternative_departments": [
+                d for d in dict.fromkeys(alternatives) if d in self.department_set and d != department
+            ],
+            "urgency": urgency,
+            "advice": str(data.get("advice") or "").strip()
+        }
+    
+    def _parse_marked_response(self, ai_response: str) -> Dict:
+        """
+        解析【推荐科室】【紧急程度】【就医建议】格式的回答
+        
+        Raises:
+            ValueError: 没有找到有效的推荐科室
+        """
+        departments = []
+        urgency = None
+        advice = ""
+        markers = list(_MARKER_PATTERN.finditer(ai_response))
+        for i, match in enumerate(markers):
+            field = _MARKER_FIELDS[match.group(1) or match.group(2)]
+            if field == "advice":
+                # 建议可能有多行，到下一个标记或结尾为止
+                end = markers[i + 1].start() if i + 1 < len(markers) else len(ai_response)
+                advice = advice or ai_response[match.end():end].strip()
+                continue
+            line_end = ai_response.find("\n", match.end())
+            value = ai_response[match.end():line_end if line_end != -1 else len(ai_response)]
+            if field == "department" and not departments:
+                departments = self._parse_departments(value)
+            elif field == "urgency" and urgency is None:
+                urgency = self._parse_urgency(value)
+        
+        if not departments:
+            raise ValueError("回答中没有有效的推荐科室")
+        return {
+            "recommended_department": departments[0],
+            "alternative_departments": departments[1:],
+            "urgency": urgency or "normal",
+            "advice": advice
+        }
+    
+    def _parse_departments(self, text: str) -> List[str]:
+        """提取科室列表（去重），只保留可选科室中的名称"""
+        departments = []
+        for part in _DEPARTMENT_SEPARATORS.split(text):
+            name = part.strip(_DEPARTMENT_STRIP)
+            if name not in self.department_set:
+                # 如"神经内科（首选）"、"建议挂骨科"
+                match = self.department_pattern.search(name)
+                name = match.group(0) if match else None
+            if name and name not in departments:
+                departments.append(name)
+        return departments
+    
+    def _parse_urgency(self, text: str) -> str:
+        """提取紧急程度"""
+        match = _URGENCY_PATTERN.search(text)
+        if match is None:
+            return "normal"
+        if match.group(1):
+            return "semi-urgent"
+        return "urgent" if match.group(2) else "normal"
+    
+    def _parse_marker_line(self, line: str, emitted: set) -> Optional[Dict]:
+        """流式输出时解析已完整的一行，科室和紧急程度各只推送一次"""
+        match = _MARKER_PATTERN.search(line)
+        if match is None:
+            return None
+        field = _MARKER_FIELDS[match.group(1) or match.group(2)]
+        value = line[match.end():]
+        if field == "department" and "department" not in emitted:
+            depts = self._parse_departments(value)
+            if depts:
+                emitted.add("department")
+                return {
+                    "event": "department",
+                    "data": {"recommended_department": depts[0], "alternative_departments": depts[1:]}
+                }
+        elif field == "urgency" and "urgency" not in emitted:
+            emitted.add("urgency")
+            return {"event": "urgency", "data": {"urgency": self._parse_urgency(value)}}
+        return None
     
     def get_department_info(self, department: str) -> Dict:
         """获取科室详细信息"""
-        # 这里可以扩展为从数据库或API获取科室信息
-        department_guides = {
-            "内科": {
-                "description": "诊治内科常见疾病，如感冒、发烧、咳嗽、腹泻等",
-                "common_symptoms": ["发热", "咳嗽", "乏力", "头痛", "腹痛"],
-                "preparation": "无需特殊准备，如需抽血检查建议空腹"
-            },
-            "心血管内科": {
-                "description": "诊治心脏和血管相关疾病",
-                "common_symptoms": ["胸闷", "胸痛", "心慌", "气短", "高血压"],
-                "preparation": "携带近期心电图和血压记录"
-            },
-            "消化内科": {
-                "description": "诊治消化系统疾病",
-                "common_symptoms": ["胃痛", "腹泻", "便秘", "恶心", "呕吐"],
-                "preparation": "如需胃镜检查，需提前预约并空腹"
-            },
-            # 可以继续添加更多科室信息
-        }
-        
-        return department_guides.get(department, {
+        return self.department_guides.get(department, {
             "description": f"{department}相关疾病诊治",
             "common_symptoms": [],
             "preparation": "按医院要求准备"
         })
-
-
-
-
-
@@ -0,0 +1,210 @@
+"""
+本地规则分诊索引
+基于科室常见症状构建Aho-Corasick自动机，在调用AI之前对症状做快速分诊
+"""
+from typing import Dict, List, Optional, Tuple
+from collections import deque
+
+
+# 口语化说法 -> 标准症状
+SYMPTOM_SYNONYMS = {
+    "发烧": "发热", "低烧": "发热", "高烧": "发热", "体温高": "发热",
+    "心口疼": "胸痛", "心口痛": "胸痛", "胸口疼": "胸痛", "胸口痛": "胸痛", "胸疼": "胸痛",
+    "胸口闷": "胸闷", "憋气": "胸闷",
+    "心悸": "心慌", "心跳快": "心慌", "心跳得厉害": "心慌",
+    "喘不上气": "气短", "喘不过气": "气短", "上不来气": "气短", "气促": "气短",
+    "冷汗": "出冷汗", "出虚汗": "出冷汗", "大汗": "出冷汗",
+    "拉肚子": "腹泻", "拉稀": "腹泻",
+    "肚子疼": "腹痛", "肚子痛": "腹痛",
+    "胃疼": "胃痛", "胃不舒服": "胃痛",
+    "想吐": "恶心", "反胃": "恶心",
+    "头疼": "头痛", "头昏": "头晕", "眩晕": "头晕", "天旋地转": "头晕",
+    "手麻": "手脚麻木", "脚麻": "手脚麻木", "麻木": "手脚麻木",
+    "腰疼": "腰痛", "腰酸": "腰痛",
+    "膝盖疼": "关节痛", "膝盖痛": "关节痛", "关节疼": "关节痛",
+    "脖子疼": "颈椎痛", "颈椎疼": "颈椎痛",
+    "嗓子疼": "咽痛", "嗓子痛": "咽痛", "喉咙痛": "咽痛", "喉咙疼": "咽痛",
+    "牙疼": "牙痛",
+    "看不清": "视力模糊", "眼花": "视力模糊",
+    "耳朵嗡嗡": "耳鸣", "耳背": "听力下降",
+    "睡不着": "失眠",
+    "浑身没劲": "乏力", "没力气": "乏力",
+    "起疹子": "皮疹", "发痒": "瘙痒",
+    "尿血": "血尿", "小便疼": "尿痛", "小便多": "尿频",
+    "腿肿": "水肿", "脚肿": "水肿", "浮肿": "水肿",
+    "口歪": "口角歪斜", "嘴歪": "口角歪斜",
+    "说话不清": "言语不清", "说不出话": "言语不清",
+    "半边身子没劲": "肢体无力", "一侧肢体无力": "肢体无力", "手脚没劲": "肢体无力",
+    "晕倒": "昏厥", "昏倒": "昏厥", "不省人事": "昏迷",
+    "吐血": "呕血", "黑便": "便血", "大便带血": "便血",
+    "血压高": "高血压",
+}
+
+# 危险信号：同时出现这些症状时直接判定紧急程度
+# (症状组合, 紧急程度, 推荐科室, 原因)
+RED_FLAG_RULES: List[Tuple[frozenset, str, Optional[str], str]] = [
+    (frozenset({"胸痛", "出冷汗"}), "urgent", "急诊科", "胸痛伴出冷汗，需警惕心肌梗死"),
+    (frozenset({"胸闷", "出冷汗"}), "urgent", "急诊科", "胸闷伴出冷汗，需警惕心肌梗死"),
+    (frozenset({"胸痛", "气短"}), "urgent", "急诊科", "胸痛伴气短，需警惕急性心肺疾病"),
+    (frozenset({"口角歪斜"}), "urgent", "急诊科", "口角歪斜，需警惕脑卒中"),
+    (frozenset({"言语不清"}), "urgent", "急诊科", "言语不清，需警惕脑卒中"),
+    (frozenset({"昏迷"}), "urgent", "急诊科", "意识不清"),
+    (frozenset({"昏厥"}), "urgent", "急诊科", "突然晕倒"),
+    (frozenset({"抽搐"}), "urgent", "急诊科", "抽搐发作"),
+    (frozenset({"呕血"}), "urgent", "急诊科", "消化道出血"),
+    (frozenset({"大出血"}), "urgent", "急诊科", "大量出血"),
+    (frozenset({"呼吸困难"}), "semi-urgent", None, "呼吸困难"),
+    (frozenset({"胸痛"}), "semi-urgent", None, "胸痛"),
+    (frozenset({"便血"}), "semi-urgent", None, "便血"),
+]
+
+# 症状或过敏原前出现这些词时视为否定（如"不发烧"、"否认青霉素过敏"），药物过敏检查也使用
+_NEGATIONS = ("没有", "不", "没", "无", "否认")
+
+
+class AhoCorasick:
+    """Aho-Corasick多模式匹配自动机"""
+
+    def __init__(self, patterns: Dict[str, str]):
+        """
+        Args:
+            patterns: 模式串 -> 匹配值
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, str]]] = [[]]
+
+        for pattern, value in patterns.items():
+            node = 0
+            for char in pattern:
+                nxt = self._goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                node = nxt
+            self._output[node].append((len(pattern), value))
+
+        # 广度优先构建失败指针
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """返回所有匹配 (起始位置, 结束位置, 匹配值)，可能重叠"""
+        matches = []
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length, value in self._output[node]:
+                matches.append((i - length + 1, i + 1, value))
+        return matches
+
+    def find_longest(self, text: str) -> List[Tuple[int, int, str]]:
+        """返回从左到右不重叠的最长匹配"""
+        matches = sorted(self.find_all(text), key=lambda m: (m[0], -(m[1] - m[0])))
+        result = []
+        last_end = 0
+        for start, end, value in matches:
+            if start >= last_end:
+                result.append((start, end, value))
+                last_end = end
+        return result
+
+
+class TriageIndex:
+    """本地分诊索引：症状匹配、科室打分和危险信号识别"""
+
+    def __init__(
+        self,
+        department_guides: Dict[str, Dict],
+        departments: List[str],
+        min_score: float = 1.5,
+        min_confidence: float = 0.6
+    ):
+        self.min_score = min_score
+        self.min_confidence = min_confidence
+
+        # 标准症状 -> 科室列表
+        self.symptom_departments: Dict[str, List[str]] = {}
+        for dept, guide in department_guides.items():
+            if dept not in departments:
+                continue
+            for symptom in guide.get("common_symptoms", []):
+                self.symptom_departments.setdefault(symptom, []).append(dept)
+
+        patterns = {symptom: symptom for symptom in self.symptom_departments}
+        for rule_symptoms, _, _, _ in RED_FLAG_RULES:
+            for symptom in rule_symptoms:
+                patterns.setdefault(symptom, symptom)
+        for alias, symptom in SYMPTOM_SYNONYMS.items():
+            patterns.setdefault(alias, symptom)
+
+        self._automaton = AhoCorasick(patterns)
+
+    def match_symptoms(self, text: str) -> List[str]:
+        """提取文本中出现的标准症状（去除否定表述，保持出现顺序）"""
+        found = []
+        for start, _, symptom in self._automaton.find_longest(text):
+            if any(text[max(0, start - len(neg)):start] == neg for neg in _NEGATIONS):
+                continue
+            if symptom not in found:
+                found.append(symptom)
+        return found
+
+    def triage(self, text: str) -> Dict:
+        """
+        本地分诊
+
+        Returns:
+            包含匹配症状、科室得分、紧急程度和是否足够可信的结果
+        """
+        symptoms = self.match_symptoms(text)
+
+        scores: Dict[str, float] = {}
+        for symptom in symptoms:
+            depts = self.symptom_departments.get(symptom, [])
+            for dept in depts:
+                scores[dept] = scores.get(dept, 0.0) + 1.0 / len(depts)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+        total = sum(scores.values())
+        top_dept, top_score = ranked[0] if ranked else (None, 0.0)
+        confidence = top_score / total if total else 0.0
+
+        urgency = "normal"
+        red_flag = None
+        symptom_set = set(symptoms)
+        for rule_symptoms, rule_urgency, rule_dept, reason in RED_FLAG_RULES:
+            if rule_symptoms <= symptom_set:
+                urgency = rule_urgency
+                red_flag = reason
+                if rule_dept:
+                    top_dept = rule_dept
+                break
+
+        confident = urgency == "urgent" or (
+            top_score >= self.min_score and confidence >= self.min_confidence
+        )
+
+        return {
+            "matched_symptoms": symptoms,
+            "department": top_dept,
+            "alternative_departments": [d for d, _ in ranked if d != top_dept][:2],
+            "scores": {d: round(s, 3) for d, s in ranked},
+            "confidence": 1.0 if urgency == "urgent" else round(confidence, 3),
+            "urgency": urgency,
+            "red_flag": red_flag,
+            "confident": confident
+        }
@@ -1,22 +1,26 @@
 """
 预约挂号API
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional, List
-from datetime import datetime
-from database import get_db
-from models import Appointment, User
-from agents import SymptomAnalyzer, AppointmentAgent
+from datetime import datetime, date as date_type
+from database import get_async_db
+from models import Appointment, User, DoctorSchedule
+from api.deps import get_symptom_analyzer, get_appointment_agent
+from api.sse import sse_response
+from api.pagination import parse_fields, keyset_page
+from api.users import invalidate_health_profile
+from slot_inventory import slot_inventory, slot_index, DoctorUnavailableError
+from agents.hospital_client import get_hospital_client
 from loguru import logger
+from logging_config import debug_sampled
 
 router = APIRouter()
 
-# 初始化Agent
-symptom_analyzer = SymptomAnalyzer()
-appointment_agent = AppointmentAgent()
-
 
 class SymptomAnalysisRequest(BaseModel):
     """症状分析请求"""
@@ -51,10 +55,11 @@ class AppointmentResponse(BaseModel):
 @router.post("/analyze-symptoms")
 async def analyze_symptoms(
     request: SymptomAnalysisRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    symptom_analyzer=Depends(get_symptom_analyzer)
 ):
     """分析症状并推荐科室"""
-    user = db.query(User).filter(User.id == request.user_id).first()
+    user = await db.get(User, request.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
@@ -65,22 +70,67 @@ async def analyze_symptoms(
         "chronic_diseases": user.chronic_diseases,
         "allergies": user.allergies
     }
+    user_name = user.name
+    
+    # 等待AI响应期间不占用数据库连接
+    await db.close()
     
     # 调用症状分析Agent
-    result = symptom_analyzer.analyze_symptoms(request.symptoms, patient_info)
+    result = await symptom_analyzer.analyze_symptoms_async(request.symptoms, patient_info)
     
-    logger.info(f"症状分析: 用户{user.name} - {request.symptoms[:30]}... -> {result.get('recommended_department')}")
+    logger.info("症状分析: 用户{} - {}... -> {}", user_name, request.symptoms[:30], result.get('recommended_department'))
     
     return result
 
 
+@router.post("/analyze-symptoms/stream")
+async def analyze_symptoms_stream(
+    request: SymptomAnalysisRequest,
+    db: AsyncSession = Depends(get_async_db),
+    symptom_analyzer=Depends(get_symptom_analyzer)
+):
+    """流式分析症状（SSE），推荐科室和紧急程度一经生成即推送"""
+    user = await db.get(User, request.user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    
+    patient_info = {
+        "age": user.age,
+        "gender": user.gender,
+        "chronic_diseases": user.chronic_diseases,
+        "allergies": user.allergies
+    }
+    
+    # 流式输出期间不占用数据库连接
+    await db.close()
+    
+    logger.info("流式症状分析: 用户{} - {}...", request.user_id, request.symptoms[:30])
+    
+    return sse_response(
+        symptom_analyzer.analyze_symptoms_stream(request.symptoms, patient_info)
+    )
+
+
+@router.get("/symptom-cache/stats")
+async def get_symptom_cache_stats(symptom_analyzer=Depends(get_symptom_analyzer)):
+    """获取症状分析缓存命中统计"""
+    return {
+        "success": True,
+        **symptom_analyzer.get_cache_stats()
+    }
+
+
 @router.get("/hospitals")
 async def search_hospitals(
-    location: str,
-    department: Optional[str] = None
+    location: Optional[str] = None,
+    department: Optional[str] = None,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    limit: Optional[int] = Query(None, ge=1, le=50),
+    appointment_agent=Depends(get_appointment_agent)
 ):
-    """搜索医院"""
-    hospitals = appointment_agent.search_hospitals(location, department)
+    """搜索医院（按距离由近到远）"""
+    hospitals = appointment_agent.search_hospitals(location, department, lat=lat, lng=lng, limit=limit)
     return {
         "success": True,
         "count": len(hospitals),
@@ -92,10 +142,20 @@ async def search_hospitals(
 async def get_available_slots(
     hospital_id: str,
     department: str,
-    date: str
+    date: str,
+    db: AsyncSession = Depends(get_async_db),
+    appointment_agent=Depends(get_appointment_agent)
 ):
-    """获取可预约时间段"""
-    slots = appointment_agent.get_available_slots(hospital_id, department, date)
+    """获取可预约时间段（对接了医院接口时从医院查询，否则来自本地号源库存）"""
+    day = _parse_date(date)
+    
+    remote = await appointment_agent.get_available_slots_async(hospital_id, department, date)
+    if remote is not None:
+        if not remote["success"]:
+            raise HTTPException(status_code=503, detail=remote["error"])
+        slots = remote["slots"]
+    else:
+        slots = await slot_inventory.get_availability(db, hospital_id, department, day)
     return {
         "success": True,
         "hospital_id": hospital_id,
@@ -105,16 +165,95 @@ async def get_available_slots(
     }
 
 
+@router.get("/hospital-api/stats")
+async def get_hospital_api_stats():
+    """获取医院接口调用统计和熔断状态"""
+    client = get_hospital_client()
+    return {
+        "success": True,
+        "enabled": client is not None,
+        **(client.stats() if client else {})
+    }
+
+
+@router.get("/slot-inventory/stats")
+async def get_slot_inventory_stats():
+    """获取号源预约统计"""
+    return {
+        "success": True,
+        **slot_inventory.stats()
+    }
+
+
+def _parse_date(value: str) -> date_type:
+    try:
+        return date_type.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式错误，应为YYYY-MM-DD")
+
+
+async def _release_reserved_slot(
+    db: AsyncSession,
+    hospital_id: str,
+    department: str,
+    day: date_type,
+    slot: dict
+):
+    """预约失败时释放已提交的号源占用"""
+    await db.rollback()
+    if await slot_inventory.release(db, slot["schedule_id"], slot["slot_index"]):
+        await db.commit()
+    slot_inventory.invalidate(hospital_id, department, day)
+    logger.info("预约失败，释放号源: {}/{} {} {}", hospital_id, department, day, slot["slot_time"])
+
+
 @router.post("/", response_model=AppointmentResponse)
 async def create_appointment(
     appointment: AppointmentCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    appointment_agent=Depends(get_appointment_agent)
 ):
-    """创建预约"""
-    user = db.query(User).filter(User.id == appointment.user_id).first()
+    """创建预约（使用本地号源库存时占用号源，同一时间段不会被重复预约）"""
+    user = await db.get(User, appointment.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
+    try:
+        appointment_time = datetime.fromisoformat(appointment.appointment_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="预约时间格式错误")
+    
+    day = appointment_time.date()
+    # 对接了医院接口时号源由医院HIS管理，不占用本地号源，按请求中的医生挂号
+    local_inventory = get_hospital_client() is None
+    index = slot_index(appointment_time.strftime("%H:%M")) if local_inventory else None
+    slot = None
+    if local_inventory and index is None:
+        # 不在号源时间段内的预约不占用号源，与之前的行为一致
+        debug_sampled("预约时间不在号源时间段内: {}", appointment.appointment_date)
+    elif index is not None:
+        try:
+            slot = await slot_inventory.reserve(
+                db,
+                appointment.hospital_id,
+                appointment.department,
+                day,
+                index,
+                appointment.doctor_name
+            )
+        except DoctorUnavailableError as e:
+            await db.rollback()
+            # 没有该医生时返回404，医生该时间段不出诊时返回400并给出其出诊时间段
+            raise HTTPException(status_code=400 if e.times else 404, detail=str(e))
+        if slot is None:
+            await db.rollback()
+            raise HTTPException(status_code=409, detail="该时间段已约满，请选择其他时间")
+        # 先提交号源占用，调用预约接口期间不持有数据库写锁，预约失败时再释放
+        await db.commit()
+        slot_inventory.invalidate(appointment.hospital_id, appointment.department, day)
+    
+    doctor_name = slot["doctor_name"] if slot else appointment.doctor_name
+    
     # 调用预约Agent
     user_info = {
         "name": user.name,
@@ -122,43 +261,53 @@ async def create_appointment(
         "id_card": user.id_card
     }
     
-    result = appointment_agent.make_appointment(
-        user_info,
-        appointment.hospital_id,
-        appointment.hospital_name,
-        appointment.department,
-        appointment.doctor_name or "门诊医生",
-        appointment.appointment_date
-    )
-    
-    if not result.get("success"):
-        raise HTTPException(status_code=400, detail=result.get("error", "预约失败"))
-    
-    # 保存到数据库
-    db_appointment = Appointment(
-        user_id=appointment.user_id,
-        hospital_name=appointment.hospital_name,
-        department=appointment.department,
-        doctor_name=appointment.doctor_name,
-        appointment_date=datetime.fromisoformat(appointment.appointment_date),
-        appointment_number=result["appointment_number"],
-        symptoms=appointment.symptoms,
-        status="confirmed"
-    )
+    try:
+        result = await appointment_agent.make_appointment_async(
+            user_info,
+            appointment.hospital_id,
+            appointment.hospital_name,
+            appointment.department,
+            doctor_name,
+            appointment.appointment_date
+        )
+        
+        if not result.get("success"):
+            raise HTTPException(status_code=400, detail=result.get("error", "预约失败"))
+        
+        # 保存到数据库
+        db_appointment = Appointment(
+            user_id=appointment.user_id,
+            hospital_id=appointment.hospital_id,
+            hospital_name=appointment.hospital_name,
+            department=appointment.department,
+            doctor_name=doctor_name,
+            appointment_date=appointment_time,
+            appointment_number=result["appointment_number"],
+            symptoms=appointment.symptoms,
+            status="confirmed",
+            schedule_id=slot["schedule_id"] if slot else None,
+            slot_index=slot["slot_index"] if slot else None
+        )
+        
+        db.add(db_appointment)
+        await db.commit()
+    except (Exception, asyncio.CancelledError):
+        if slot is not None:
+            await _release_reserved_slot(db, appointment.hospital_id, appointment.department, day, slot)
+        raise
     
-    db.add(db_appointment)
-    db.commit()
-    db.refresh(db_appointment)
+    await db.refresh(db_appointment)
+    invalidate_health_profile(appointment.user_id)
     
-    logger.info(f"创建预约: 用户{user.name} - {appointment.hospital_name}/{appointment.department}")
+    logger.info("创建预约: 用户{} - {}/{}", user.name, appointment.hospital_name, appointment.department)
     
     return db_appointment
 
 
 @router.get("/{appointment_id}")
-async def get_appointment(appointment_id: int, db: Session = Depends(get_db)):
+async def get_appointment(appointment_id: int, db: AsyncSession = Depends(get_async_db)):
     """获取预约详情"""
-    appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
+    appointment = await db.get(Appointment, appointment_id)
     if not appointment:
         raise HTTPException(status_code=404, detail="预约不存在")
     
@@ -175,52 +324,91 @@ async def get_appointment(appointment_id: int, db: Session = Depends(get_db)):
     }
 
 
+# 预约列表可选字段
+APPOINTMENT_LIST_FIELDS = {
+    "id": Appointment.id,
+    "hospital_name": Appointment.hospital_name,
+    "department": Appointment.department,
+    "doctor_name": Appointment.doctor_name,
+    "appointment_date": Appointment.appointment_date,
+    "appointment_number": Appointment.appointment_number,
+    "status": Appointment.status,
+    "symptoms": Appointment.symptoms,
+    "created_at": Appointment.created_at
+}
+APPOINTMENT_LIST_DEFAULT = ["id", "hospital_name", "department", "doctor_name", "appointment_date", "status"]
+
+
 @router.get("/user/{user_id}/appointments")
 async def get_user_appointments(
     user_id: int,
     status: Optional[str] = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取用户的预约列表"""
-    query = db.query(Appointment).filter(Appointment.user_id == user_id)
+    """获取用户的预约列表（按预约时间倒序，游标分页）"""
+    selected = parse_fields(fields, APPOINTMENT_LIST_FIELDS, APPOINTMENT_LIST_DEFAULT)
+    
+    stmt = select(Appointment).where(Appointment.user_id == user_id)
     
     if status:
-        query = query.filter(Appointment.status == status)
+        stmt = stmt.where(Appointment.status == status)
     
-    appointments = query.order_by(Appointment.appointment_date.desc()).all()
+    page = await keyset_page(
+        db,
+        stmt,
+        APPOINTMENT_LIST_FIELDS,
+        selected,
+        Appointment.appointment_date,
+        Appointment.id,
+        cursor=cursor,
+        limit=limit
+    )
     
     return {
         "success": True,
-        "count": len(appointments),
-        "appointments": [
-            {
-                "id": apt.id,
-                "hospital_name": apt.hospital_name,
-                "department": apt.department,
-                "doctor_name": apt.doctor_name,
-                "appointment_date": apt.appointment_date.isoformat(),
-                "status": apt.status
-            }
-            for apt in appointments
-        ]
+        "count": len(page["items"]),
+        "appointments": page["items"],
+        "next_cursor": page["next_cursor"]
     }
 
 
 @router.put("/{appointment_id}/cancel")
-async def cancel_appointment(appointment_id: int, db: Session = Depends(get_db)):
+async def cancel_appointment(
+    appointment_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    appointment_agent=Depends(get_appointment_agent)
+):
     """取消预约"""
-    appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
+    appointment = await db.get(Appointment, appointment_id)
     if not appointment:
         raise HTTPException(status_code=404, detail="预约不存在")
     
+    schedule = None
+    if appointment.schedule_id is not None:
+        schedule = await db.get(DoctorSchedule, appointment.schedule_id)
+    
     # 调用预约Agent取消预约
-    result = appointment_agent.cancel_appointment(appointment.appointment_number)
+    result = await appointment_agent.cancel_appointment_async(
+        appointment.appointment_number,
+        appointment.hospital_id
+    )
     
     if result.get("success"):
+        # 释放号源，已取消的预约不重复释放
+        released = False
+        if schedule is not None and appointment.status != "cancelled":
+            released = await slot_inventory.release(db, schedule.id, appointment.slot_index)
+        
         appointment.status = "cancelled"
-        db.commit()
+        await db.commit()
+        if released:
+            slot_inventory.invalidate(schedule.hospital_id, schedule.department, schedule.date)
+        invalidate_health_profile(appointment.user_id)
         
-        logger.info(f"取消预约: ID={appointment_id}, 单号={appointment.appointment_number}")
+        logger.info("取消预约: ID={}, 单号={}", appointment_id, appointment.appointment_number)
         
         return {"success": True, "message": "预约已取消"}
     else:
@@ -228,14 +416,21 @@ async def cancel_appointment(appointment_id: int, db: Session = Depends(get_db))
 
 
 @router.get("/{appointment_id}/status")
-async def get_appointment_status(appointment_id: int, db: Session = Depends(get_db)):
+async def get_appointment_status(
+    appointment_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    appointment_agent=Depends(get_appointment_agent)
+):
     """查询预约状态"""
-    appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
+    appointment = await db.get(Appointment, appointment_id)
     if not appointment:
         raise HTTPException(status_code=404, detail="预约不存在")
     
     # 查询实时状态
-    status = appointment_agent.get_appointment_status(appointment.appointment_number)
+    status = await appointment_agent.get_appointment_status_async(
+        appointment.appointment_number,
+        appointment.hospital_id
+    )
     
     return {
         "appointment_id": appointment_id,
@@ -0,0 +1,53 @@
+"""
+共享依赖
+Agent在第一次使用时创建并在进程内共享，应用关闭时统一释放
+"""
+import threading
+
+
+_agents = {}
+_lock = threading.Lock()
+
+
+def _get_agent(name: str):
+    agent = _agents.get(name)
+    if agent is None:
+        with _lock:
+            agent = _agents.get(name)
+            if agent is None:
+                import agents
+                agent = getattr(agents, name)()
+                _agents[name] = agent
+    return agent
+
+
+def get_symptom_analyzer():
+    """症状分析Agent"""
+    return _get_agent("SymptomAnalyzer")
+
+
+def get_appointment_agent():
+    """预约挂号Agent"""
+    return _get_agent("AppointmentAgent")
+
+
+def get_guidance_agent():
+    """就医指导Agent"""
+    return _get_agent("GuidanceAgent")
+
+
+def get_medication_guide():
+    """用药指导Agent"""
+    return _get_agent("MedicationGuide")
+
+
+def preload_agents():
+    """提前创建所有Agent，用于需要首个请求也保持低延迟的部署"""
+    for getter in (get_symptom_analyzer, get_appointment_agent, get_guidance_agent, get_medication_guide):
+        getter()
+
+
+def reset_agents():
+    """释放已创建的Agent，应用关闭时调用"""
+    with _lock:
+        _agents.clear()
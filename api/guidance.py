@@ -1,20 +1,23 @@
 """
 就医指导API
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional
-from database import get_db
+from config import settings
+from database import get_async_db
 from models import Appointment, GuidanceLog
-from agents import GuidanceAgent
+from api.deps import get_guidance_agent
+from api.pagination import parse_fields, keyset_page
+from api.http_cache import json_bytes_response, cached_json_response
+from guidance_log_writer import guidance_log_writer
 from loguru import logger
+from logging_config import debug_sampled
 
 router = APIRouter()
 
-# 初始化Agent
-guidance_agent = GuidanceAgent()
-
 
 class GuidanceRequest(BaseModel):
     """指导请求"""
@@ -32,10 +35,11 @@ class LocationRequest(BaseModel):
 @router.get("/appointment/{appointment_id}/full")
 async def get_full_guidance(
     appointment_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    guidance_agent=Depends(get_guidance_agent)
 ):
     """获取完整的就医流程指导"""
-    appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
+    appointment = await db.get(Appointment, appointment_id)
     if not appointment:
         raise HTTPException(status_code=404, detail="预约不存在")
     
@@ -47,20 +51,22 @@ async def get_full_guidance(
         "appointment_number": appointment.appointment_number
     }
     
-    guidance = guidance_agent.get_full_guidance(appointment_info)
+    # 静态部分已预先序列化，只编码预约信息
+    body = guidance_agent.get_full_guidance_json(appointment_info)
     
-    logger.info(f"生成完整就医指导: 预约ID={appointment_id}")
+    logger.info("生成完整就医指导: 预约ID={}", appointment_id)
     
-    return guidance
+    return json_bytes_response(body)
 
 
 @router.post("/step")
 async def get_step_guidance(
     request: GuidanceRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    guidance_agent=Depends(get_guidance_agent)
 ):
     """获取当前步骤的指导"""
-    appointment = db.query(Appointment).filter(Appointment.id == request.appointment_id).first()
+    appointment = await db.get(Appointment, request.appointment_id)
     if not appointment:
         raise HTTPException(status_code=404, detail="预约不存在")
     
@@ -70,27 +76,32 @@ async def get_step_guidance(
         "symptoms": appointment.symptoms
     }
     
-    guidance = guidance_agent.get_current_step_guidance(request.current_step, context)
+    # 预先生成的步骤指导，只合并个性化信息
+    body = guidance_agent.get_step_guidance_json(request.current_step, context)
+    if body is None:
+        return {
+            "success": False,
+            "error": "未知步骤"
+        }
     
-    # 记录指导日志
-    if guidance.get("success"):
-        log = GuidanceLog(
-            user_id=request.user_id,
-            appointment_id=request.appointment_id,
-            guidance_type=request.current_step,
-            guidance_content=str(guidance),
-            is_completed=False
-        )
-        db.add(log)
-        db.commit()
+    # 记录指导日志（批量延迟写入，只保存步骤和上下文摘要）
+    guidance_log_writer.add(
+        request.user_id,
+        request.appointment_id,
+        request.current_step,
+        context
+    )
     
-    logger.info(f"提供步骤指导: 用户{request.user_id} - {request.current_step}")
+    debug_sampled("提供步骤指导: 用户{} - {}", request.user_id, request.current_step)
     
-    return guidance
+    return json_bytes_response(body)
 
 
 @router.post("/location")
-async def get_location_guidance(request: LocationRequest):
+async def get_location_guidance(
+    request: LocationRequest,
+    guidance_agent=Depends(get_guidance_agent)
+):
     """获取医院内位置指引"""
     guidance = guidance_agent.get_location_guidance(
         request.hospital_id,
@@ -105,65 +116,94 @@ async def get_location_guidance(request: LocationRequest):
 
 
 @router.get("/voice/{step}")
-async def get_voice_guidance(step: str, language: str = "zh-CN"):
-    """获取语音指导文本"""
-    voice_text = guidance_agent.generate_voice_guidance(step, language)
+async def get_voice_guidance(
+    step: str,
+    request: Request,
+    language: str = "zh-CN",
+    guidance_agent=Depends(get_guidance_agent)
+):
+    """获取语音指导文本（支持ETag）"""
+    body = guidance_agent.get_voice_guidance_json(step, language)
     
-    return {
-        "success": True,
-        "step": step,
-        "language": language,
-        "text": voice_text
-    }
+    return cached_json_response(
+        request,
+        body,
+        guidance_agent.etag(body),
+        settings.guidance_cache_max_age
+    )
 
 
 @router.get("/steps")
-async def get_all_steps():
-    """获取所有就医流程步骤"""
+async def get_all_steps(request: Request, guidance_agent=Depends(get_guidance_agent)):
+    """获取所有就医流程步骤（支持ETag）"""
+    return cached_json_response(
+        request,
+        guidance_agent.steps_json,
+        guidance_agent.steps_etag,
+        settings.guidance_cache_max_age
+    )
+
+
+@router.get("/log-writer/stats")
+async def get_log_writer_stats():
+    """获取指导日志批量写入状态"""
     return {
         "success": True,
-        "steps": guidance_agent.process_steps
+        **guidance_log_writer.stats()
     }
 
 
 @router.put("/log/{log_id}/complete")
-async def mark_guidance_complete(log_id: int, db: Session = Depends(get_db)):
+async def mark_guidance_complete(log_id: int, db: AsyncSession = Depends(get_async_db)):
     """标记指导步骤已完成"""
-    log = db.query(GuidanceLog).filter(GuidanceLog.id == log_id).first()
+    log = await db.get(GuidanceLog, log_id)
     if not log:
         raise HTTPException(status_code=404, detail="指导记录不存在")
     
     log.is_completed = True
-    db.commit()
+    await db.commit()
     
     return {"success": True, "message": "已标记完成"}
 
 
+# 指导历史可选字段
+GUIDANCE_HISTORY_FIELDS = {
+    "id": GuidanceLog.id,
+    "appointment_id": GuidanceLog.appointment_id,
+    "guidance_type": GuidanceLog.guidance_type,
+    "guidance_content": GuidanceLog.guidance_content,
+    "step_number": GuidanceLog.step_number,
+    "is_completed": GuidanceLog.is_completed,
+    "created_at": GuidanceLog.created_at
+}
+GUIDANCE_HISTORY_DEFAULT = ["id", "guidance_type", "is_completed", "created_at"]
+
+
 @router.get("/user/{user_id}/history")
-async def get_guidance_history(user_id: int, db: Session = Depends(get_db)):
-    """获取用户的指导历史"""
-    logs = db.query(GuidanceLog)\
-        .filter(GuidanceLog.user_id == user_id)\
-        .order_by(GuidanceLog.created_at.desc())\
-        .limit(50)\
-        .all()
+async def get_guidance_history(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取用户的指导历史（按时间倒序，游标分页）"""
+    selected = parse_fields(fields, GUIDANCE_HISTORY_FIELDS, GUIDANCE_HISTORY_DEFAULT)
+    
+    page = await keyset_page(
+        db,
+        select(GuidanceLog).where(GuidanceLog.user_id == user_id),
+        GUIDANCE_HISTORY_FIELDS,
+        selected,
+        GuidanceLog.created_at,
+        GuidanceLog.id,
+        cursor=cursor,
+        limit=limit
+    )
     
     return {
         "success": True,
-        "count": len(logs),
-        "history": [
-            {
-                "id": log.id,
-                "guidance_type": log.guidance_type,
-                "is_completed": log.is_completed,
-                "created_at": log.created_at.isoformat()
-            }
-            for log in logs
-        ]
+        "count": len(page["items"]),
+        "history": page["items"],
+        "next_cursor": page["next_cursor"]
     }
-
-
-
-
-
-
@@ -0,0 +1,50 @@
+"""
+HTTP缓存工具
+直接返回预先序列化的JSON字节，静态内容附带 ETag / Cache-Control，
+客户端带 If-None-Match 且内容未变化时返回304
+"""
+from typing import Optional
+from fastapi import Request, Response
+
+
+def json_bytes_response(body: bytes, status_code: int = 200) -> Response:
+    """返回已经序列化好的JSON，不再经过FastAPI的编码"""
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match 是否包含当前ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # 兼容弱校验形式 W/"..."
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in candidates
+
+
+def cached_json_response(
+    request: Request,
+    body: bytes,
+    etag: str,
+    max_age: int,
+    cache_scope: Optional[str] = "public"
+) -> Response:
+    """
+    返回带缓存头的JSON响应
+
+    Args:
+        request: 当前请求
+        body: 预先序列化的JSON
+        etag: 内容的ETag
+        max_age: Cache-Control 的 max-age（秒）
+        cache_scope: public 或 private
+    """
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"{cache_scope}, max-age={max_age}" if cache_scope else f"max-age={max_age}"
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
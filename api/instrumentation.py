@@ -0,0 +1,60 @@
+"""
+请求指标中间件
+按路由模板（如 /api/appointments/{appointment_id}）统计HTTP请求数和耗时，
+并记录正在处理的请求数；流式响应的耗时计算到最后一个数据块发送完毕
+"""
+import time
+from metrics import http_requests_total, http_request_duration_seconds, http_requests_in_flight
+
+
+# 没有匹配到路由的请求（404）统一记为一个标签值，避免任意路径产生大量时间序列
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(scope) -> str:
+    """
+    请求匹配到的路由模板
+
+    路由匹配后 FastAPI 会把路由写入 scope；新版本 FastAPI 中通过 include_router 注册的路由
+    不再复制一份带前缀的路由，route.path 不含前缀，前缀在 scope["fastapi"] 中
+    """
+    path = getattr(scope.get("route"), "path", None)
+    if path is None:
+        return UNMATCHED_ROUTE
+    included = (scope.get("fastapi") or {}).get("included_router")
+    prefix = getattr(getattr(included, "include_context", None), "prefix", "") or ""
+    return prefix + path
+
+
+class MetricsMiddleware:
+    """纯ASGI中间件，不会像 BaseHTTPMiddleware 那样缓冲流式响应"""
+
+    def __init__(self, app, excluded_paths=("/metrics",)):
+        self.app = app
+        self.excluded_paths = set(excluded_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(method=method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec(method=method)
+            route_path = route_template(scope)
+            http_request_duration_seconds.observe(
+                time.perf_counter() - start, method=method, route=route_path
+            )
+            http_requests_total.inc(method=method, route=route_path, status=status)
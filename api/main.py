@@ -1,34 +1,63 @@
 """
 API主入口
 """
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import asyncio
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from config import settings
-from database import get_db, init_db
+from database import get_db, init_db, async_engine, close_mongodb
 from api import users, appointments, guidance, medications
+from api.deps import preload_agents, reset_agents
+from api.instrumentation import MetricsMiddleware
+from agents.llm_client import close_async_openai_client
+from agents.hospital_client import close_hospital_client
+from reminder_scheduler import reminder_scheduler
+from guidance_log_writer import guidance_log_writer
+from metrics import registry, db_pool_connections, pool_status
+from logging_config import setup_logging, flush_logging
 from loguru import logger
-import sys
 
 # 配置日志
-logger.remove()
-logger.add(
-    sys.stdout,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan> - <level>{message}</level>",
-    level="INFO"
-)
-logger.add(
-    "logs/medical_escort_{time:YYYY-MM-DD}.log",
-    rotation="00:00",
-    retention="30 days",
-    level="DEBUG"
-)
+setup_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时初始化数据库和后台任务，关闭时释放共享资源"""
+    logger.info(f"启动 {settings.app_name} v{settings.app_version}")
+    init_db()
+    logger.info("数据库初始化完成")
+    if settings.preload_agents:
+        preload_agents()
+        logger.info("Agent已预加载")
+    if settings.reminder_scheduler_enabled:
+        await reminder_scheduler.start()
+        logger.info("用药提醒调度已启动")
+    guidance_log_writer.start()
+    
+    yield
+    
+    await reminder_scheduler.stop()
+    await guidance_log_writer.stop()
+    reset_agents()
+    await close_async_openai_client()
+    await close_hospital_client()
+    await async_engine.dispose()
+    close_mongodb()
+    flush_logging()
+
 
 # 创建FastAPI应用
 app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
-    description="医疗陪诊Agent系统API"
+    description="医疗陪诊Agent系统API",
+    lifespan=lifespan
 )
 
 # 配置CORS
@@ -40,13 +69,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
 
-@app.on_event("startup")
-async def startup_event():
-    """应用启动时初始化数据库"""
-    logger.info(f"启动 {settings.app_name} v{settings.app_version}")
-    init_db()
-    logger.info("数据库初始化完成")
+
+def _collect_pool_metrics():
+    status = pool_status(async_engine)
+    if status:
+        db_pool_connections.set(status["size"], state="size")
+        db_pool_connections.set(status["checked_out"], state="checked_out")
+        db_pool_connections.set(status["overflow"], state="overflow")
+        db_pool_connections.set(status["capacity"], state="capacity")
+
+
+registry.add_collector(_collect_pool_metrics)
 
 
 @app.get("/")
@@ -60,13 +96,52 @@ async def root():
     }
 
 
+async def _ping_database():
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
 @app.get("/health")
 async def health_check():
-    """健康检查"""
-    return {
-        "status": "healthy",
-        "timestamp": "2024-01-01T00:00:00Z"
-    }
+    """
+    就绪检查
+
+    执行 SELECT 1 确认数据库可用，并返回连接池占用情况。数据库不可用时返回503；
+    连接池占用达到 HEALTH_POOL_SATURATION_THRESHOLD 时状态为 degraded（仍返回200）
+    """
+    start = asyncio.get_running_loop().time()
+    database = {"status": "ok"}
+    try:
+        # 连接池耗尽时获取连接会等待 DB_POOL_TIMEOUT，这里单独限制检查时间
+        await asyncio.wait_for(_ping_database(), settings.health_db_timeout)
+    except Exception as e:
+        logger.error(f"健康检查数据库不可用: {type(e).__name__} {str(e)}")
+        database = {"status": "error", "error": str(e) or type(e).__name__}
+    database["latency_ms"] = round((asyncio.get_running_loop().time() - start) * 1000, 2)
+
+    pool = pool_status(async_engine)
+    if database["status"] != "ok":
+        status = "unhealthy"
+    elif pool and pool["saturation"] >= settings.health_pool_saturation_threshold:
+        status = "degraded"
+    else:
+        status = "healthy"
+
+    return JSONResponse(
+        status_code=503 if status == "unhealthy" else 200,
+        content={
+            "status": status,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "database": database,
+            "pool": pool
+        }
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 文本格式的运行指标"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 # 注册路由
@@ -1,20 +1,26 @@
 """
 用药指导API
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, Field
 from typing import List, Optional
-from database import get_db
-from models import User, MedicalRecord
-from agents import MedicationGuide
+from datetime import datetime
+import json
+from config import settings
+from database import get_async_db
+from models import User, MedicalRecord, MedicationReminder
+from reminder_scheduler import reminder_scheduler, next_fire_time
+from schemas import Medication
+from api.deps import get_medication_guide
+from api.sse import sse_response
+from api.pagination import parse_fields, keyset_page
 from loguru import logger
 
 router = APIRouter()
 
-# 初始化Agent
-medication_guide = MedicationGuide()
-
 
 class PrescriptionParseRequest(BaseModel):
     """处方解析请求"""
@@ -22,22 +28,17 @@ class PrescriptionParseRequest(BaseModel):
     prescription_image: Optional[str] = None
 
 
+class PrescriptionBatchRequest(BaseModel):
+    """批量处方解析请求"""
+    prescriptions: List[PrescriptionParseRequest]
+
+
 class MedicationInstructionRequest(BaseModel):
     """用药说明请求"""
     user_id: int
     medication_name: str
 
 
-class Medication(BaseModel):
-    """药品模型"""
-    name: str
-    dosage: str
-    frequency: str
-    timing: str
-    duration: str
-    notes: Optional[str] = None
-
-
 class MedicationScheduleRequest(BaseModel):
     """用药时间表请求"""
     medications: List[Medication]
@@ -48,12 +49,25 @@ class ReminderRequest(BaseModel):
     user_id: int
     medications: List[Medication]
     start_date: Optional[str] = None
+    from_date: Optional[str] = None  # 查询窗口开始
+    to_date: Optional[str] = None  # 查询窗口结束
+    cursor: Optional[str] = None  # 上一页返回的 next_cursor
+    limit: int = Field(100, ge=1, le=1000)
+
+
+class ReminderRuleCreate(BaseModel):
+    """提醒规则创建请求"""
+    medications: List[Medication]
+    start_date: Optional[str] = None
 
 
 @router.post("/parse-prescription")
-async def parse_prescription(request: PrescriptionParseRequest):
+async def parse_prescription(
+    request: PrescriptionParseRequest,
+    medication_guide=Depends(get_medication_guide)
+):
     """解析处方"""
-    result = medication_guide.parse_prescription(
+    result = await medication_guide.parse_prescription_async(
         request.prescription_text,
         request.prescription_image
     )
@@ -63,13 +77,37 @@ async def parse_prescription(request: PrescriptionParseRequest):
     return result
 
 
+@router.post("/parse-prescriptions/batch")
+async def parse_prescriptions_batch(
+    request: PrescriptionBatchRequest,
+    medication_guide=Depends(get_medication_guide)
+):
+    """批量解析处方，结果按完成顺序以NDJSON逐行返回"""
+    if len(request.prescriptions) > settings.prescription_batch_max_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多解析{settings.prescription_batch_max_size}条处方"
+        )
+    
+    texts = [item.prescription_text for item in request.prescriptions]
+    
+    logger.info("批量处方解析: {}条", len(texts))
+    
+    async def body():
+        async for result in medication_guide.parse_prescriptions_batch(texts):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
 @router.post("/instructions")
 async def get_medication_instructions(
     request: MedicationInstructionRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    medication_guide=Depends(get_medication_guide)
 ):
     """获取用药说明"""
-    user = db.query(User).filter(User.id == request.user_id).first()
+    user = await db.get(User, request.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
@@ -77,48 +115,197 @@ async def get_medication_instructions(
         "allergies": user.allergies,
         "chronic_diseases": user.chronic_diseases
     }
+    user_name = user.name
     
-    result = medication_guide.get_medication_instructions(
+    # 等待AI响应期间不占用数据库连接
+    await db.close()
+    
+    result = await medication_guide.get_medication_instructions_async(
         request.medication_name,
         patient_info
     )
     
-    logger.info(f"提供用药说明: 用户{user.name} - {request.medication_name}")
+    logger.info("提供用药说明: 用户{} - {}", user_name, request.medication_name)
     
     return result
 
 
+@router.post("/instructions/stream")
+async def get_medication_instructions_stream(
+    request: MedicationInstructionRequest,
+    db: AsyncSession = Depends(get_async_db),
+    medication_guide=Depends(get_medication_guide)
+):
+    """流式获取用药说明（SSE）"""
+    user = await db.get(User, request.user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    
+    patient_info = {
+        "allergies": user.allergies,
+        "chronic_diseases": user.chronic_diseases
+    }
+    
+    # 流式输出期间不占用数据库连接
+    await db.close()
+    
+    logger.info("流式用药说明: 用户{} - {}", request.user_id, request.medication_name)
+    
+    return sse_response(
+        medication_guide.get_medication_instructions_stream(request.medication_name, patient_info)
+    )
+
+
 @router.post("/schedule")
-async def create_medication_schedule(request: MedicationScheduleRequest):
+async def create_medication_schedule(
+    request: MedicationScheduleRequest,
+    medication_guide=Depends(get_medication_guide)
+):
     """创建用药时间表"""
     medications = [med.dict() for med in request.medications]
     result = medication_guide.create_medication_schedule(medications)
     
-    logger.info(f"创建用药时间表: {len(medications)}种药品")
+    logger.info("创建用药时间表: {}种药品", len(medications))
     
     return result
 
 
 @router.post("/reminders")
-async def generate_reminders(request: ReminderRequest):
-    """生成用药提醒"""
+async def generate_reminders(
+    request: ReminderRequest,
+    medication_guide=Depends(get_medication_guide)
+):
+    """生成用药提醒，支持按时间窗口和游标分页"""
     medications = [med.dict() for med in request.medications]
-    reminders = medication_guide.generate_reminders(
-        medications,
-        request.start_date
-    )
     
-    logger.info(f"生成用药提醒: 用户{request.user_id}, {len(reminders)}条提醒")
+    try:
+        rules = medication_guide.build_reminder_rules(medications, request.start_date)
+        page = medication_guide.get_reminder_page(
+            rules,
+            from_date=request.from_date,
+            to_date=request.to_date,
+            cursor=request.cursor,
+            limit=request.limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    logger.info("生成用药提醒: 用户{}, 共{}条, 本页{}条", request.user_id, page['total'], page['count'])
     
     return {
         "success": True,
-        "count": len(reminders),
-        "reminders": reminders
+        "rules": rules,
+        **page
+    }
+
+
+@router.post("/user/{user_id}/reminder-rules")
+async def create_reminder_rules(
+    user_id: int,
+    request: ReminderRuleCreate,
+    db: AsyncSession = Depends(get_async_db),
+    medication_guide=Depends(get_medication_guide)
+):
+    """保存用药提醒规则，由服务端按时发送提醒"""
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    
+    medications = [med.dict() for med in request.medications]
+    try:
+        rules = medication_guide.build_reminder_rules(medications, request.start_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    now = datetime.now()
+    rows = []
+    for rule in rules:
+        row = MedicationReminder(
+            user_id=user_id,
+            medication=rule["medication"],
+            dosage=rule["dosage"],
+            timing=rule["timing"],
+            times=rule["times"],
+            start_date=datetime.fromisoformat(rule["start_date"]),
+            days=rule["days"],
+            next_fire_at=next_fire_time(rule, now),
+            is_active=True
+        )
+        row.is_active = row.next_fire_at is not None
+        rows.append(row)
+    
+    db.add_all(rows)
+    await db.commit()
+    for row in rows:
+        reminder_scheduler.add_rule(row)
+    
+    logger.info("保存用药提醒规则: 用户{}, {}条", user_id, len(rows))
+    
+    return {
+        "success": True,
+        "count": len(rows),
+        "rules": [_reminder_rule_to_dict(row) for row in rows]
+    }
+
+
+@router.get("/user/{user_id}/reminder-rules")
+async def get_reminder_rules(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    """获取用户生效中的用药提醒规则"""
+    rows = (await db.scalars(
+        select(MedicationReminder)
+        .where(MedicationReminder.user_id == user_id)
+        .where(MedicationReminder.is_active.is_(True))
+    )).all()
+    
+    return {
+        "success": True,
+        "count": len(rows),
+        "rules": [_reminder_rule_to_dict(row) for row in rows]
+    }
+
+
+@router.delete("/reminder-rules/{rule_id}")
+async def delete_reminder_rule(rule_id: int, db: AsyncSession = Depends(get_async_db)):
+    """停用用药提醒规则"""
+    row = await db.get(MedicationReminder, rule_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="提醒规则不存在")
+    
+    row.is_active = False
+    row.next_fire_at = None
+    await db.commit()
+    reminder_scheduler.remove_rule(rule_id)
+    
+    return {"success": True, "message": "提醒已停用"}
+
+
+@router.get("/reminder-scheduler/stats")
+async def get_reminder_scheduler_stats():
+    """获取提醒调度状态，包括发送延迟"""
+    return {
+        "success": True,
+        **reminder_scheduler.stats()
+    }
+
+
+def _reminder_rule_to_dict(row: MedicationReminder) -> dict:
+    return {
+        "id": row.id,
+        "medication": row.medication,
+        "dosage": row.dosage,
+        "timing": row.timing,
+        "times": row.times,
+        "start_date": row.start_date.strftime("%Y-%m-%d"),
+        "days": row.days,
+        "next_fire_at": row.next_fire_at.isoformat() if row.next_fire_at else None
     }
 
 
 @router.get("/pharmacy-guidance/{hospital_name}")
-async def get_pharmacy_guidance(hospital_name: str):
+async def get_pharmacy_guidance(
+    hospital_name: str,
+    medication_guide=Depends(get_medication_guide)
+):
     """获取取药指导"""
     guidance = medication_guide.get_pharmacy_guidance(hospital_name)
     
@@ -129,40 +316,68 @@ async def get_pharmacy_guidance(hospital_name: str):
 
 
 @router.post("/check-interactions")
-async def check_drug_interactions(medications: List[str]):
-    """检查药物相互作用"""
-    result = medication_guide.check_drug_interactions(medications)
+async def check_drug_interactions(
+    medications: List[str],
+    user_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+    medication_guide=Depends(get_medication_guide)
+):
+    """检查药物相互作用，传入user_id时同时检查用户过敏史"""
+    allergies = None
+    if user_id is not None:
+        user = await db.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="用户不存在")
+        allergies = user.allergies
+    
+    result = medication_guide.check_drug_interactions(medications, allergies)
     
     return result
 
 
+# 用药记录可选字段
+MEDICATION_RECORD_FIELDS = {
+    "id": MedicalRecord.id,
+    "appointment_id": MedicalRecord.appointment_id,
+    "visit_date": MedicalRecord.visit_date,
+    "hospital_name": MedicalRecord.hospital_name,
+    "department": MedicalRecord.department,
+    "doctor_name": MedicalRecord.doctor_name,
+    "diagnosis": MedicalRecord.diagnosis,
+    "prescriptions": MedicalRecord.prescriptions
+}
+MEDICATION_RECORD_DEFAULT = ["id", "visit_date", "hospital_name", "department", "prescriptions"]
+
+
 @router.get("/user/{user_id}/medications")
-async def get_user_medications(user_id: int, db: Session = Depends(get_db)):
-    """获取用户的用药记录"""
-    records = db.query(MedicalRecord)\
-        .filter(MedicalRecord.user_id == user_id)\
-        .filter(MedicalRecord.prescriptions.isnot(None))\
-        .order_by(MedicalRecord.visit_date.desc())\
-        .limit(10)\
-        .all()
+async def get_user_medications(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取用户的用药记录（按就诊时间倒序，游标分页）"""
+    selected = parse_fields(fields, MEDICATION_RECORD_FIELDS, MEDICATION_RECORD_DEFAULT)
+    
+    stmt = select(MedicalRecord)\
+        .where(MedicalRecord.user_id == user_id)\
+        .where(MedicalRecord.prescriptions.isnot(None))
+    
+    page = await keyset_page(
+        db,
+        stmt,
+        MEDICATION_RECORD_FIELDS,
+        selected,
+        MedicalRecord.visit_date,
+        MedicalRecord.id,
+        cursor=cursor,
+        limit=limit
+    )
     
     return {
         "success": True,
-        "count": len(records),
-        "records": [
-            {
-                "id": record.id,
-                "visit_date": record.visit_date.isoformat(),
-                "hospital_name": record.hospital_name,
-                "department": record.department,
-                "prescriptions": record.prescriptions
-            }
-            for record in records
-        ]
+        "count": len(page["items"]),
+        "records": page["items"],
+        "next_cursor": page["next_cursor"]
     }
-
-
-
-
-
-
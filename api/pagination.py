@@ -0,0 +1,108 @@
+"""
+分页工具
+按 (时间, ID) 做游标分页，只查询需要的列，不加载完整的ORM对象
+"""
+from typing import Dict, List, Optional
+from datetime import datetime
+import base64
+import json
+from fastapi import HTTPException
+from sqlalchemy import Select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    """把上一页最后一行的 (时间, ID) 编码为游标"""
+    raw = json.dumps([sort_value.isoformat(), row_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """解析游标，格式错误时返回400"""
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def parse_fields(fields: Optional[str], columns: Dict, default: List[str]) -> List[str]:
+    """
+    解析逗号分隔的字段列表
+
+    Args:
+        fields: 请求的字段，如 "id,department,status"，为空时使用默认字段
+        columns: 可选字段 -> 数据库列
+        default: 默认返回的字段
+    """
+    if not fields:
+        return default
+    selected = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in columns]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支持的字段: {', '.join(unknown)}，可选字段: {', '.join(columns)}"
+        )
+    return selected
+
+
+async def keyset_page(
+    db: AsyncSession,
+    stmt: Select,
+    columns: Dict,
+    fields: List[str],
+    sort_column,
+    id_column,
+    cursor: Optional[str] = None,
+    limit: int = 50
+) -> Dict:
+    """
+    按 (sort_column, id_column) 倒序做游标分页
+
+    Args:
+        db: 数据库会话
+        stmt: 已经加好过滤条件的查询，例如 select(Appointment).where(...)
+        columns: 可选字段 -> 数据库列
+        fields: 需要返回的字段
+        sort_column: 排序的时间列
+        id_column: 主键列，时间相同时用于确定顺序
+        cursor: 上一页返回的 next_cursor
+        limit: 每页条数
+
+    Returns:
+        {"items": 当前页, "next_cursor": 下一页游标，没有下一页时为None}
+    """
+    # 游标需要的列总是查询出来，但只返回请求的字段
+    stmt = stmt.with_only_columns(
+        *[columns[name].label(name) for name in fields],
+        sort_column.label("_sort"),
+        id_column.label("_id")
+    )
+
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            sort_column < sort_value,
+            and_(sort_column == sort_value, id_column < row_id)
+        ))
+
+    # 多查一条判断是否还有下一页
+    stmt = stmt.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1)
+    rows = (await db.execute(stmt)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for row in rows:
+        item = {}
+        for name in fields:
+            value = getattr(row, name)
+            item[name] = value.isoformat() if isinstance(value, datetime) else value
+        items.append(item)
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1]._sort, rows[-1]._id)
+
+    return {"items": items, "next_cursor": next_cursor}
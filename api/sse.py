@@ -0,0 +1,35 @@
+"""
+Server-Sent Events 工具
+把Agent产生的事件流转换为 text/event-stream 响应
+"""
+from typing import AsyncIterator, Dict
+import json
+from fastapi.responses import StreamingResponse
+
+
+def format_sse(event: str, data) -> str:
+    """格式化一条SSE消息，字符串原样发送，其他数据编码为JSON"""
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    lines = "".join(f"data: {line}\n" for line in payload.split("\n"))
+    return f"event: {event}\n{lines}\n"
+
+
+def sse_response(events: AsyncIterator[Dict]) -> StreamingResponse:
+    """
+    创建SSE流式响应
+
+    Args:
+        events: 事件流，每个事件为 {"event": 类型, "data": 数据}
+    """
+    async def body():
+        async for event in events:
+            yield format_sse(event["event"], event["data"])
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 关闭nginx缓冲，保证逐条推送
+        }
+    )
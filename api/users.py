@@ -2,15 +2,29 @@
 用户管理API
 """
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from typing import Optional
-from database import get_db
-from models import User
+from typing import Dict, Optional
+from config import settings
+from database import get_async_db
+from models import User, Appointment, MedicalRecord
+from agents.response_cache import ResponseCache
 from loguru import logger
 
 router = APIRouter()
 
+# 健康档案快照缓存，用户信息、预约变化时失效
+health_profile_cache = ResponseCache(
+    max_size=settings.health_profile_cache_size,
+    ttl=settings.health_profile_cache_ttl
+)
+
+
+def invalidate_health_profile(user_id: int):
+    """用户信息或就诊记录变化后清除健康档案快照"""
+    health_profile_cache.delete(f"health_profile:{user_id}")
+
 
 class UserCreate(BaseModel):
     """用户创建模型"""
@@ -51,37 +65,37 @@ class UserResponse(BaseModel):
 
 
 @router.post("/", response_model=UserResponse)
-async def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """创建新用户"""
     # 检查手机号是否已存在
-    existing_user = db.query(User).filter(User.phone == user.phone).first()
+    existing_user = await db.scalar(select(User).where(User.phone == user.phone))
     if existing_user:
         raise HTTPException(status_code=400, detail="该手机号已注册")
     
     # 创建用户
     db_user = User(**user.dict())
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
-    logger.info(f"创建用户: {user.name} ({user.phone})")
+    logger.info("创建用户: {} ({})", user.name, user.phone)
     
     return db_user
 
 
 @router.get("/{user_id}", response_model=UserResponse)
-async def get_user(user_id: int, db: Session = Depends(get_db)):
+async def get_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
     """获取用户信息"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     return user
 
 
 @router.get("/phone/{phone}")
-async def get_user_by_phone(phone: str, db: Session = Depends(get_db)):
+async def get_user_by_phone(phone: str, db: AsyncSession = Depends(get_async_db)):
     """通过手机号获取用户"""
-    user = db.query(User).filter(User.phone == phone).first()
+    user = await db.scalar(select(User).where(User.phone == phone))
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
@@ -102,9 +116,13 @@ async def get_user_by_phone(phone: str, db: Session = Depends(get_db)):
 
 
 @router.put("/{user_id}")
-async def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get_db)):
+async def update_user(
+    user_id: int,
+    user_update: UserUpdate,
+    db: AsyncSession = Depends(get_async_db)
+):
     """更新用户信息"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
@@ -112,36 +130,106 @@ async def update_user(user_id: int, user_update: UserUpdate, db: Session = Depen
     for key, value in user_update.dict(exclude_unset=True).items():
         setattr(user, key, value)
     
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    invalidate_health_profile(user_id)
     
-    logger.info(f"更新用户信息: {user.name} (ID: {user_id})")
+    logger.info("更新用户信息: {} (ID: {})", user.name, user_id)
     
     return {"success": True, "message": "用户信息已更新"}
 
 
 @router.delete("/{user_id}")
-async def delete_user(user_id: int, db: Session = Depends(get_db)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
     """删除用户"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
+    invalidate_health_profile(user_id)
     
-    logger.info(f"删除用户: {user.name} (ID: {user_id})")
+    logger.info("删除用户: {} (ID: {})", user.name, user_id)
     
     return {"success": True, "message": "用户已删除"}
 
 
 @router.get("/{user_id}/health-profile")
-async def get_health_profile(user_id: int, db: Session = Depends(get_db)):
-    """获取用户健康档案"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+async def get_health_profile(
+    user_id: int,
+    refresh: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取用户健康档案（就诊次数和最近记录摘要，不加载完整历史）"""
+    cache_key = f"health_profile:{user_id}"
+    if settings.health_profile_cache_ttl > 0 and not refresh:
+        cached = health_profile_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    profile = await _build_health_profile(db, user_id)
+    if profile is None:
         raise HTTPException(status_code=404, detail="用户不存在")
     
+    if settings.health_profile_cache_ttl > 0:
+        health_profile_cache.set(cache_key, profile)
+    
+    return profile
+
+
+async def _build_health_profile(db: AsyncSession, user_id: int) -> Optional[Dict]:
+    """
+    查询健康档案
+    
+    次数用COUNT聚合，最近记录只查询摘要字段并限制条数，
+    查询代价与历史记录多少无关
+    """
+    user = (await db.execute(
+        select(
+            User.id,
+            User.name,
+            User.age,
+            User.gender,
+            User.medical_history,
+            User.allergies,
+            User.chronic_diseases
+        ).where(User.id == user_id)
+    )).first()
+    if not user:
+        return None
+    
+    appointment_count = await db.scalar(
+        select(func.count(Appointment.id)).where(Appointment.user_id == user_id)
+    )
+    record_count = await db.scalar(
+        select(func.count(MedicalRecord.id)).where(MedicalRecord.user_id == user_id)
+    )
+    
+    limit = settings.health_profile_recent_limit
+    appointments = (await db.execute(
+        select(
+            Appointment.id,
+            Appointment.hospital_name,
+            Appointment.department,
+            Appointment.appointment_date,
+            Appointment.status
+        ).where(Appointment.user_id == user_id)
+        .order_by(Appointment.appointment_date.desc(), Appointment.id.desc())
+        .limit(limit)
+    )).all()
+    records = (await db.execute(
+        select(
+            MedicalRecord.id,
+            MedicalRecord.visit_date,
+            MedicalRecord.hospital_name,
+            MedicalRecord.department,
+            MedicalRecord.diagnosis
+        ).where(MedicalRecord.user_id == user_id)
+        .order_by(MedicalRecord.visit_date.desc(), MedicalRecord.id.desc())
+        .limit(limit)
+    )).all()
+    
     return {
         "user_id": user.id,
         "name": user.name,
@@ -150,12 +238,26 @@ async def get_health_profile(user_id: int, db: Session = Depends(get_db)):
         "medical_history": user.medical_history,
         "allergies": user.allergies,
         "chronic_diseases": user.chronic_diseases,
-        "recent_appointments": len(user.appointments),
-        "recent_records": len(user.medical_records)
+        "appointment_count": appointment_count,
+        "record_count": record_count,
+        "recent_appointments": [
+            {
+                "id": apt.id,
+                "hospital_name": apt.hospital_name,
+                "department": apt.department,
+                "appointment_date": apt.appointment_date.isoformat(),
+                "status": apt.status
+            }
+            for apt in appointments
+        ],
+        "recent_records": [
+            {
+                "id": record.id,
+                "visit_date": record.visit_date.isoformat(),
+                "hospital_name": record.hospital_name,
+                "department": record.department,
+                "diagnosis": record.diagnosis
+            }
+            for record in records
+        ]
     }
-
-
-
-
-
-
@@ -14,14 +14,116 @@ class Settings(BaseSettings):
     debug: bool = True
     host: str = "0.0.0.0"
     port: int = 8000
+    preload_agents: bool = False  # 启动时创建所有Agent，否则在第一次请求时创建
+    
+    # 日志
+    log_level: str = "INFO"  # 控制台日志级别
+    log_file_level: str = "DEBUG"  # 文件日志级别，为空时不写文件
+    log_dir: str = "logs"
+    log_retention_days: int = 30
+    log_format: str = "text"  # text 或 json（每行一个JSON对象，便于日志系统采集）
+    log_async: bool = True  # 由后台线程批量写日志，请求线程只把日志放入内存队列
+    log_batch_size: int = 256  # 队列达到该条数时立即写入
+    log_flush_interval_ms: int = 200  # 最长写入间隔（毫秒）
+    log_queue_size: int = 100000  # 队列上限，写入跟不上时丢弃新日志
+    log_debug_sample_rate: float = 0.01  # 热点路径（号源查询、缓存命中等）DEBUG日志的采样比例
+    
+    # 监控
+    metrics_enabled: bool = True  # 统计各路由的请求数和耗时（/metrics）
+    health_db_timeout: float = 2.0  # /health 检查数据库的超时时间（秒）
+    health_pool_saturation_threshold: float = 0.9  # 连接池占用达到该比例时 /health 返回 degraded
     
     # OpenAI配置
     openai_api_key: str
+    openai_base_url: Optional[str] = None  # OpenAI兼容接口地址，为空时使用官方接口
     openai_model: str = "gpt-4"
+    openai_timeout: float = 60.0  # 单次调用超时（秒）
+    openai_max_connections: int = 100  # 共享连接池最大连接数
+    openai_max_keepalive_connections: int = 20
+    openai_fast_model: Optional[str] = None  # 简单请求使用的更快、更便宜的模型，为空时都使用 openai_model
+    llm_simple_max_tokens: int = 80  # 症状、处方文本不超过该token数且没有慢性病史的请求视为简单请求
+    llm_patient_field_token_budget: int = 60  # 病史、过敏史等字段拼入提示词的token上限
+    llm_tokenizer: str = "auto"  # auto（tiktoken可用时精确计数）或 estimate（只按字符估算）
+    symptom_output_format: str = "json_schema"  # json_schema（严格schema）、json_object（JSON模式）或 text；模型不支持时自动改用 text
+    symptom_analysis_deadline: float = 20.0  # 症状分析等待AI的总时间（秒，含对冲请求），超时后使用本地分诊结果
+    
+    # LLM对冲请求：调用超过近期耗时的分位数仍未返回时，再发一个请求，使用先返回的结果
+    llm_hedge_enabled: bool = True
+    llm_hedge_percentile: float = 0.9
+    llm_hedge_window: int = 200  # 计算分位数使用的最近调用数
+    llm_hedge_min_samples: int = 20  # 样本不足时使用 llm_hedge_initial_delay
+    llm_hedge_initial_delay: float = 8.0  # 秒
+    llm_hedge_min_delay: float = 0.5  # 对冲等待时间下限（秒），避免接口很快时加倍请求
+    llm_hedge_model: Optional[str] = None  # 对冲请求使用的模型，为空时与原请求相同
+    llm_hedge_base_url: Optional[str] = None  # 对冲请求使用的备用接口，为空时使用主接口
+    llm_hedge_api_key: Optional[str] = None  # 备用接口的密钥，为空时使用 openai_api_key
+    
+    # 症状分析缓存配置
+    symptom_cache_enabled: bool = True
+    symptom_cache_size: int = 2048
+    symptom_cache_ttl: int = 24 * 3600  # 秒
+    symptom_cache_url: Optional[str] = None  # 共享缓存：redis://... 或 sqlite:///./cache.db
+    
+    # 本地分诊配置（症状明确时不调用AI）
+    local_triage_enabled: bool = True
+    local_triage_min_score: float = 1.5  # 推荐科室的最低匹配得分
+    local_triage_min_confidence: float = 0.6  # 推荐科室得分占比
+    
+    # 批量处方解析配置
+    prescription_batch_max_size: int = 1000  # 单次请求最多处方数
+    prescription_batch_concurrency: int = 8  # 同时进行的AI调用数
+    prescription_batch_max_retries: int = 3
+    prescription_retry_backoff: float = 0.5  # 重试退避基数（秒）
+    
+    # 用药提醒调度配置
+    reminder_scheduler_enabled: bool = True
+    reminder_notifier: str = "log"  # log 或 "模块路径:类名"
+    reminder_batch_size: int = 1000  # 每批发送的提醒数
+    reminder_poll_interval: float = 30.0  # 最长休眠时间（秒）
+    reminder_missed_grace_minutes: int = 30  # 停机期间错过超过该时长的提醒不再补发
+    
+    # 健康档案配置
+    health_profile_recent_limit: int = 5  # 档案中返回的最近预约/病历条数
+    health_profile_cache_ttl: int = 300  # 档案快照缓存时间（秒），0表示不缓存
+    health_profile_cache_size: int = 4096
+    
+    # 指导日志批量写入配置
+    guidance_log_batch_size: int = 200  # 缓冲区达到该条数时立即写入
+    guidance_log_flush_interval_ms: int = 500  # 最长写入间隔（毫秒）
+    guidance_log_max_buffer: int = 10000  # 缓冲区上限，数据库不可用时丢弃最旧的日志
+    guidance_cache_max_age: int = 3600  # 静态指导内容（步骤列表、语音文本）的浏览器缓存时间（秒）
+    
+    # 药物相互作用数据
+    drug_interaction_data_path: Optional[str] = None  # 默认使用 data/drug_interactions.json
+    drug_interaction_reload_interval: float = 5.0  # 检查数据文件更新的间隔（秒）
+    
+    # 医院目录
+    hospital_catalog_path: Optional[str] = None  # 默认使用 data/hospitals.json
+    hospital_catalog_reload_interval: float = 5.0  # 检查数据文件更新的间隔（秒）
+    hospital_search_limit: int = 10  # 搜索医院默认返回数量
+    
+    # 号源库存
+    slot_cache_ttl: int = 5  # 可预约时间段缓存时间（秒），0表示不缓存；本进程预约后立即失效
+    slot_cache_size: int = 4096
+    
+    # ID生成：每个进程需要不同的工作节点ID（0-1023），不配置时根据主机名和进程号生成
+    worker_id: Optional[int] = None
     
     # 数据库配置
     database_url: str = "sqlite:///./medical_escort.db"
-    mongodb_url: Optional[str] = "mongodb://localhost:27017"
+    db_pool_size: int = 10  # 每个引擎保持的连接数（同步、异步引擎各一个连接池）
+    db_max_overflow: int = 20  # 连接池满时最多额外创建的连接数
+    db_pool_timeout: float = 30.0  # 等待空闲连接的超时时间（秒）
+    db_pool_recycle: int = 1800  # 连接最长使用时间（秒），避免使用被服务端关闭的连接
+    db_pool_pre_ping: bool = True  # 取出连接时先检测是否可用
+    
+    # SQLite 调优（仅在使用SQLite时生效）
+    sqlite_journal_mode: str = "WAL"  # WAL模式下读写互不阻塞
+    sqlite_synchronous: str = "NORMAL"  # WAL模式下NORMAL足够安全且写入更快
+    sqlite_busy_timeout: int = 5000  # 数据库被锁时等待的毫秒数
+    sqlite_mmap_size: int = 256 * 1024 * 1024  # 内存映射读取大小（字节），0表示关闭
+    
+    mongodb_url: Optional[str] = None  # 可选，配置后才会连接MongoDB
     mongodb_db_name: str = "medical_escort"
     
     # 安全配置
@@ -31,6 +133,14 @@ class Settings(BaseSettings):
     # 医院API配置
     hospital_api_base_url: Optional[str] = None
     hospital_api_key: Optional[str] = None
+    hospital_api_timeout: float = 5.0  # 每次调用的总截止时间（秒，包含重试）
+    hospital_api_connect_timeout: float = 2.0
+    hospital_api_max_retries: int = 2  # 超时、连接失败、5xx和429时的重试次数
+    hospital_api_retry_backoff: float = 0.2  # 重试退避基数（秒），实际等待为随机抖动
+    hospital_api_max_connections: int = 100
+    hospital_api_max_connections_per_host: int = 20
+    hospital_breaker_failure_threshold: int = 5  # 连续失败次数达到后熔断该医院接口
+    hospital_breaker_reset_timeout: float = 30.0  # 熔断后多久放行试探请求（秒）
     
     class Config:
         env_file = ".env"
@@ -1,28 +1,118 @@
 """
 数据库连接和会话管理
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, Session
-from pymongo import MongoClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from config import settings
 from models import Base
-from typing import Generator
+from metrics import track_db_session
+from typing import AsyncGenerator, Generator
+
+
+# 同步驱动 -> 异步驱动
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+}
+_SYNC_DRIVERS = {
+    "sqlite+aiosqlite": "sqlite",
+    "postgresql+asyncpg": "postgresql",
+    "mysql+aiomysql": "mysql+pymysql",
+}
+
+
+def _replace_scheme(url: str, mapping: dict) -> str:
+    scheme, sep, rest = url.partition("://")
+    return mapping.get(scheme, scheme) + sep + rest
+
+
+def sync_database_url(url: str) -> str:
+    """根据 DATABASE_URL 得到同步驱动的地址（建表、迁移和后台任务使用）"""
+    return _replace_scheme(url, _SYNC_DRIVERS)
+
+
+def async_database_url(url: str) -> str:
+    """根据 DATABASE_URL 得到异步驱动的地址（API请求使用），如 sqlite -> sqlite+aiosqlite"""
+    return _replace_scheme(url, _ASYNC_DRIVERS)
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    if not _is_sqlite(url):
+        return False
+    path = url.partition("://")[2]
+    return path in ("", "/") or ":memory:" in path or "mode=memory" in path
+
+
+def _pool_options(url: str) -> dict:
+    """连接池参数，内存SQLite使用单连接池，不支持这些参数"""
+    if _is_memory_sqlite(url):
+        return {}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """每个新的SQLite连接建立时设置PRAGMA"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout)}")
+    if settings.sqlite_journal_mode:
+        cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    if settings.sqlite_synchronous:
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    cursor.close()
+
+
+def create_db_engine(url: str):
+    """创建同步引擎，应用连接池配置和SQLite调优"""
+    url = sync_database_url(url)
+    db_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False} if _is_sqlite(url) else {},
+        **_pool_options(url)
+    )
+    if _is_sqlite(url):
+        event.listen(db_engine, "connect", _set_sqlite_pragmas)
+    return db_engine
+
+
+def create_async_db_engine(url: str):
+    """创建异步引擎，应用连接池配置和SQLite调优"""
+    url = async_database_url(url)
+    db_engine = create_async_engine(url, **_pool_options(url))
+    if _is_sqlite(url):
+        event.listen(db_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return db_engine
 
 
 # SQLAlchemy 配置
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
-)
+engine = create_db_engine(settings.database_url)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步引擎，API请求中的查询不阻塞事件循环
+async_engine = create_async_db_engine(settings.database_url)
 
-# MongoDB 配置
+# 提交后不过期对象，避免在异步会话中访问属性时隐式查询
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+# MongoDB 配置（可选，配置 MONGODB_URL 后在第一次使用时连接）
 mongodb_client = None
-if settings.mongodb_url:
-    mongodb_client = MongoClient(settings.mongodb_url)
-    mongodb = mongodb_client[settings.mongodb_db_name]
 
 
 def init_db():
@@ -32,16 +122,38 @@ def init_db():
 
 def get_db() -> Generator[Session, None, None]:
     """获取数据库会话"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    with track_db_session("sync"):
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """获取异步数据库会话"""
+    with track_db_session("async"):
+        async with AsyncSessionLocal() as db:
+            yield db
 
 
 def get_mongodb():
-    """获取MongoDB连接"""
-    return mongodb if mongodb_client else None
+    """获取MongoDB连接，未配置 MONGODB_URL 时返回None"""
+    global mongodb_client
+    if not settings.mongodb_url:
+        return None
+    if mongodb_client is None:
+        from pymongo import MongoClient
+        mongodb_client = MongoClient(settings.mongodb_url)
+    return mongodb_client[settings.mongodb_db_name]
+
+
+def close_mongodb():
+    """关闭MongoDB连接"""
+    global mongodb_client
+    if mongodb_client is not None:
+        mongodb_client.close()
+        mongodb_client = None
 
 
 
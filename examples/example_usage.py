@@ -111,9 +111,9 @@ def make_appointment_example(user_id, hospital, department):
     """示例4: 创建预约"""
     print_section("示例4: 预约挂号")
     
-    # 预约明天上午9点
+    # 预约明天上午10点（张主任出诊时间段）
     tomorrow = datetime.now() + timedelta(days=1)
-    appointment_time = tomorrow.replace(hour=9, minute=0, second=0, microsecond=0)
+    appointment_time = tomorrow.replace(hour=10, minute=0, second=0, microsecond=0)
     
     response = requests.post(
         f"{BASE_URL}/api/appointments/",
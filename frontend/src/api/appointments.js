@@ -1,4 +1,5 @@
 import request from './request'
+import { postStream } from './stream'
 
 export const appointmentAPI = {
   // 获取预约列表
@@ -29,6 +30,11 @@ export const appointmentAPI = {
   // 智能预约推荐
   getRecommendation(data) {
     return request.post('/appointments/recommend', data)
+  },
+  
+  // 流式症状分析，onEvent(event, data) 依次收到 token/department/urgency/result
+  analyzeSymptomsStream(data, onEvent) {
+    return postStream('/appointments/analyze-symptoms/stream', data, onEvent)
   }
 }
 
@@ -1,4 +1,5 @@
 import request from './request'
+import { postStream } from './stream'
 
 export const medicationAPI = {
   // 用药指导
@@ -24,6 +25,11 @@ export const medicationAPI = {
   // 用药记录
   getMedicationRecords(userId) {
     return request.get(`/medications/records/${userId}`)
+  },
+  
+  // 流式用药说明，onEvent(event, data) 依次收到 token/result
+  getInstructionsStream(data, onEvent) {
+    return postStream('/medications/instructions/stream', data, onEvent)
   }
 }
 
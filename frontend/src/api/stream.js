@@ -0,0 +1,46 @@
+// 读取后端的 SSE 流式响应
+// EventSource 只支持 GET，这里用 fetch 发送 POST 并逐条解析事件
+export async function postStream(url, data, onEvent) {
+  const headers = { 'Content-Type': 'application/json' }
+  const token = localStorage.getItem('token')
+  if (token) {
+    headers.Authorization = `Bearer ${token}`
+  }
+
+  const response = await fetch(`/api${url}`, {
+    method: 'POST',
+    headers,
+    body: JSON.stringify(data)
+  })
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({}))
+    throw new Error(error.detail || '请求失败')
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    const messages = buffer.split('\n\n')
+    buffer = messages.pop()
+    for (const message of messages) {
+      let event = 'message'
+      const dataLines = []
+      for (const line of message.split('\n')) {
+        if (line.startsWith('event: ')) {
+          event = line.slice(7)
+        } else if (line.startsWith('data: ')) {
+          dataLines.push(line.slice(6))
+        }
+      }
+      const raw = dataLines.join('\n')
+      // token 事件是原始文本，其余事件是 JSON
+      onEvent(event, event === 'token' ? raw : JSON.parse(raw))
+    }
+  }
+}
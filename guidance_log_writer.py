@@ -0,0 +1,152 @@
+"""
+指导日志延迟写入
+/api/guidance/step 的日志先放入进程内缓冲区，由后台任务按条数或时间批量写入，
+请求不再等待数据库提交
+"""
+from typing import Dict, List, Optional
+from datetime import datetime
+import asyncio
+import hashlib
+import json
+from sqlalchemy import insert
+from config import settings
+from database import async_engine
+from models import GuidanceLog
+from loguru import logger
+
+
+def context_hash(context: Optional[Dict]) -> str:
+    """上下文摘要，相同的科室和症状得到相同的值"""
+    raw = json.dumps(context or {}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def step_reference(step: str, context: Optional[Dict]) -> str:
+    """日志中保存的步骤引用，代替完整的指导内容"""
+    return json.dumps({"step": step, "ctx": context_hash(context)}, separators=(",", ":"))
+
+
+class GuidanceLogWriter:
+    """指导日志批量写入器"""
+
+    def __init__(
+        self,
+        engine,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        max_buffer: int = 10000
+    ):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+
+        self._buffer: List[Dict] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failures = 0
+
+    def add(
+        self,
+        user_id: int,
+        appointment_id: Optional[int],
+        step: str,
+        context: Optional[Dict] = None
+    ):
+        """加入一条指导日志，不等待写入"""
+        if len(self._buffer) >= self.max_buffer:
+            # 数据库长时间不可用时丢弃最旧的日志，避免内存无限增长
+            self._buffer.pop(0)
+            self.dropped += 1
+        self._buffer.append({
+            "user_id": user_id,
+            "appointment_id": appointment_id,
+            "guidance_type": step,
+            "guidance_content": step_reference(step, context),
+            "is_completed": False,
+            "created_at": datetime.now()
+        })
+        self._ensure_started()
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        """启动后台写入任务"""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写入缓冲区中剩余的日志"""
+        if self._task:
+            # 不取消任务，等正在进行的写入完成，避免丢失已取出的日志
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        if self._buffer:
+            if self._flush_lock is None:
+                self._flush_lock = asyncio.Lock()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """立即写入缓冲区中的全部日志"""
+        total = 0
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[:self.batch_size]
+                del self._buffer[:self.batch_size]
+                try:
+                    async with self.engine.begin() as conn:
+                        await conn.execute(insert(GuidanceLog).values(batch))
+                except Exception as e:
+                    # 放回缓冲区，下次再写
+                    self._buffer[:0] = batch
+                    self.failures += 1
+                    logger.error(f"批量写入指导日志失败: {str(e)}")
+                    break
+                total += len(batch)
+                self.written += len(batch)
+                self.flushes += 1
+        return total
+
+    def stats(self) -> Dict:
+        """写入统计"""
+        return {
+            "pending": len(self._buffer),
+            "written": self.written,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "running": self._task is not None and not self._task.done()
+        }
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self.start()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._buffer:
+                await self.flush()
+
+
+guidance_log_writer = GuidanceLogWriter(
+    async_engine,
+    batch_size=settings.guidance_log_batch_size,
+    flush_interval=settings.guidance_log_flush_interval_ms / 1000,
+    max_buffer=settings.guidance_log_max_buffer
+)
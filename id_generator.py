@@ -0,0 +1,91 @@
+"""
+分布式ID生成
+Snowflake结构的64位整数ID：41位毫秒时间戳 + 10位工作节点ID + 12位序号。
+同一节点每毫秒最多生成4096个ID，不需要访问数据库；不同进程使用不同的工作节点ID即可保证全局唯一
+"""
+from typing import Dict, Optional
+import os
+import socket
+import threading
+import time
+import zlib
+from config import settings
+
+
+# 起始时间 2024-01-01 00:00:00 UTC（毫秒），41位时间戳可使用约69年
+EPOCH_MS = 1704067200000
+
+WORKER_ID_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+def default_worker_id() -> int:
+    """
+    未配置 WORKER_ID 时根据主机名和进程号生成
+
+    同一台机器上进程号相差不到1024的进程一定得到不同的ID；多台机器部署时应显式配置
+    """
+    return (zlib.crc32(socket.gethostname().encode("utf-8")) + os.getpid()) & MAX_WORKER_ID
+
+
+class SnowflakeGenerator:
+    """线程安全的Snowflake ID生成器"""
+
+    def __init__(self, worker_id: Optional[int] = None, epoch_ms: int = EPOCH_MS):
+        if worker_id is not None and not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"工作节点ID必须在0到{MAX_WORKER_ID}之间: {worker_id}")
+        self.configured_worker_id = worker_id
+        self.epoch_ms = epoch_ms
+        self._lock = threading.Lock()
+        self._init_process()
+
+    def _init_process(self):
+        self._pid = os.getpid()
+        self.worker_id = (
+            self.configured_worker_id if self.configured_worker_id is not None else default_worker_id()
+        )
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_id(self) -> int:
+        """生成下一个ID"""
+        with self._lock:
+            if os.getpid() != self._pid:
+                # fork出的子进程重新生成工作节点ID，避免与父进程重复
+                self._init_process()
+
+            now = time.time_ns() // 1_000_000
+            if now > self._last_ms:
+                self._last_ms = now
+                self._sequence = 0
+            else:
+                # 同一毫秒内或时钟回拨：沿用上一个时间戳，序号递增
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # 本毫秒序号用完，直接使用下一毫秒，不等待
+                    self._last_ms += 1
+
+            return (
+                ((self._last_ms - self.epoch_ms) << (WORKER_ID_BITS + SEQUENCE_BITS))
+                | (self.worker_id << SEQUENCE_BITS)
+                | self._sequence
+            )
+
+    def decode(self, value: int) -> Dict:
+        """解析ID中的时间、工作节点和序号，用于排查问题"""
+        timestamp_ms = (value >> (WORKER_ID_BITS + SEQUENCE_BITS)) + self.epoch_ms
+        return {
+            "timestamp_ms": timestamp_ms,
+            "worker_id": (value >> SEQUENCE_BITS) & MAX_WORKER_ID,
+            "sequence": value & MAX_SEQUENCE
+        }
+
+
+id_generator = SnowflakeGenerator(settings.worker_id)
+
+
+def new_appointment_number() -> str:
+    """生成挂号单号，如 GH369971436700073984"""
+    return f"GH{id_generator.next_id()}"
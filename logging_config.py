@@ -0,0 +1,321 @@
+"""
+日志配置
+请求线程只负责生成日志文本并放入内存队列，由后台线程批量写入控制台和按天切分的文件，
+磁盘变慢时不会拖慢请求；支持每行一个JSON对象的结构化输出，热点路径的DEBUG日志按比例采样
+"""
+from typing import Dict, List, Optional
+from collections import deque
+from datetime import date, timedelta
+import atexit
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import traceback
+from config import settings
+from loguru import logger
+
+
+CONSOLE_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan> - <level>{message}</level>"
+)
+FILE_FORMAT = "{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message}"
+
+# 热点路径的DEBUG日志是否可能被输出，由 setup_logging 根据各输出的级别设置
+_debug_enabled = True
+_debug_sample_rate = 1.0
+_writers: List["QueuedWriter"] = []
+
+
+class DailyFile:
+    """按天切分的日志文件，如 logs/medical_escort_2024-01-01.log，只保留最近 retention_days 天"""
+
+    def __init__(self, directory: str, prefix: str = "medical_escort", retention_days: int = 30):
+        self.directory = directory
+        self.prefix = prefix
+        self.retention_days = retention_days
+        self._day: Optional[date] = None
+        self._file = None
+
+    def path_for(self, day: date) -> str:
+        return os.path.join(self.directory, f"{self.prefix}_{day.isoformat()}.log")
+
+    def write(self, text: str):
+        today = date.today()
+        if today != self._day:
+            self._open(today)
+        self._file.write(text)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self, day: date):
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(self.path_for(day), "a", encoding="utf-8")
+        self._day = day
+        self._remove_expired(day)
+
+    def _remove_expired(self, today: date):
+        oldest = self.path_for(today - timedelta(days=self.retention_days))
+        for path in glob.glob(os.path.join(self.directory, f"{self.prefix}_*.log")):
+            # 文件名中的日期是ISO格式，可以直接按字符串比较
+            if path < oldest:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class QueuedWriter:
+    """
+    后台批量写入
+
+    作为 loguru 的输出（提供 write / stop），write 只把文本追加到队列；
+    后台线程每 flush_interval 秒或队列达到 batch_size 条时合并写入一次并 flush
+    """
+
+    def __init__(
+        self,
+        target,
+        batch_size: int = 256,
+        flush_interval: float = 0.2,
+        max_queue: int = 100000,
+        name: str = "log-writer",
+        close_target: bool = False
+    ):
+        self.target = target
+        self.close_target = close_target
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: deque = deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._lock = threading.Lock()
+
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def write(self, message: str):
+        if self._stopping:
+            # 后台线程已停止（进程退出中），直接写出
+            with self._lock:
+                self.target.write(message)
+                self.target.flush()
+            return
+        queue = self._queue
+        if len(queue) >= self.max_queue:
+            # 写入长时间跟不上时丢弃新日志，避免内存无限增长
+            self.dropped += 1
+            return
+        queue.append(message)
+        if len(queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def isatty(self) -> bool:
+        """控制台是终端时 loguru 才输出颜色"""
+        isatty = getattr(self.target, "isatty", None)
+        return bool(isatty and isatty())
+
+    def drain(self) -> int:
+        """把队列中的日志全部写出"""
+        queue = self._queue
+        total = 0
+        with self._lock:
+            while queue:
+                batch = []
+                while queue and len(batch) < self.batch_size * 4:
+                    batch.append(queue.popleft())
+                try:
+                    self.target.write("".join(batch))
+                    self.target.flush()
+                except Exception as e:
+                    # 写日志失败不能影响业务，直接输出到标准错误
+                    sys.__stderr__.write(f"写日志失败: {type(e).__name__} {str(e)}\n")
+                total += len(batch)
+                self.written += len(batch)
+                self.batches += 1
+        return total
+
+    def stop(self):
+        """停止后台线程并写出剩余日志（logger.remove 和进程退出时调用）"""
+        if self._stopping:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.drain()
+        if self.close_target:
+            self.target.close()
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self._queue),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped
+        }
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._queue:
+                self.drain()
+
+
+def json_formatter(record) -> str:
+    """结构化输出：每条日志一行JSON，包含时间、级别、位置、消息、bind 的字段和异常"""
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "message": record["message"],
+        "process": record["process"].id,
+        "thread": record["thread"].name
+    }
+    extra = {k: v for k, v in record["extra"].items() if k != "_json"}
+    if extra:
+        entry["extra"] = extra
+    if record["exception"] is not None:
+        exc_type, exc_value, exc_traceback = record["exception"]
+        entry["exception"] = "".join(traceback.format_exception(exc_type, exc_value, exc_traceback))
+    record["extra"]["_json"] = json.dumps(entry, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
+def _level_no(level: str) -> int:
+    return logger.level(level.upper()).no
+
+
+def setup_logging(
+    console_level: Optional[str] = None,
+    file_level: Optional[str] = None,
+    log_dir: Optional[str] = None,
+    log_format: Optional[str] = None,
+    use_queue: Optional[bool] = None,
+    debug_sample_rate: Optional[float] = None,
+    console=None
+):
+    """
+    配置日志输出，参数不传时使用配置文件中的设置
+
+    Args:
+        console_level: 控制台日志级别
+        file_level: 文件日志级别，为空时不写文件
+        log_dir: 日志目录
+        log_format: text 或 json
+        use_queue: 是否由后台线程批量写入
+        debug_sample_rate: 热点路径DEBUG日志的采样比例（0-1）
+        console: 控制台输出流，默认 sys.stdout
+    """
+    global _debug_enabled, _debug_sample_rate
+
+    console_level = console_level or settings.log_level
+    file_level = settings.log_file_level if file_level is None else file_level
+    log_dir = log_dir or settings.log_dir
+    log_format = (log_format or settings.log_format).lower()
+    use_queue = settings.log_async if use_queue is None else use_queue
+    debug_sample_rate = settings.log_debug_sample_rate if debug_sample_rate is None else debug_sample_rate
+    console = console or sys.stdout
+
+    # 移除已有输出，QueuedWriter.stop 会写出剩余日志
+    logger.remove()
+    _writers.clear()
+
+    def wrap(target, name: str, close_target: bool = False):
+        if not use_queue:
+            return target
+        writer = QueuedWriter(
+            target,
+            batch_size=settings.log_batch_size,
+            flush_interval=settings.log_flush_interval_ms / 1000,
+            max_queue=settings.log_queue_size,
+            name=name,
+            close_target=close_target
+        )
+        _writers.append(writer)
+        return writer
+
+    is_json = log_format == "json"
+    logger.add(
+        wrap(console, "log-writer-console"),
+        format=json_formatter if is_json else CONSOLE_FORMAT,
+        level=console_level.upper(),
+        colorize=False if is_json else None,
+        backtrace=False
+    )
+    levels = [_level_no(console_level)]
+
+    if file_level:
+        if use_queue:
+            daily_file = DailyFile(log_dir, retention_days=settings.log_retention_days)
+            file_sink = wrap(daily_file, "log-writer-file", close_target=True)
+            options = {}
+        else:
+            # 不使用队列时由 loguru 直接写文件，每条日志 flush 一次
+            file_sink = os.path.join(log_dir, "medical_escort_{time:YYYY-MM-DD}.log")
+            options = {
+                "rotation": "00:00",
+                "retention": f"{settings.log_retention_days} days",
+                "encoding": "utf-8"
+            }
+        logger.add(
+            file_sink,
+            format=json_formatter if is_json else FILE_FORMAT,
+            level=file_level.upper(),
+            backtrace=False,
+            **options
+        )
+        levels.append(_level_no(file_level))
+
+    _debug_enabled = min(levels) <= _level_no("DEBUG")
+    _debug_sample_rate = max(0.0, min(float(debug_sample_rate), 1.0))
+
+
+def flush_logging():
+    """立即写出队列中的日志（应用关闭时调用）"""
+    for writer in list(_writers):
+        writer.drain()
+
+
+def shutdown_logging():
+    """停止后台写入线程并写出剩余日志（进程退出时调用）"""
+    for writer in list(_writers):
+        writer.stop()
+
+
+def logging_stats() -> List[Dict]:
+    """后台写入队列的统计"""
+    return [dict(writer.stats(), name=writer._thread.name) for writer in _writers]
+
+
+def debug_sampled(message: str, *args, **kwargs):
+    """
+    热点路径的DEBUG日志，按 LOG_DEBUG_SAMPLE_RATE 采样
+
+    没有输出会接收DEBUG日志或未被采样时直接返回，不格式化消息；
+    消息使用 loguru 的 {} 占位符，参数在确定输出后才格式化
+    """
+    if not _debug_enabled or (_debug_sample_rate < 1.0 and random.random() >= _debug_sample_rate):
+        return
+    logger.opt(depth=1).debug(message, *args, **kwargs)
+
+
+atexit.register(shutdown_logging)
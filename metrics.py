@@ -0,0 +1,328 @@
+"""
+运行指标
+进程内的计数器、仪表盘和直方图，由 /metrics 按 Prometheus 文本格式输出。
+不依赖 prometheus_client；多进程部署时每个进程单独统计，由采集端按实例汇总
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import bisect
+import math
+import threading
+import time
+
+
+# HTTP请求和数据库会话耗时的分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# LLM调用耗时通常在秒级
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """指标基类，按标签值分别保存"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+            *self.samples()
+        ]
+
+
+class Counter(Metric):
+    """只增不减的计数器"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    """可增可减的仪表盘，如进行中的请求数"""
+
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """直方图，记录耗时分布，输出累计分桶、总和与次数"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # 标签值 -> [各分桶计数（非累计）, 总和, 次数]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = entry
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels) -> "Timer":
+        """计时上下文，退出时记录耗时"""
+        return Timer(lambda elapsed, outcome: self.observe(elapsed, **labels))
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(
+                (key, (list(counts), total, count))
+                for key, (counts, total, count) in self._values.items()
+            )
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Timer:
+    """
+    同时适用于同步代码和异步代码的计时上下文
+
+    退出时以 (耗时, 结果) 调用回调，结果为 success、error 或 cancelled（任务取消、流式响应中途断开）
+    """
+
+    def __init__(self, callback: Callable[[float, str], None]):
+        self.callback = callback
+        self.start = 0.0
+        self.elapsed = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            outcome = "success"
+        elif issubclass(exc_type, (asyncio.CancelledError, GeneratorExit)):
+            outcome = "cancelled"
+        else:
+            outcome = "error"
+        self.elapsed = time.perf_counter() - self.start
+        self.callback(self.elapsed, outcome)
+        return False
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标已注册: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        """输出前调用的回调，用于刷新连接池占用等按需读取的仪表盘"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests_total = registry.register(Counter(
+    "http_requests_total", "HTTP请求数", ("method", "route", "status")
+))
+http_request_duration_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP请求耗时（秒，流式响应到最后一个数据块）", ("method", "route")
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "正在处理的HTTP请求数", ("method",)
+))
+
+llm_requests_total = registry.register(Counter(
+    "llm_requests_total", "LLM调用次数", ("agent", "operation", "model", "outcome")
+))
+llm_request_duration_seconds = registry.register(Histogram(
+    "llm_request_duration_seconds", "LLM调用耗时（秒）", ("agent", "operation", "model"), buckets=LLM_BUCKETS
+))
+llm_tokens_total = registry.register(Counter(
+    "llm_tokens_total", "LLM消耗的token数（来自响应的usage字段）", ("agent", "model", "type")
+))
+llm_response_parse_total = registry.register(Counter(
+    "llm_response_parse_total", "LLM回答的解析次数，parser 为 json 或 text", ("agent", "parser", "outcome")
+))
+llm_hedged_requests_total = registry.register(Counter(
+    "llm_hedged_requests_total",
+    "对冲请求结果：not_hedged（主请求及时返回）、primary_won、backup_won、failed",
+    ("agent", "outcome")
+))
+llm_hedge_delay_seconds = registry.register(Gauge(
+    "llm_hedge_delay_seconds", "当前发出对冲请求前的等待时间（秒）", ("agent", "model")
+))
+llm_prompt_tokens_saved_total = registry.register(Counter(
+    "llm_prompt_tokens_saved_total", "压缩患者信息节省的提示词token数（本地计数）", ("agent",)
+))
+
+db_session_duration_seconds = registry.register(Histogram(
+    "db_session_duration_seconds", "数据库会话从创建到关闭的耗时（秒）", ("mode",)
+))
+db_sessions_in_use = registry.register(Gauge(
+    "db_sessions_in_use", "正在使用的数据库会话数", ("mode",)
+))
+db_pool_connections = registry.register(Gauge(
+    "db_pool_connections", "异步引擎连接池状态", ("state",)
+))
+
+
+def track_llm_call(agent: str, operation: str, model: str) -> Timer:
+    """
+    LLM调用计时
+
+    Args:
+        agent: Agent名称，如 SymptomAnalyzer
+        operation: 调用的功能，如 analyze_symptoms
+        model: 本次调用的模型
+
+    Returns:
+        计时上下文，退出时记录耗时和调用结果，耗时也保存在 elapsed 中
+    """
+    def record(elapsed: float, outcome: str):
+        llm_request_duration_seconds.observe(elapsed, agent=agent, operation=operation, model=model)
+        llm_requests_total.inc(agent=agent, operation=operation, model=model, outcome=outcome)
+    return Timer(record)
+
+
+def record_llm_usage(agent: str, model: str, usage) -> None:
+    """记录OpenAI响应中 usage 字段的token数，没有 usage 时忽略"""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or 0
+    if prompt_tokens:
+        llm_tokens_total.inc(prompt_tokens, agent=agent, model=model, type="prompt")
+    if completion_tokens:
+        llm_tokens_total.inc(completion_tokens, agent=agent, model=model, type="completion")
+
+
+class track_db_session:
+    """数据库会话计时，同时统计正在使用的会话数"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        db_sessions_in_use.inc(mode=self.mode)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        db_sessions_in_use.dec(mode=self.mode)
+        db_session_duration_seconds.observe(time.perf_counter() - self.start, mode=self.mode)
+        return False
+
+
+def pool_status(engine) -> Optional[Dict]:
+    """
+    连接池状态
+
+    Returns:
+        {"size", "checked_out", "overflow", "max_overflow", "capacity", "saturation"}，
+        连接池不是 QueuePool（如内存SQLite）时返回None
+    """
+    pool = getattr(engine, "pool", None)
+    if pool is None or not hasattr(pool, "checkedout") or not hasattr(pool, "size"):
+        return None
+    size = pool.size()
+    max_overflow = max(getattr(pool, "_max_overflow", 0), 0)
+    checked_out = pool.checkedout()
+    capacity = size + max_overflow
+    return {
+        "size": size,
+        "checked_out": checked_out,
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": max_overflow,
+        "capacity": capacity,
+        "saturation": round(checked_out / capacity, 3) if capacity else 0.0
+    }
@@ -0,0 +1,55 @@
+"""
+Alembic 迁移环境
+"""
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import create_engine
+from config import settings
+from database import sync_database_url
+from models import Base
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def get_url() -> str:
+    """优先使用 -x url=... 或 alembic.ini 中的地址，默认使用 DATABASE_URL"""
+    return (
+        context.get_x_argument(as_dictionary=True).get("url")
+        or config.get_main_option("sqlalchemy.url")
+        or sync_database_url(settings.database_url)
+    )
+
+
+def run_migrations_offline():
+    """生成SQL脚本，不连接数据库"""
+    context.configure(
+        url=get_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=True
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    """连接数据库执行迁移"""
+    engine = create_engine(get_url())
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=True  # SQLite 修改表结构需要批量模式
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,46 @@
+"""add query indexes
+
+为用户维度的列表查询添加组合索引和部分索引，并为外键和挂号单号加索引。
+init_db() 新建的数据库已经包含这些索引，迁移中使用 if_not_exists 可重复执行。
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# (索引名, 表名, 列, 部分索引条件)
+INDEXES = [
+    ("ix_appointments_user_date", "appointments", ["user_id", "appointment_date", "id"], None),
+    ("ix_appointments_user_status", "appointments", ["user_id", "status"], None),
+    ("ix_appointments_appointment_number", "appointments", ["appointment_number"], None),
+    ("ix_medical_records_user_visit", "medical_records", ["user_id", "visit_date", "id"], None),
+    (
+        "ix_medical_records_user_visit_rx", "medical_records", ["user_id", "visit_date", "id"],
+        "prescriptions IS NOT NULL"
+    ),
+    ("ix_medical_records_appointment_id", "medical_records", ["appointment_id"], None),
+    ("ix_guidance_logs_user_created", "guidance_logs", ["user_id", "created_at", "id"], None),
+    ("ix_guidance_logs_appointment_id", "guidance_logs", ["appointment_id"], None),
+]
+
+
+def upgrade():
+    for name, table, columns, where in INDEXES:
+        kwargs = {}
+        if where:
+            kwargs["sqlite_where"] = sa.text(where)
+            kwargs["postgresql_where"] = sa.text(where)
+        op.create_index(name, table, columns, if_not_exists=True, **kwargs)
+
+
+def downgrade():
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
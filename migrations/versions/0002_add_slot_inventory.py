@@ -0,0 +1,58 @@
+"""add slot inventory
+
+新增医生排班号源表 doctor_schedules（每位医生每天一行，时间段用位图表示），
+预约表增加占用的号源 schedule_id / slot_index，取消预约时据此释放号源。
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "doctor_schedules",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("hospital_id", sa.String(50), nullable=False),
+        sa.Column("department", sa.String(50), nullable=False),
+        sa.Column("doctor_name", sa.String(50), nullable=False),
+        sa.Column("doctor_title", sa.String(50)),
+        sa.Column("date", sa.Date, nullable=False),
+        sa.Column("slot_mask", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("booked_mask", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("version", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime),
+        if_not_exists=True
+    )
+    op.create_index("ix_doctor_schedules_id", "doctor_schedules", ["id"], if_not_exists=True)
+    op.create_index(
+        "ux_doctor_schedules_day", "doctor_schedules",
+        ["hospital_id", "department", "date", "doctor_name"],
+        unique=True, if_not_exists=True
+    )
+
+    # init_db() 新建的数据库已经包含这两列
+    columns = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("appointments")}
+    with op.batch_alter_table("appointments") as batch:
+        if "schedule_id" not in columns:
+            batch.add_column(sa.Column(
+                "schedule_id", sa.Integer, sa.ForeignKey("doctor_schedules.id", name="fk_appointments_schedule_id")
+            ))
+        if "slot_index" not in columns:
+            batch.add_column(sa.Column("slot_index", sa.Integer))
+
+
+def downgrade():
+    with op.batch_alter_table("appointments") as batch:
+        batch.drop_column("slot_index")
+        batch.drop_column("schedule_id")
+    op.drop_index("ux_doctor_schedules_day", table_name="doctor_schedules", if_exists=True)
+    op.drop_index("ix_doctor_schedules_id", table_name="doctor_schedules", if_exists=True)
+    op.drop_table("doctor_schedules", if_exists=True)
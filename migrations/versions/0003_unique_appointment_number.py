@@ -0,0 +1,44 @@
+"""unique appointment number
+
+挂号单号改为 Snowflake ID 生成后全局唯一，把普通索引换成唯一索引。
+旧的按秒生成的单号可能重复，重复的单号（保留最早的一条）在末尾加上 "-预约ID"。
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(sa.text(
+        """
+        UPDATE appointments
+        SET appointment_number = appointment_number || '-' || CAST(id AS VARCHAR(20))
+        WHERE appointment_number IS NOT NULL
+          AND id NOT IN (
+              SELECT MIN(id) FROM appointments
+              WHERE appointment_number IS NOT NULL
+              GROUP BY appointment_number
+          )
+        """
+    ))
+    op.drop_index("ix_appointments_appointment_number", table_name="appointments", if_exists=True)
+    op.create_index(
+        "ux_appointments_appointment_number", "appointments", ["appointment_number"],
+        unique=True, if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index("ux_appointments_appointment_number", table_name="appointments", if_exists=True)
+    op.create_index(
+        "ix_appointments_appointment_number", "appointments", ["appointment_number"],
+        if_not_exists=True
+    )
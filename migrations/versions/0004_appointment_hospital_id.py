@@ -0,0 +1,39 @@
+"""appointment hospital id
+
+预约表增加 hospital_id。对接医院接口时挂号不占用本地号源，取消和查询状态需要直接知道医院ID；
+已有预约从占用的号源回填。
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # init_db() 新建的数据库已经包含这一列
+    columns = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("appointments")}
+    if "hospital_id" not in columns:
+        with op.batch_alter_table("appointments") as batch:
+            batch.add_column(sa.Column("hospital_id", sa.String(50)))
+    op.execute(sa.text(
+        """
+        UPDATE appointments
+        SET hospital_id = (
+            SELECT doctor_schedules.hospital_id FROM doctor_schedules
+            WHERE doctor_schedules.id = appointments.schedule_id
+        )
+        WHERE hospital_id IS NULL AND schedule_id IS NOT NULL
+        """
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table("appointments") as batch:
+        batch.drop_column("hospital_id")
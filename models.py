@@ -1,7 +1,7 @@
 """
 数据模型定义
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, ForeignKey, Boolean, JSON, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -39,11 +39,20 @@ class User(Base):
 class Appointment(Base):
     """预约挂号表"""
     __tablename__ = "appointments"
+    __table_args__ = (
+        # 用户预约列表：按预约时间倒序分页
+        Index("ix_appointments_user_date", "user_id", "appointment_date", "id"),
+        # 按状态筛选用户预约
+        Index("ix_appointments_user_status", "user_id", "status"),
+        # 挂号单号全局唯一
+        Index("ux_appointments_appointment_number", "appointment_number", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
     # 预约信息
+    hospital_id = Column(String(50))  # 对接医院接口时用于取消和查询状态
     hospital_name = Column(String(100), nullable=False)
     department = Column(String(50), nullable=False)  # 科室
     doctor_name = Column(String(50))
@@ -57,6 +66,10 @@ class Appointment(Base):
     # 状态
     status = Column(String(20), default="pending")  # pending, confirmed, completed, cancelled
     
+    # 占用的号源，取消预约时释放
+    schedule_id = Column(Integer, ForeignKey("doctor_schedules.id"))
+    slot_index = Column(Integer)
+    
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
@@ -68,6 +81,17 @@ class Appointment(Base):
 class MedicalRecord(Base):
     """就医记录表"""
     __tablename__ = "medical_records"
+    __table_args__ = (
+        # 健康档案：按就诊时间倒序
+        Index("ix_medical_records_user_visit", "user_id", "visit_date", "id"),
+        # 用药记录：只索引有处方的记录
+        Index(
+            "ix_medical_records_user_visit_rx", "user_id", "visit_date", "id",
+            sqlite_where=text("prescriptions IS NOT NULL"),
+            postgresql_where=text("prescriptions IS NOT NULL")
+        ),
+        Index("ix_medical_records_appointment_id", "appointment_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -103,6 +127,11 @@ class MedicalRecord(Base):
 class GuidanceLog(Base):
     """引导记录表"""
     __tablename__ = "guidance_logs"
+    __table_args__ = (
+        # 指导历史：按时间倒序分页
+        Index("ix_guidance_logs_user_created", "user_id", "created_at", "id"),
+        Index("ix_guidance_logs_appointment_id", "appointment_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -119,6 +148,46 @@ class GuidanceLog(Base):
     created_at = Column(DateTime, default=datetime.now)
 
 
+class MedicationReminder(Base):
+    """用药提醒规则表"""
+    __tablename__ = "medication_reminders"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    
+    # 提醒规则
+    medication = Column(String(100), nullable=False)
+    dosage = Column(String(50))
+    timing = Column(String(50))
+    times = Column(JSON, nullable=False)  # 每日提醒时间，如 ["08:00", "18:00"]
+    start_date = Column(DateTime, nullable=False)
+    days = Column(Integer, nullable=False)  # 疗程天数
+    
+    # 调度状态
+    next_fire_at = Column(DateTime, index=True)  # 下次提醒时间，为空表示疗程已结束
+    last_fired_at = Column(DateTime)
+    is_active = Column(Boolean, default=True)
+    
+    created_at = Column(DateTime, default=datetime.now)
 
 
-
+class DoctorSchedule(Base):
+    """医生排班号源表，每位医生每天一行，时间段用位图表示"""
+    __tablename__ = "doctor_schedules"
+    __table_args__ = (
+        Index("ux_doctor_schedules_day", "hospital_id", "department", "date", "doctor_name", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    hospital_id = Column(String(50), nullable=False)
+    department = Column(String(50), nullable=False)
+    doctor_name = Column(String(50), nullable=False)
+    doctor_title = Column(String(50))
+    date = Column(Date, nullable=False)
+    
+    # 第i位对应 slot_inventory.SLOT_TIMES[i]
+    slot_mask = Column(Integer, nullable=False, default=0)  # 出诊的时间段
+    booked_mask = Column(Integer, nullable=False, default=0)  # 已预约的时间段
+    version = Column(Integer, nullable=False, default=0)  # 每次预约/释放加1
+    
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -0,0 +1,272 @@
+"""
+用药提醒调度
+提醒规则持久化在数据库中，内存里用最小堆维护每条规则的下次提醒时间，
+到期的提醒按批发送给通知渠道
+"""
+from typing import Dict, List, Optional
+from datetime import date, datetime, time, timedelta
+import asyncio
+import heapq
+import importlib
+from sqlalchemy import select, update
+from config import settings
+from database import SessionLocal
+from models import MedicationReminder
+from loguru import logger
+
+
+def next_fire_time(rule: Dict, after: datetime) -> Optional[datetime]:
+    """
+    计算规则在某时刻之后的下一次提醒时间
+
+    Args:
+        rule: 提醒规则，包含 times、start_date、days
+        after: 起始时刻（不包含）
+
+    Returns:
+        下次提醒时间，疗程已结束时返回None
+    """
+    start = rule["start_date"]
+    if isinstance(start, datetime):
+        start = start.date()
+    elif isinstance(start, str):
+        start = date.fromisoformat(start[:10])
+    last_day = start + timedelta(days=rule["days"] - 1)
+    times = sorted(time.fromisoformat(t) for t in rule["times"])
+
+    day = max(start, after.date())
+    while day <= last_day:
+        for t in times:
+            when = datetime.combine(day, t)
+            if when > after:
+                return when
+        day += timedelta(days=1)
+    return None
+
+
+class LogNotifier:
+    """本地通知渠道：只写日志，用于开发和测试"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, notifications: List[Dict]):
+        self.sent += len(notifications)
+        for item in notifications:
+            logger.info("用药提醒: 用户{} - {}", item['user_id'], item['message'])
+
+
+def create_notifier(name: str):
+    """
+    创建通知渠道
+
+    Args:
+        name: "log" 或 "模块路径:类名"，类需要提供 async send(notifications) 方法
+    """
+    if name == "log":
+        return LogNotifier()
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class ReminderScheduler:
+    """用药提醒调度器"""
+
+    def __init__(
+        self,
+        session_factory,
+        notifier=None,
+        batch_size: int = 1000,
+        poll_interval: float = 30.0,
+        missed_grace: timedelta = timedelta(minutes=30)
+    ):
+        self.session_factory = session_factory
+        self.notifier = notifier or LogNotifier()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.missed_grace = missed_grace
+
+        self._heap: List[tuple] = []  # (下次提醒时间, 规则ID)
+        self._rules: Dict[int, Dict] = {}  # 规则ID -> 规则快照
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.dispatched = 0
+        self.skipped = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def load(self) -> int:
+        """从数据库加载所有生效的规则，服务重启后调用"""
+        with self.session_factory() as db:
+            rows = db.execute(
+                select(MedicationReminder).where(
+                    MedicationReminder.is_active.is_(True),
+                    MedicationReminder.next_fire_at.isnot(None)
+                )
+            ).scalars().all()
+            rules = [self._snapshot(row) for row in rows]
+
+        self._heap = [(rule["next_fire_at"], rule["id"]) for rule in rules]
+        heapq.heapify(self._heap)
+        self._rules = {rule["id"]: rule for rule in rules}
+
+        logger.info(f"加载用药提醒规则: {len(rules)}条")
+        return len(rules)
+
+    def add_rule(self, row: MedicationReminder):
+        """新增规则后加入调度"""
+        if not row.is_active or row.next_fire_at is None:
+            return
+        rule = self._snapshot(row)
+        self._rules[rule["id"]] = rule
+        heapq.heappush(self._heap, (rule["next_fire_at"], rule["id"]))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def remove_rule(self, rule_id: int):
+        """移出调度，堆中的旧条目在弹出时丢弃"""
+        self._rules.pop(rule_id, None)
+
+    async def start(self):
+        """启动后台调度任务"""
+        await asyncio.to_thread(self.load)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台调度任务"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def dispatch_due(self, now: Optional[datetime] = None) -> int:
+        """
+        发送所有已到期的提醒
+
+        Returns:
+            本次发送的提醒数量
+        """
+        now = now or datetime.now()
+        total = 0
+        while self._heap and self._heap[0][0] <= now:
+            total += await self._dispatch_batch(now)
+        return total
+
+    def stats(self) -> Dict:
+        """调度统计"""
+        return {
+            "active_rules": len(self._rules),
+            "heap_size": len(self._heap),
+            "next_fire_at": self._heap[0][0].isoformat() if self._heap else None,
+            "dispatched": self.dispatched,
+            "skipped": self.skipped,
+            "last_lag_ms": round(self.last_lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "running": self._task is not None and not self._task.done()
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.dispatch_due()
+            except Exception as e:
+                logger.error(f"用药提醒调度失败: {str(e)}")
+
+            # 睡到下一条提醒到期，新增规则时提前唤醒
+            timeout = self.poll_interval
+            if self._heap:
+                until_next = (self._heap[0][0] - datetime.now()).total_seconds()
+                timeout = max(0.0, min(timeout, until_next))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch_batch(self, now: datetime) -> int:
+        """弹出一批到期规则，发送提醒并写回下次提醒时间"""
+        notifications = []
+        updates = []
+        while self._heap and self._heap[0][0] <= now and len(updates) < self.batch_size:
+            fire_at, rule_id = heapq.heappop(self._heap)
+            rule = self._rules.get(rule_id)
+            if rule is None or rule["next_fire_at"] != fire_at:
+                continue
+
+            lag = now - fire_at
+            if lag > self.missed_grace:
+                # 停机期间错过太久的提醒不再补发
+                self.skipped += 1
+            else:
+                notifications.append(self._build_notification(rule, fire_at))
+                lag_ms = lag.total_seconds() * 1000
+                self.last_lag_ms = lag_ms
+                self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+            next_at = next_fire_time(rule, now)
+            rule["next_fire_at"] = next_at
+            if next_at is None:
+                self._rules.pop(rule_id, None)
+            else:
+                heapq.heappush(self._heap, (next_at, rule_id))
+            updates.append({
+                "id": rule_id,
+                "next_fire_at": next_at,
+                "last_fired_at": fire_at,
+                "is_active": next_at is not None
+            })
+
+        if notifications:
+            await self.notifier.send(notifications)
+            self.dispatched += len(notifications)
+        if updates:
+            await asyncio.to_thread(self._persist, updates)
+        return len(notifications)
+
+    def _persist(self, updates: List[Dict]):
+        """按主键批量写回调度状态"""
+        with self.session_factory() as db:
+            db.execute(update(MedicationReminder), updates)
+            db.commit()
+
+    def _build_notification(self, rule: Dict, fire_at: datetime) -> Dict:
+        return {
+            "rule_id": rule["id"],
+            "user_id": rule["user_id"],
+            "medication": rule["medication"],
+            "dosage": rule["dosage"],
+            "timing": rule["timing"],
+            "fire_at": fire_at.isoformat(),
+            "message": f"该吃药了：{rule['medication']} {rule['dosage']}"
+        }
+
+    def _snapshot(self, row: MedicationReminder) -> Dict:
+        return {
+            "id": row.id,
+            "user_id": row.user_id,
+            "medication": row.medication,
+            "dosage": row.dosage,
+            "timing": row.timing,
+            "times": row.times,
+            "start_date": row.start_date,
+            "days": row.days,
+            "next_fire_at": row.next_fire_at
+        }
+
+
+def _create_scheduler() -> ReminderScheduler:
+    return ReminderScheduler(
+        SessionLocal,
+        notifier=create_notifier(settings.reminder_notifier),
+        batch_size=settings.reminder_batch_size,
+        poll_interval=settings.reminder_poll_interval,
+        missed_grace=timedelta(minutes=settings.reminder_missed_grace_minutes)
+    )
+
+
+reminder_scheduler = _create_scheduler()
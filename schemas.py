@@ -0,0 +1,16 @@
+"""
+通用数据校验模型
+供API层和Agent共同使用
+"""
+from pydantic import BaseModel
+from typing import Optional
+
+
+class Medication(BaseModel):
+    """药品模型"""
+    name: str
+    dosage: str
+    frequency: str
+    timing: str
+    duration: str
+    notes: Optional[str] = None
@@ -0,0 +1,144 @@
+"""
+LLM对冲请求基准
+在本地启动模拟OpenAI接口（scripts/fake_openai_server.py），一部分请求模拟为慢请求，
+比较症状分析在不对冲和对冲时的耗时分布、额外请求比例，并检查截止时间到达后使用本地分诊结果
+
+用法：
+    python scripts/bench_hedging.py --requests 400 --latency 0.1 --slow-rate 0.05 --slow-latency 2
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("OPENAI_API_KEY", "bench-hedging")
+os.environ.setdefault("SECRET_KEY", "bench-hedging")
+
+import httpx  # noqa: E402
+from aiohttp import web  # noqa: E402
+from loguru import logger  # noqa: E402
+from openai import AsyncOpenAI  # noqa: E402
+from fake_openai_server import create_app  # noqa: E402
+from agents.hedging import RequestHedger  # noqa: E402
+from agents.symptom_analyzer import SymptomAnalyzer  # noqa: E402
+
+
+SYMPTOMS = "这两天有点咳嗽，嗓子不舒服"
+
+
+async def start_server(app: web.Application):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+def create_analyzer(client: AsyncOpenAI, hedger, deadline: float) -> SymptomAnalyzer:
+    analyzer = SymptomAnalyzer()
+    # 每次都调用AI
+    analyzer.cache = None
+    analyzer.triage_index = None
+    analyzer.async_client = client
+    analyzer.backup_client = client
+    analyzer.hedger = hedger
+    analyzer.deadline = deadline
+    return analyzer
+
+
+async def run(analyzer: SymptomAnalyzer, count: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await analyzer.analyze_symptoms_async(f"{SYMPTOMS}（{i}）")
+            results.append((time.perf_counter() - start, result))
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return results
+
+
+def report(name: str, results: list, hits: int):
+    timings = sorted(elapsed * 1000 for elapsed, _ in results)
+    p = lambda q: timings[min(int(len(timings) * q), len(timings) - 1)]  # noqa: E731
+    backup = sum(1 for _, r in results if r.get("llm", {}).get("hedge_winner") == "backup")
+    failed = sum(1 for _, r in results if not r.get("success"))
+    print(
+        f"{name:<10} p50 {statistics.median(timings):7.1f}ms  p90 {p(0.9):7.1f}ms  p99 {p(0.99):7.1f}ms  "
+        f"最大 {timings[-1]:7.1f}ms  接口请求 {hits / len(results):.2f}次/请求  "
+        f"备用请求胜出 {backup}  失败 {failed}"
+    )
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="LLM对冲请求基准")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.1, help="模拟接口的基础延迟（秒）")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="慢请求的比例")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="慢请求的延迟（秒）")
+    parser.add_argument("--percentile", type=float, default=0.9)
+    args = parser.parse_args()
+
+    logger.remove()
+    # 被取消的请求在模拟服务端产生的连接断开日志
+    logging.getLogger("aiohttp").setLevel(logging.CRITICAL)
+    app = create_app(args.latency, args.slow_rate, args.slow_latency)
+    state = app["state"]
+    runner, base_url = await start_server(app)
+    client = AsyncOpenAI(
+        api_key="bench-hedging",
+        base_url=base_url,
+        max_retries=0,
+        http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=200))
+    )
+    print(
+        f"{args.requests}个请求，并发{args.concurrency}，接口延迟约{args.latency * 1000:.0f}ms，"
+        f"{args.slow_rate:.0%}的请求需要{args.slow_latency * 1000:.0f}ms"
+    )
+
+    try:
+        modes = [
+            ("no-hedge", None),
+            ("hedge", RequestHedger("SymptomAnalyzer", percentile=args.percentile, min_samples=20, min_delay=0.01)),
+        ]
+        for name, hedger in modes:
+            analyzer = create_analyzer(client, hedger, deadline=30.0)
+            if hedger is not None:
+                # 先积累耗时样本
+                await run(analyzer, 50, args.concurrency)
+            state["hits"].clear()
+            results = await run(analyzer, args.requests, args.concurrency)
+            report(name, results, sum(state["hits"].values()))
+            if hedger is not None:
+                print(f"           对冲等待时间: {hedger.stats()}，被取消的接口请求 {state['cancelled']}")
+
+        # 截止时间：所有请求都很慢时，到时间后返回本地分诊结果
+        state["slow_rate"] = 1.0
+        analyzer = create_analyzer(client, None, deadline=args.latency * 3)
+        analyzer.triage_index = SymptomAnalyzer().triage_index
+        start = time.perf_counter()
+        result = await analyzer.analyze_symptoms_async("咳嗽，有痰，发烧")
+        elapsed = (time.perf_counter() - start) * 1000
+        print(
+            f"截止时间 {analyzer.deadline * 1000:.0f}ms: 实际 {elapsed:.0f}ms 返回 "
+            f"{result.get('source', 'ai')} -> {result['recommended_department']}（{result.get('ai_error')}）"
+        )
+        ok = result.get("source") == "local_triage" and elapsed < args.slow_latency * 1000
+    finally:
+        await client.close()
+        await runner.cleanup()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
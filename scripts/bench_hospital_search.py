@@ -0,0 +1,100 @@
+"""
+医院搜索基准
+生成一个城市范围内的随机医院目录，对比逐个过滤并按距离排序的线性查找
+与 HospitalCatalog（科室倒排索引 + 网格索引）查找最近K家医院的耗时，并校验结果一致
+
+用法：
+    python scripts/bench_hospital_search.py --hospitals 2000 --queries 5000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agents.hospital_catalog import HospitalCatalog, haversine_km  # noqa: E402
+
+DEPARTMENTS = [
+    "内科", "外科", "儿科", "妇科", "眼科", "口腔科", "皮肤科", "耳鼻喉科", "骨科",
+    "心血管内科", "消化内科", "呼吸内科", "神经内科", "内分泌科", "中医内科", "针灸科", "康复科"
+]
+
+
+def make_hospitals(count: int, rng: random.Random) -> list:
+    """在约40公里见方的范围内随机生成医院"""
+    return [
+        {
+            "id": f"h{i:05d}",
+            "name": f"医院{i}",
+            "lat": 30.1 + rng.random() * 0.36,
+            "lng": 120.0 + rng.random() * 0.42,
+            "departments": rng.sample(DEPARTMENTS, rng.randint(2, 10))
+        }
+        for i in range(count)
+    ]
+
+
+def linear_search(hospitals: list, department, lat: float, lng: float, limit: int) -> list:
+    """原来的做法：逐个过滤科室，再对全部结果计算距离并排序"""
+    matched = [
+        h for h in hospitals
+        if department is None or department in h["departments"] or any(department in d for d in h["departments"])
+    ]
+    matched.sort(key=lambda h: haversine_km(lat, lng, h["lat"], h["lng"]))
+    return [h["id"] for h in matched[:limit]]
+
+
+def timed(func, queries) -> tuple:
+    results = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(func(*query))
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    return results, statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="医院搜索基准")
+    parser.add_argument("--hospitals", type=int, default=2000, help="医院数量")
+    parser.add_argument("--queries", type=int, default=5000, help="查询次数")
+    parser.add_argument("--limit", type=int, default=10, help="每次返回的医院数")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    hospitals = make_hospitals(args.hospitals, rng)
+    catalog = HospitalCatalog()
+    catalog.load_records(hospitals)
+
+    queries = [
+        (
+            rng.choice(DEPARTMENTS + [None]),
+            30.1 + rng.random() * 0.36,
+            120.0 + rng.random() * 0.42,
+            args.limit
+        )
+        for _ in range(args.queries)
+    ]
+
+    expected, linear_p50, linear_p99 = timed(lambda *q: linear_search(hospitals, *q), queries)
+    actual, index_p50, index_p99 = timed(
+        lambda department, lat, lng, limit: [h["id"] for h in catalog.search(department, lat, lng, limit)],
+        queries
+    )
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+
+    print(f"{args.hospitals}家医院, {args.queries}次查询, 每次返回最近{args.limit}家\n")
+    print(f"{'方式':<10}{'P50(us)':>10}{'P99(us)':>10}")
+    print(f"{'线性查找':<10}{linear_p50:>10.1f}{linear_p99:>10.1f}")
+    print(f"{'索引查找':<10}{index_p50:>10.1f}{index_p99:>10.1f}")
+    print(f"\n结果不一致: {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
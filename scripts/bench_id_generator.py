@@ -0,0 +1,80 @@
+"""
+ID生成器吞吐量测试
+多个进程、每个进程多个线程同时生成挂号单号，统计每秒生成数量。
+分别测试显式配置工作节点ID和根据进程号自动生成两种情况；是否重复由 tests/test_id_generator.py 检查
+
+用法：
+    python scripts/bench_id_generator.py --processes 4 --threads 8 --count 50000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "bench-id-generator")
+os.environ.setdefault("SECRET_KEY", "bench-id-generator")
+
+
+def generate(worker_id, threads: int, count: int, queue):
+    """在子进程中用多个线程生成ID"""
+    from id_generator import SnowflakeGenerator
+
+    generator = SnowflakeGenerator(worker_id)
+    results = [None] * threads
+
+    def run(index: int):
+        results[index] = [generator.next_id() for _ in range(count)]
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    ids = [value for chunk in results for value in chunk]
+    queue.put((generator.worker_id, elapsed, ids))
+
+
+def run_case(name: str, worker_ids: list, threads: int, count: int):
+    queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=generate, args=(worker_id, threads, count, queue))
+        for worker_id in worker_ids
+    ]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    total = sum(len(ids) for _, _, ids in results)
+    rates = [len(ids) / elapsed for _, elapsed, ids in results]
+    used_workers = sorted(worker_id for worker_id, _, _ in results)
+
+    print(f"[{name}] 工作节点ID: {used_workers}")
+    print(f"  共生成 {total} 个")
+    print(f"  单进程 {min(rates):,.0f} ~ {max(rates):,.0f} 个/秒，合计 {sum(rates):,.0f} 个/秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ID生成器吞吐量测试")
+    parser.add_argument("--processes", type=int, default=4, help="进程数")
+    parser.add_argument("--threads", type=int, default=8, help="每个进程的线程数")
+    parser.add_argument("--count", type=int, default=50000, help="每个线程生成的ID数")
+    args = parser.parse_args()
+
+    # 使用spawn与uvicorn多worker的启动方式一致
+    multiprocessing.set_start_method("spawn")
+
+    run_case("配置WORKER_ID", list(range(args.processes)), args.threads, args.count)
+    run_case("自动生成WORKER_ID", [None] * args.processes, args.threads, args.count)
+
+
+if __name__ == "__main__":
+    main()
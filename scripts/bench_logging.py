@@ -0,0 +1,161 @@
+"""
+日志开销基准
+模拟一次请求产生的日志（症状分析、医院搜索、号源查询、缓存命中、创建预约），
+测量请求线程在日志调用上花费的时间：
+
+- before: 原来的配置，loguru 同步写控制台和DEBUG级别文件，f-string 格式化，热点路径DEBUG全部输出
+- after: setup_logging()，后台线程批量写入，{} 占位符延迟格式化，热点路径DEBUG按比例采样
+- after-json: 同 after，输出JSON
+
+控制台输出写到 /dev/null，日志文件写到临时目录。--disk-latency-ms 模拟慢磁盘（每次flush等待）
+
+用法：
+    python scripts/bench_logging.py --requests 20000
+    python scripts/bench_logging.py --requests 2000 --disk-latency-ms 1
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+import logging_config
+from logging_config import CONSOLE_FORMAT, DailyFile, debug_sampled, setup_logging, shutdown_logging
+
+
+SYMPTOMS = "最近三天持续头痛，伴有低烧和咳嗽，晚上咳得更厉害，偶尔胸闷，没有呕吐" * 2
+
+
+class SlowFile:
+    """每次flush等待一段时间的文件，模拟慢磁盘"""
+
+    def __init__(self, path: str, latency: float):
+        self._file = open(path, "a", encoding="utf-8")
+        self.latency = latency
+
+    def write(self, text: str):
+        self._file.write(text)
+
+    def flush(self):
+        self._file.flush()
+        if self.latency:
+            time.sleep(self.latency)
+
+    def close(self):
+        self._file.close()
+
+
+def request_before(i: int):
+    user, department = f"用户{i % 100}", "呼吸内科"
+    logger.info(f"症状分析: 用户{user} - {SYMPTOMS[:30]}... -> {department}")
+    logger.debug(f"症状分析命中缓存: {SYMPTOMS[:50]}")
+    logger.info(f"搜索医院: 地点=城区, 科室={department}, 找到3家")
+    logger.info(f"获取号源: 医院=h001, 科室={department}, 日期=2024-01-01")
+    logger.info(f"创建预约: 用户{user} - 市第一人民医院/{department}")
+
+
+def request_after(i: int):
+    user, department = f"用户{i % 100}", "呼吸内科"
+    logger.info("症状分析: 用户{} - {}... -> {}", user, SYMPTOMS[:30], department)
+    debug_sampled("症状分析命中缓存: {}", SYMPTOMS[:50])
+    debug_sampled("搜索医院: 地点={}, 科室={}, 找到{}家", "城区", department, 3)
+    debug_sampled("获取号源: 医院={}, 科室={}, 日期={}", "h001", department, "2024-01-01")
+    logger.info("创建预约: 用户{} - {}/{}", user, "市第一人民医院", department)
+
+
+def configure_before(log_dir: str, devnull, disk_latency: float):
+    logger.remove()
+    logger.add(devnull, format=CONSOLE_FORMAT, level="INFO")
+    if disk_latency:
+        logger.add(SlowFile(os.path.join(log_dir, "before.log"), disk_latency), level="DEBUG")
+    else:
+        logger.add(
+            os.path.join(log_dir, "medical_escort_{time:YYYY-MM-DD}.log"),
+            rotation="00:00",
+            retention="30 days",
+            level="DEBUG"
+        )
+
+
+def slow_down_daily_file(disk_latency: float):
+    flush = DailyFile.flush
+
+    def slow_flush(self):
+        flush(self)
+        time.sleep(disk_latency)
+
+    DailyFile.flush = slow_flush
+
+
+def configure_after(log_dir: str, devnull, log_format: str, sample_rate: float):
+    setup_logging(
+        console_level="INFO",
+        file_level="DEBUG",
+        log_dir=log_dir,
+        log_format=log_format,
+        use_queue=True,
+        debug_sample_rate=sample_rate,
+        console=devnull
+    )
+
+
+def measure(request, count: int) -> list:
+    # 预热
+    for i in range(min(200, count)):
+        request(i)
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        request(i)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def report(name: str, timings: list, total_s: float):
+    ordered = sorted(timings)
+    p99 = ordered[int(len(ordered) * 0.99) - 1]
+    print(
+        f"{name:<12} 平均 {statistics.mean(timings):8.1f}us  p50 {statistics.median(timings):8.1f}us  "
+        f"p99 {p99:8.1f}us  最大 {ordered[-1]:9.1f}us  （含写完全部日志共 {total_s:.2f}s）"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志开销基准")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--disk-latency-ms", type=float, default=0.0, help="模拟慢磁盘，每次flush等待的毫秒数")
+    parser.add_argument("--sample-rate", type=float, default=0.01, help="热点路径DEBUG日志采样比例")
+    args = parser.parse_args()
+    disk_latency = args.disk_latency_ms / 1000
+
+    if disk_latency:
+        slow_down_daily_file(disk_latency)
+
+    print(f"每个请求5条日志，共{args.requests}个请求，慢磁盘 {args.disk_latency_ms}ms/flush")
+    with open(os.devnull, "w") as devnull, tempfile.TemporaryDirectory() as log_dir:
+        modes = [
+            ("before", lambda: configure_before(log_dir, devnull, disk_latency), request_before),
+            ("after", lambda: configure_after(log_dir, devnull, "text", args.sample_rate), request_after),
+            ("after-json", lambda: configure_after(log_dir, devnull, "json", args.sample_rate), request_after),
+        ]
+        results = {}
+        for name, configure, request in modes:
+            configure()
+            start = time.perf_counter()
+            timings = measure(request, args.requests)
+            # 包括后台线程写完队列中的日志
+            shutdown_logging()
+            logger.remove()
+            results[name] = statistics.mean(timings)
+            report(name, timings, time.perf_counter() - start)
+            logging_config._writers.clear()
+
+    print(f"after 每个请求的日志开销为 before 的 {results['after'] / results['before']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
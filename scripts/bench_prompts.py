@@ -0,0 +1,143 @@
+"""
+症状分析提示词的token数对比
+用一组模拟患者（病史长短不一）比较两种提示词的token数：
+
+- before: 原来的提示词，科室列表和回答格式每次拼在用户消息里，病史、过敏史原样拼入
+- after: PromptBuilder，静态部分放在只生成一次的系统消息中，病史、过敏史按token预算压缩
+
+两边都使用【推荐科室】【紧急程度】【就医建议】文本格式，只比较提示词构建方式的差别；
+按 SYMPTOM_OUTPUT_FORMAT 要求JSON输出时系统提示词和 response_format 增加的token数单独列出。
+同时统计配置 OPENAI_FAST_MODEL 后路由到快速模型的请求比例。token数在本地计算，不调用接口
+
+用法：
+    python scripts/bench_prompts.py --patients 1000
+    python scripts/bench_prompts.py --field-budget 40 --fast-model gpt-4o-mini
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench-prompts")
+os.environ.setdefault("SECRET_KEY", "bench-prompts")
+
+from agents.prompt_builder import PromptBuilder  # noqa: E402
+from agents.symptom_analyzer import SymptomAnalyzer  # noqa: E402
+
+
+SYMPTOMS = [
+    "头晕",
+    "咳嗽两天，有点发烧",
+    "最近一周晚上睡不着，白天没精神，偶尔心慌",
+    "膝盖疼，上下楼梯更明显，早上起来关节发僵，活动一会儿好一些，已经有半年了",
+    "这几天总觉得胸口闷，走路快了就喘不上气，休息一会儿能缓解，以前没有这样过，晚上平躺也有点憋",
+]
+DISEASES = [
+    "高血压", "糖尿病", "冠心病", "慢性支气管炎", "骨质疏松", "脑梗塞后遗症", "慢性胃炎",
+    "前列腺增生", "白内障术后", "甲状腺功能减退", "慢性肾病3期", "房颤，长期服用华法林",
+]
+ALLERGIES = ["青霉素", "头孢类", "磺胺类", "阿司匹林", "海鲜", "花粉"]
+
+
+def make_patients(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    patients = []
+    for _ in range(count):
+        info = {"age": rng.randint(60, 90), "gender": rng.choice(["男", "女"])}
+        # 部分患者填写了很长的病史（包括重复录入）
+        diseases = rng.sample(DISEASES, rng.randint(0, 6))
+        if diseases and rng.random() < 0.3:
+            diseases = diseases * rng.randint(2, 4)
+        if diseases:
+            info["chronic_diseases"] = "，".join(diseases)
+        if rng.random() < 0.4:
+            info["allergies"] = "、".join(rng.sample(ALLERGIES, rng.randint(1, 3)))
+        patients.append((rng.choice(SYMPTOMS), info))
+    return patients
+
+
+def build_before(analyzer: SymptomAnalyzer, symptoms: str, patient_info: dict) -> list:
+    """原来的提示词（文本格式回答）"""
+    prompt = f"患者症状：{symptoms}\n\n患者信息：\n"
+    prompt += f"- 年龄：{patient_info['age']}岁\n- 性别：{patient_info['gender']}\n"
+    if patient_info.get("chronic_diseases"):
+        prompt += f"- 既往病史：{patient_info['chronic_diseases']}\n"
+    if patient_info.get("allergies"):
+        prompt += f"- 过敏史：{patient_info['allergies']}\n"
+    prompt += "\n" + analyzer._build_system_prompt(structured=False).split("\n\n", 1)[1]
+    return [
+        {
+            "role": "system",
+            "content": "你是一个专业的医疗导诊助手，帮助患者分析症状并推荐合适的就医科室。"
+                     "你的回答要简洁明了，适合老年人理解。"
+        },
+        {"role": "user", "content": prompt}
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="症状分析提示词token数对比")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--field-budget", type=int, default=60)
+    parser.add_argument("--simple-max-tokens", type=int, default=80)
+    parser.add_argument("--fast-model", default="gpt-4o-mini")
+    parser.add_argument("--tokenizer", default="auto", help="auto 或 estimate")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    analyzer = SymptomAnalyzer()
+
+    def builder(structured: bool) -> PromptBuilder:
+        return PromptBuilder(
+            analyzer._build_system_prompt(structured=structured),
+            fast_model=args.fast_model,
+            field_budget=args.field_budget,
+            simple_max_tokens=args.simple_max_tokens,
+            tokenizer=args.tokenizer
+        )
+
+    analyzer.prompt_builder = builder(structured=True)
+    analyzer.text_prompt_builder = builder(structured=False)
+    counter = analyzer.prompt_builder.counter
+    patients = make_patients(args.patients, args.seed)
+
+    before, after, after_json, saved, fast = [], [], [], [], 0
+    start = time.perf_counter()
+    for symptoms, info in patients:
+        request = analyzer._prepare_request(symptoms, info, structured=False)
+        after.append(request["prompt_tokens"])
+        saved.append(request["tokens_saved"])
+        fast += request["model"] == args.fast_model
+    build_ms = (time.perf_counter() - start) * 1000 / len(patients)
+    for symptoms, info in patients:
+        before.append(counter.count_messages(build_before(analyzer, symptoms, info)))
+        after_json.append(analyzer._prepare_request(symptoms, info, structured=True)["prompt_tokens"])
+
+    print(f"{len(patients)}个请求，分词方式: {'tiktoken' if counter.exact else '估算'}")
+    print(f"系统提示词（每个模型只计算一次）: {analyzer.text_prompt_builder.system_tokens} tokens")
+    for name, values in (("before", before), ("after", after)):
+        ordered = sorted(values)
+        print(
+            f"{name:<7} 平均 {statistics.mean(values):7.1f}  p50 {statistics.median(values):6.0f}  "
+            f"p99 {ordered[int(len(ordered) * 0.99) - 1]:6.0f}  最大 {ordered[-1]:6.0f} tokens"
+        )
+    print(f"压缩病史、过敏史共节省 {sum(saved)} tokens，平均每个请求 {statistics.mean(saved):.1f}")
+    print(f"after 的提示词token数为 before 的 {sum(after) / sum(before):.1%}（相同的文本回答格式）")
+
+    # JSON输出：系统提示词中的字段说明，以及随请求发送的 response_format
+    response_format = analyzer._build_response_format()
+    schema_tokens = counter.count(json.dumps(response_format, ensure_ascii=False)) if response_format else 0
+    prompt_overhead = statistics.mean(after_json) - statistics.mean(after)
+    print(
+        f"JSON输出（{analyzer.output_format}）额外: 系统提示词 {prompt_overhead:+.1f} tokens，"
+        f"response_format 按JSON文本估算约 {schema_tokens} tokens"
+    )
+    print(f"路由到 {args.fast_model} 的请求: {fast / len(patients):.1%}")
+    print(f"构建提示词平均耗时 {build_ms:.3f}ms")
+
+if __name__ == "__main__":
+    main()
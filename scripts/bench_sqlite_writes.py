@@ -0,0 +1,143 @@
+"""
+SQLite并发写入基准
+模拟多个客户端同时写入指导日志（get_step_guidance）并读取预约列表，
+对比默认引擎（回滚日志模式）和 database.py 中调优后的引擎（WAL + 连接池）
+
+用法：
+    python scripts/bench_sqlite_writes.py --clients 50 --writes 40
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "unused.db"))
+os.environ["MONGODB_URL"] = ""
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from datetime import datetime  # noqa: E402
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker  # noqa: E402
+from database import create_async_db_engine  # noqa: E402
+from models import Base, User, Appointment, GuidanceLog  # noqa: E402
+
+
+def prepare(path: str) -> int:
+    """建表并写入一个用户和一些预约，返回用户ID"""
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    with sync_engine.begin() as conn:
+        user_id = conn.execute(User.__table__.insert().values(name="测试", phone="13800000000")).inserted_primary_key[0]
+        conn.execute(Appointment.__table__.insert(), [
+            {"user_id": user_id, "hospital_name": "市第一人民医院", "department": "内科",
+             "appointment_date": datetime.now(), "status": "confirmed"}
+            for _ in range(200)
+        ])
+    sync_engine.dispose()
+    return user_id
+
+
+async def writer(session_factory, user_id: int, writes: int, stats: dict):
+    for i in range(writes):
+        try:
+            async with session_factory() as db:
+                db.add(GuidanceLog(
+                    user_id=user_id,
+                    guidance_type="registration",
+                    guidance_content="请到一楼挂号窗口挂号",
+                    step_number=i
+                ))
+                await db.commit()
+            stats["writes"] += 1
+        except Exception as e:
+            stats["errors"] += 1
+            stats["last_error"] = str(e).splitlines()[0]
+
+
+async def reader(session_factory, user_id: int, stop: asyncio.Event, stats: dict):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            async with session_factory() as db:
+                await db.execute(
+                    select(Appointment.id, Appointment.status)
+                    .where(Appointment.user_id == user_id)
+                    .order_by(Appointment.appointment_date.desc())
+                    .limit(20)
+                )
+            stats["read_latency"].append(time.perf_counter() - start)
+        except Exception:
+            stats["errors"] += 1
+
+
+async def run(name: str, engine, user_id: int, clients: int, writes: int, readers: int) -> dict:
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    stats = {"writes": 0, "errors": 0, "last_error": None, "read_latency": []}
+    stop = asyncio.Event()
+
+    reader_tasks = [asyncio.create_task(reader(session_factory, user_id, stop, stats)) for _ in range(readers)]
+    start = time.perf_counter()
+    await asyncio.gather(*[writer(session_factory, user_id, writes, stats) for _ in range(clients)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(*reader_tasks)
+    await engine.dispose()
+
+    latency = sorted(stats["read_latency"]) or [0.0]
+    return {
+        "name": name,
+        "writes_per_sec": stats["writes"] / elapsed,
+        "writes": stats["writes"],
+        "errors": stats["errors"],
+        "last_error": stats["last_error"],
+        "reads": len(stats["read_latency"]),
+        "read_p95_ms": latency[int(len(latency) * 0.95) - 1 if len(latency) > 1 else 0] * 1000,
+        "elapsed": elapsed
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="SQLite并发写入基准")
+    parser.add_argument("--clients", type=int, default=50, help="并发写入客户端数")
+    parser.add_argument("--writes", type=int, default=40, help="每个客户端写入次数")
+    parser.add_argument("--readers", type=int, default=10, help="并发读取客户端数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    results = []
+
+    # 调整前：与原来的 create_engine(settings.database_url) 相同，默认连接池和回滚日志
+    path = os.path.join(workdir, "default.db")
+    user_id = prepare(path)
+    results.append(await run(
+        "默认配置", create_async_engine(f"sqlite+aiosqlite:///{path}"),
+        user_id, args.clients, args.writes, args.readers
+    ))
+
+    # 调整后：database.py 的连接池配置和 WAL 等 PRAGMA
+    path = os.path.join(workdir, "tuned.db")
+    user_id = prepare(path)
+    results.append(await run(
+        "WAL调优", create_async_db_engine(f"sqlite:///{path}"),
+        user_id, args.clients, args.writes, args.readers
+    ))
+
+    print(f"并发写入 {args.clients}客户端 x {args.writes}次，并发读取 {args.readers}客户端\n")
+    print(f"{'配置':<8}{'写入/秒':>10}{'成功':>8}{'失败':>6}{'读取次数':>10}{'读取P95(ms)':>14}")
+    for r in results:
+        print(
+            f"{r['name']:<8}{r['writes_per_sec']:>10.0f}{r['writes']:>8}{r['errors']:>6}"
+            f"{r['reads']:>10}{r['read_p95_ms']:>14.1f}"
+        )
+        if r["last_error"]:
+            print(f"  最后一次错误: {r['last_error']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
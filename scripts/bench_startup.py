@@ -0,0 +1,86 @@
+"""
+启动时间基准
+在全新的Python进程中分别测量：导入 api.main 的耗时、应用启动（lifespan）耗时、
+第一次请求 /health 的耗时，以及第一次调用需要Agent的接口的耗时，多次运行取中位数
+
+用法：
+    python scripts/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中执行，输出一行JSON
+CHILD = r"""
+import json, time
+start = time.perf_counter()
+import api.main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(api.main.app) as client:
+    started = time.perf_counter()
+    client.get("/health")
+    health = time.perf_counter()
+    client.get("/api/guidance/steps")
+    agent = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - imported) * 1000,
+    "first_health_ms": (health - started) * 1000,
+    "first_agent_ms": (agent - health) * 1000,
+    "modules": len(__import__("sys").modules)
+}))
+"""
+
+
+def run_once(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动时间基准")
+    parser.add_argument("--runs", type=int, default=5, help="运行次数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": ROOT,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "bench"),
+        "SECRET_KEY": env.get("SECRET_KEY", "bench"),
+        "REMINDER_SCHEDULER_ENABLED": "false"
+    })
+
+    # 第一次运行预热文件缓存和 .pyc，不计入结果
+    run_once(env)
+    results = [run_once(env) for _ in range(args.runs)]
+
+    print(f"运行 {args.runs} 次，取中位数\n")
+    for key, label in [
+        ("import_ms", "导入 api.main"),
+        ("startup_ms", "应用启动"),
+        ("first_health_ms", "首次 /health"),
+        ("first_agent_ms", "首次Agent接口"),
+    ]:
+        values = [r[key] for r in results]
+        print(f"{label:<14}{statistics.median(values):>10.1f} ms")
+    print(f"{'已加载模块数':<14}{statistics.median(r['modules'] for r in results):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
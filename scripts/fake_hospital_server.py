@@ -0,0 +1,143 @@
+"""
+本地模拟医院HIS接口
+实现医院接口客户端使用的号源查询、挂号、取消和状态查询接口，可以模拟延迟、随机错误和整家医院不可用，
+用于在没有真实HIS系统时测试 agents/hospital_client.py
+
+用法：
+    python scripts/fake_hospital_server.py --port 9100 --latency 0.05 --failure-rate 0.1 --down h003
+    然后在 .env 中配置 HOSPITAL_API_BASE_URL=http://127.0.0.1:9100
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+from aiohttp import web
+
+SLOTS = [
+    ("08:00-08:30", "张主任", "主任医师"),
+    ("08:30-09:00", "李医生", "副主任医师"),
+    ("09:00-09:30", "王医生", "主治医师"),
+    ("09:30-10:00", "赵医生", "主治医师"),
+    ("10:00-10:30", "张主任", "主任医师"),
+    ("14:00-14:30", "孙医生", "副主任医师"),
+    ("14:30-15:00", "周医生", "主治医师"),
+    ("15:00-15:30", "吴医生", "主任医师"),
+    ("15:30-16:00", "郑医生", "主治医师"),
+]
+
+
+def create_app(latency: float = 0.0, failure_rate: float = 0.0, down=()) -> web.Application:
+    """
+    创建模拟服务
+
+    Args:
+        latency: 每个请求的延迟（秒）
+        failure_rate: 随机返回503的比例
+        down: 始终返回503的医院ID
+    """
+    app = web.Application()
+    state = {
+        "latency": latency,
+        "failure_rate": failure_rate,
+        "down": set(down),
+        "hits": Counter(),  # 接口 -> 请求次数
+        "booked": {},  # (医院, 科室, 日期, 时间) -> 单号
+        "appointments": {},  # 单号 -> 预约
+        "idempotency": {}  # 幂等键 -> 单号
+    }
+    app["state"] = state
+
+    @web.middleware
+    async def simulate(request, handler):
+        state["hits"][request.match_info.route.name] += 1
+        if state["latency"]:
+            await asyncio.sleep(state["latency"])
+        hospital_id = request.match_info.get("hospital_id")
+        if hospital_id in state["down"] or random.random() < state["failure_rate"]:
+            return web.json_response({"error": "service unavailable"}, status=503)
+        return await handler(request)
+
+    app.middlewares.append(simulate)
+
+    async def get_slots(request):
+        hospital_id = request.match_info["hospital_id"]
+        department = request.query.get("department")
+        date = request.query.get("date")
+        if not department or not date:
+            return web.json_response({"error": "department and date are required"}, status=400)
+        return web.json_response({"slots": [
+            {
+                "time": time_text,
+                "available": (hospital_id, department, date, time_text) not in state["booked"],
+                "doctor": doctor,
+                "title": title
+            }
+            for time_text, doctor, title in SLOTS
+        ]})
+
+    async def book(request):
+        hospital_id = request.match_info["hospital_id"]
+        key = request.headers.get("Idempotency-Key")
+        if key in state["idempotency"]:
+            return web.json_response(state["appointments"][state["idempotency"][key]])
+
+        body = await request.json()
+        time_text = next(
+            (t for t, _, _ in SLOTS if body.get("appointment_time", "")[11:16] == t[:5]), None
+        )
+        if time_text is None:
+            return web.json_response({"error": "invalid appointment_time"}, status=400)
+        slot = (hospital_id, body.get("department"), body["appointment_time"][:10], time_text)
+        if slot in state["booked"]:
+            return web.json_response({"error": "slot already booked"}, status=409)
+
+        number = key or f"HIS{len(state['appointments']) + 1:08d}"
+        appointment = {"appointment_number": number, "status": "confirmed", "slot": list(slot)}
+        state["booked"][slot] = number
+        state["appointments"][number] = appointment
+        if key:
+            state["idempotency"][key] = number
+        return web.json_response(appointment)
+
+    async def cancel(request):
+        appointment = state["appointments"].get(request.match_info["number"])
+        if appointment is None:
+            return web.json_response({"error": "not found"}, status=404)
+        if appointment["status"] != "cancelled":
+            appointment["status"] = "cancelled"
+            state["booked"].pop(tuple(appointment["slot"]), None)
+        return web.json_response(appointment)
+
+    async def get_status(request):
+        appointment = state["appointments"].get(request.match_info["number"])
+        if appointment is None:
+            return web.json_response({"error": "not found"}, status=404)
+        return web.json_response({
+            "appointment_number": appointment["appointment_number"],
+            "status": appointment["status"],
+            "queue_number": random.randint(0, 20),
+            "estimated_wait_time": "30分钟"
+        })
+
+    app.router.add_get("/hospitals/{hospital_id}/slots", get_slots, name="slots")
+    app.router.add_post("/hospitals/{hospital_id}/appointments", book, name="book")
+    app.router.add_delete("/hospitals/{hospital_id}/appointments/{number}", cancel, name="cancel")
+    app.router.add_get("/hospitals/{hospital_id}/appointments/{number}", get_status, name="status")
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟医院HIS接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="随机返回503的比例")
+    parser.add_argument("--down", default="", help="始终不可用的医院ID，逗号分隔")
+    args = parser.parse_args()
+
+    down = [h for h in args.down.split(",") if h]
+    web.run_app(create_app(args.latency, args.failure_rate, down), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
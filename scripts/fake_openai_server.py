@@ -0,0 +1,158 @@
+"""
+本地模拟OpenAI接口
+实现 /v1/chat/completions（包括 stream=True），可以模拟延迟、慢请求长尾和随机错误，
+用于在离线环境中测试症状分析的对冲请求、截止时间和结构化输出解析
+
+要求结构化输出（response_format）时返回JSON，否则返回【推荐科室】【紧急程度】【就医建议】格式的文本。
+--text-only-models 中的模型收到 response_format 时返回400，模拟不支持结构化输出的模型
+
+用法：
+    python scripts/fake_openai_server.py --port 9200 --latency 0.2 --slow-rate 0.05 --slow-latency 3
+    然后在 .env 中配置 OPENAI_BASE_URL=http://127.0.0.1:9200/v1
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from aiohttp import web
+
+ANSWER = {
+    "recommended_department": "呼吸内科",
+    "alternative_departments": ["内科"],
+    "urgency": "normal",
+    "advice": "多喝水，注意休息。如果发烧超过三天或者呼吸困难，请尽快到医院就诊。"
+}
+
+
+def answer_text() -> str:
+    return (
+        f"【推荐科室】{ANSWER['recommended_department']}、{'、'.join(ANSWER['alternative_departments'])}\n"
+        f"【紧急程度】{ANSWER['urgency']}\n"
+        f"【就医建议】{ANSWER['advice']}"
+    )
+
+
+def create_app(
+    latency: float = 0.0,
+    slow_rate: float = 0.0,
+    slow_latency: float = 0.0,
+    failure_rate: float = 0.0,
+    text_only_models=()
+) -> web.Application:
+    """
+    创建模拟服务
+
+    Args:
+        latency: 每个请求的基础延迟（秒），实际延迟在 ±20% 内随机
+        slow_rate: 慢请求的比例
+        slow_latency: 慢请求的延迟（秒）
+        failure_rate: 随机返回500的比例
+        text_only_models: 不支持 response_format 的模型
+    """
+    app = web.Application()
+    state = {
+        "latency": latency,
+        "slow_rate": slow_rate,
+        "slow_latency": slow_latency,
+        "failure_rate": failure_rate,
+        "text_only_models": set(text_only_models),
+        "hits": Counter(),  # 模型 -> 请求次数
+        "slow": 0,
+        "cancelled": 0  # 客户端在返回前断开（如对冲请求中被取消的一方）
+    }
+    app["state"] = state
+
+    def request_latency() -> float:
+        if state["slow_rate"] and random.random() < state["slow_rate"]:
+            state["slow"] += 1
+            return state["slow_latency"]
+        return state["latency"] * random.uniform(0.8, 1.2)
+
+    async def chat_completions(request):
+        try:
+            body = await request.json()
+        except ConnectionResetError:
+            # 客户端在发送完请求前断开
+            state["cancelled"] += 1
+            return web.Response(status=499)
+        model = body.get("model", "")
+        state["hits"][model] += 1
+
+        if body.get("response_format") and model in state["text_only_models"]:
+            return web.json_response({"error": {
+                "message": f"Invalid parameter: 'response_format' of type "
+                           f"'{body['response_format'].get('type')}' is not supported with this model.",
+                "type": "invalid_request_error",
+                "param": "response_format"
+            }}, status=400)
+
+        await asyncio.sleep(request_latency())
+        if request.transport is None or request.transport.is_closing():
+            state["cancelled"] += 1
+            return web.Response(status=499)
+        if random.random() < state["failure_rate"]:
+            return web.json_response({"error": {"message": "server error", "type": "server_error"}}, status=500)
+
+        content = json.dumps(ANSWER, ensure_ascii=False) if body.get("response_format") else answer_text()
+        usage = {"prompt_tokens": 400, "completion_tokens": 80, "total_tokens": 480}
+        base = {
+            "id": f"chatcmpl-{random.getrandbits(48):012x}",
+            "created": int(time.time()),
+            "model": model
+        }
+
+        if not body.get("stream"):
+            return web.json_response({
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(data):
+            await response.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode())
+
+        for i in range(0, len(content), 8):
+            await send({**base, "object": "chat.completion.chunk", "choices": [{
+                "index": 0, "delta": {"content": content[i:i + 8]}, "finish_reason": None
+            }]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟OpenAI接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency", type=float, default=0.2, help="基础延迟（秒）")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="慢请求的比例")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="慢请求的延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="随机返回500的比例")
+    parser.add_argument("--text-only-models", default="", help="不支持 response_format 的模型，逗号分隔")
+    args = parser.parse_args()
+
+    text_only = [m for m in args.text_only_models.split(",") if m]
+    web.run_app(
+        create_app(args.latency, args.slow_rate, args.slow_latency, args.failure_rate, text_only),
+        host=args.host,
+        port=args.port
+    )
+
+
+if __name__ == "__main__":
+    main()
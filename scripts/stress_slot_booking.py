@@ -0,0 +1,107 @@
+"""
+号源并发预约压力测试
+在临时SQLite数据库（或 --database-url 指定的数据库）上同时发起大量预约请求，取消一半后再次并发预约，
+统计耗时和响应状态。不重复预约等正确性检查见 tests/test_slot_inventory.py
+
+用法：
+    python scripts/stress_slot_booking.py --requests 1000 --departments 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+parser = argparse.ArgumentParser(description="号源并发预约压力测试")
+parser.add_argument("--requests", type=int, default=1000, help="并发预约请求数")
+parser.add_argument("--departments", type=int, default=20, help="科室数，每个科室一天9个号源")
+parser.add_argument("--database-url", help="数据库地址，默认使用临时SQLite数据库")
+args = parser.parse_args()
+
+os.environ["DATABASE_URL"] = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "slots.db")
+os.environ["MONGODB_URL"] = ""
+os.environ["REMINDER_SCHEDULER_ENABLED"] = "false"
+os.environ.setdefault("OPENAI_API_KEY", "stress")
+os.environ.setdefault("SECRET_KEY", "stress")
+
+import httpx  # noqa: E402
+from loguru import logger  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from api.main import app, lifespan  # noqa: E402
+from database import AsyncSessionLocal  # noqa: E402
+from models import Appointment, User  # noqa: E402
+from slot_inventory import SLOT_TIMES, DEFAULT_SCHEDULE  # noqa: E402
+
+HOSPITAL_ID = "h001"
+DAY = date.today() + timedelta(days=1)
+
+
+async def create_users(count: int) -> list:
+    async with AsyncSessionLocal() as db:
+        users = [User(name=f"用户{i}", phone=f"139{i:08d}") for i in range(count)]
+        db.add_all(users)
+        await db.commit()
+        return [u.id for u in users]
+
+
+async def book(client: httpx.AsyncClient, user_id: int, department: str, time_text: str) -> int:
+    response = await client.post("/api/appointments/", json={
+        "user_id": user_id,
+        "hospital_id": HOSPITAL_ID,
+        "hospital_name": "市人民医院",
+        "department": department,
+        "appointment_date": f"{DAY.isoformat()}T{time_text[:5]}:00"
+    })
+    return response.status_code
+
+
+async def main():
+    logger.remove()
+    departments = [f"科室{i}" for i in range(args.departments)]
+    capacity = args.departments * sum(len(slots) for _, _, slots in DEFAULT_SCHEDULE)
+
+    async with lifespan(app):
+        user_ids = await create_users(args.requests)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://stress", timeout=120) as client:
+            rng = random.Random(7)
+            jobs = [
+                book(client, user_id, rng.choice(departments), rng.choice(SLOT_TIMES))
+                for user_id in user_ids
+            ]
+            start = time.perf_counter()
+            statuses = Counter(await asyncio.gather(*jobs))
+            elapsed = time.perf_counter() - start
+            print(f"{args.requests}个并发预约请求，{capacity}个号源，耗时{elapsed:.2f}秒，{args.requests / elapsed:.0f}个/秒")
+            print(f"响应状态: {dict(statuses)}")
+
+            # 取消一半后重新预约
+            async with AsyncSessionLocal() as db:
+                ids = (await db.scalars(
+                    select(Appointment.id).where(Appointment.status == "confirmed")
+                )).all()
+            cancelled = ids[::2]
+            start = time.perf_counter()
+            await asyncio.gather(*[client.put(f"/api/appointments/{i}/cancel") for i in cancelled])
+            elapsed = time.perf_counter() - start
+            print(f"取消{len(cancelled)}个预约，耗时{elapsed:.2f}秒")
+
+            rebook = [
+                book(client, user_id, rng.choice(departments), rng.choice(SLOT_TIMES))
+                for user_id in user_ids
+            ]
+            start = time.perf_counter()
+            statuses = Counter(await asyncio.gather(*rebook))
+            elapsed = time.perf_counter() - start
+            print(f"再次并发预约耗时{elapsed:.2f}秒，{args.requests / elapsed:.0f}个/秒，响应状态: {dict(statuses)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
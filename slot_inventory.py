@@ -0,0 +1,290 @@
+"""
+号源库存
+每位医生每天的号源存为一行，出诊和已预约的时间段各用一个位图表示。
+预约和释放都是带条件的单条 UPDATE（只有该位仍为空闲/已占用时才修改），
+并发预约同一时间段时只有一个能成功；可预约时间段的查询结果带短时缓存，预约和释放后立即失效
+"""
+from typing import Dict, List, Optional, Set, Tuple
+from datetime import date
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from agents.response_cache import ResponseCache
+from config import settings
+from models import DoctorSchedule
+from logging_config import debug_sampled
+
+
+# 每天的时间段，位图中第i位对应第i个时间段
+SLOT_TIMES = (
+    "08:00-08:30", "08:30-09:00", "09:00-09:30", "09:30-10:00", "10:00-10:30",
+    "14:00-14:30", "14:30-15:00", "15:00-15:30", "15:30-16:00",
+)
+
+# 没有排班数据时使用的默认排班：(医生, 职称, 出诊时间段)
+DEFAULT_SCHEDULE = (
+    ("张主任", "主任医师", (0, 4)),
+    ("李医生", "副主任医师", (1,)),
+    ("王医生", "主治医师", (2,)),
+    ("赵医生", "主治医师", (3,)),
+    ("孙医生", "副主任医师", (5,)),
+    ("周医生", "主治医师", (6,)),
+    ("吴医生", "主任医师", (7,)),
+    ("郑医生", "主治医师", (8,)),
+)
+
+
+def slot_index(time_text: str) -> Optional[int]:
+    """把 "08:00" 或 "08:00-08:30" 转换为时间段序号，不是有效时间段时返回None"""
+    start = time_text[:5]
+    for i, slot in enumerate(SLOT_TIMES):
+        if slot.startswith(start):
+            return i
+    return None
+
+
+def mask_of(slots) -> int:
+    """时间段序号列表 -> 位图"""
+    mask = 0
+    for i in slots:
+        mask |= 1 << i
+    return mask
+
+
+class DoctorUnavailableError(Exception):
+    """指定的医生当天没有排班，或在该时间段不出诊"""
+
+    def __init__(self, doctor_name: str, times: List[str]):
+        self.doctor_name = doctor_name
+        self.times = times  # 该医生当天的出诊时间段，没有排班时为空
+        if times:
+            message = f"{doctor_name}在该时间段不出诊，可预约时间段: {'、'.join(times)}"
+        else:
+            message = f"{doctor_name}当天没有排班"
+        super().__init__(message)
+
+
+class SlotInventory:
+    """号源库存"""
+
+    def __init__(self, cache_ttl: int = 5, cache_size: int = 4096):
+        self.cache_ttl = cache_ttl
+        self.cache = ResponseCache(max_size=cache_size, ttl=cache_ttl)
+        # 确认数据库中已有排班的 (医院, 科室, 日期)，避免每次预约都查询
+        self._seeded: Set[Tuple[str, str, date]] = set()
+
+        self.reserved = 0
+        self.conflicts = 0
+        self.released = 0
+
+    @staticmethod
+    def cache_key(hospital_id: str, department: str, day: date) -> str:
+        return f"slots:{hospital_id}:{department}:{day.isoformat()}"
+
+    def invalidate(self, hospital_id: str, department: str, day: date):
+        """号源变化后删除可预约时间段缓存"""
+        self.cache.delete(self.cache_key(hospital_id, department, day))
+
+    async def ensure_day(self, db: AsyncSession, hospital_id: str, department: str, day: date):
+        """当天还没有排班时按默认排班生成号源"""
+        key = (hospital_id, department, day)
+        if key in self._seeded:
+            return
+
+        exists = await db.scalar(
+            select(DoctorSchedule.id).where(
+                DoctorSchedule.hospital_id == hospital_id,
+                DoctorSchedule.department == department,
+                DoctorSchedule.date == day
+            ).limit(1)
+        )
+        if exists is None:
+            rows = [
+                {
+                    "hospital_id": hospital_id,
+                    "department": department,
+                    "doctor_name": doctor,
+                    "doctor_title": title,
+                    "date": day,
+                    "slot_mask": mask_of(slots),
+                    "booked_mask": 0,
+                    "version": 0
+                }
+                for doctor, title, slots in DEFAULT_SCHEDULE
+            ]
+            try:
+                # 并发请求同时生成时由唯一索引保证只插入一次
+                async with db.begin_nested():
+                    await db.execute(insert(DoctorSchedule), rows)
+            except IntegrityError:
+                pass
+        else:
+            # 只有查到已存在的排班才记下，刚插入的行还在调用方的事务中，
+            # 调用方回滚后（如号源已约满）需要重新生成
+            self._seeded.add(key)
+
+    async def get_availability(
+        self,
+        db: AsyncSession,
+        hospital_id: str,
+        department: str,
+        day: date
+    ) -> List[Dict]:
+        """
+        获取某天的全部时间段及是否可预约
+
+        Returns:
+            按时间排序的时间段列表，如 {"time": "08:00-08:30", "available": True, "doctor": "张主任", ...}
+        """
+        key = self.cache_key(hospital_id, department, day)
+        if self.cache_ttl > 0:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached["slots"]
+
+        await self.ensure_day(db, hospital_id, department, day)
+        await db.commit()
+        rows = (await db.execute(
+            select(
+                DoctorSchedule.doctor_name,
+                DoctorSchedule.doctor_title,
+                DoctorSchedule.slot_mask,
+                DoctorSchedule.booked_mask
+            ).where(
+                DoctorSchedule.hospital_id == hospital_id,
+                DoctorSchedule.department == department,
+                DoctorSchedule.date == day
+            )
+        )).all()
+
+        slots = []
+        for row in rows:
+            for i, time_text in enumerate(SLOT_TIMES):
+                bit = 1 << i
+                if row.slot_mask & bit:
+                    slots.append({
+                        "time": time_text,
+                        "available": not row.booked_mask & bit,
+                        "doctor": row.doctor_name,
+                        "title": row.doctor_title
+                    })
+        slots.sort(key=lambda s: (s["time"], s["doctor"]))
+
+        if self.cache_ttl > 0:
+            self.cache.set(key, {"slots": slots})
+        return slots
+
+    async def reserve(
+        self,
+        db: AsyncSession,
+        hospital_id: str,
+        department: str,
+        day: date,
+        index: int,
+        doctor_name: Optional[str] = None
+    ) -> Optional[Dict]:
+        """
+        占用一个号源，调用方提交；提交前回滚时号源自动释放，提交后需要调用 release 释放
+
+        Args:
+            db: 数据库会话，调用方负责提交
+            hospital_id: 医院ID
+            department: 科室
+            day: 日期
+            index: 时间段序号
+            doctor_name: 指定医生（可选），不指定时选择该时间段任一有号的医生
+
+        Returns:
+            {"schedule_id", "slot_index", "doctor_name", "slot_time"}，没有空闲号源时返回None
+
+        Raises:
+            DoctorUnavailableError: 指定的医生当天没有排班，或该时间段不出诊
+        """
+        await self.ensure_day(db, hospital_id, department, day)
+
+        bit = 1 << index
+        stmt = select(DoctorSchedule.id, DoctorSchedule.doctor_name).where(
+            DoctorSchedule.hospital_id == hospital_id,
+            DoctorSchedule.department == department,
+            DoctorSchedule.date == day,
+            DoctorSchedule.slot_mask.op("&")(bit) != 0,
+            DoctorSchedule.booked_mask.op("&")(bit) == 0
+        )
+        if doctor_name:
+            stmt = stmt.where(DoctorSchedule.doctor_name == doctor_name)
+        candidates = (await db.execute(stmt.order_by(DoctorSchedule.id))).all()
+
+        for schedule_id, doctor in candidates:
+            # 条件更新：只有该位仍为空闲时才占用，并发预约中只有一个会更新成功
+            result = await db.execute(
+                update(DoctorSchedule)
+                .where(
+                    DoctorSchedule.id == schedule_id,
+                    DoctorSchedule.booked_mask.op("&")(bit) == 0
+                )
+                .values(
+                    booked_mask=DoctorSchedule.booked_mask + bit,
+                    version=DoctorSchedule.version + 1
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                self.reserved += 1
+                return {
+                    "schedule_id": schedule_id,
+                    "slot_index": index,
+                    "doctor_name": doctor,
+                    "slot_time": SLOT_TIMES[index]
+                }
+            self.conflicts += 1
+
+        if doctor_name and not candidates:
+            slot_mask = await db.scalar(
+                select(DoctorSchedule.slot_mask).where(
+                    DoctorSchedule.hospital_id == hospital_id,
+                    DoctorSchedule.department == department,
+                    DoctorSchedule.date == day,
+                    DoctorSchedule.doctor_name == doctor_name
+                )
+            )
+            if slot_mask is None or not slot_mask & bit:
+                times = [t for i, t in enumerate(SLOT_TIMES) if slot_mask and slot_mask & (1 << i)]
+                raise DoctorUnavailableError(doctor_name, times)
+
+        debug_sampled("号源已约满: {}/{} {} {} {}", hospital_id, department, day, SLOT_TIMES[index], doctor_name or '')
+        return None
+
+    async def release(self, db: AsyncSession, schedule_id: int, index: int) -> bool:
+        """释放号源（取消预约时调用），调用方负责提交"""
+        bit = 1 << index
+        result = await db.execute(
+            update(DoctorSchedule)
+            .where(
+                DoctorSchedule.id == schedule_id,
+                DoctorSchedule.booked_mask.op("&")(bit) != 0
+            )
+            .values(
+                booked_mask=DoctorSchedule.booked_mask - bit,
+                version=DoctorSchedule.version + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            self.released += 1
+            return True
+        return False
+
+    def stats(self) -> Dict:
+        """预约统计"""
+        return {
+            "reserved": self.reserved,
+            "released": self.released,
+            "conflicts": self.conflicts,
+            "cache": self.cache.stats()
+        }
+
+
+slot_inventory = SlotInventory(
+    cache_ttl=settings.slot_cache_ttl,
+    cache_size=settings.slot_cache_size
+)
@@ -0,0 +1,31 @@
+"""
+测试公共配置
+在导入应用模块之前设置必需的环境变量，数据库使用临时目录中的SQLite文件
+"""
+import os
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TEST_DIR = tempfile.mkdtemp(prefix="medical-escort-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}"
+os.environ["MONGODB_URL"] = ""
+os.environ.setdefault("LOG_DIR", os.path.join(TEST_DIR, "logs"))
+os.environ["REMINDER_SCHEDULER_ENABLED"] = "false"
+
+
+@pytest.fixture
+async def client():
+    """通过ASGI直接调用应用的HTTP客户端，启动和关闭时执行应用的lifespan"""
+    import httpx
+    from api.main import app, lifespan
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as client:
+            yield client
@@ -0,0 +1,50 @@
+"""
+预约接口测试
+"""
+import itertools
+import pytest
+from database import AsyncSessionLocal
+from models import User
+
+_phones = itertools.count(13900000000)
+
+
+@pytest.fixture
+async def user_id(client):
+    async with AsyncSessionLocal() as db:
+        user = User(name="测试用户", phone=str(next(_phones)))
+        db.add(user)
+        await db.commit()
+        return user.id
+
+
+def booking(user_id: int, time_text: str, doctor_name=None) -> dict:
+    return {
+        "user_id": user_id,
+        "hospital_id": "h-api",
+        "hospital_name": "市人民医院",
+        "department": "心血管内科",
+        "doctor_name": doctor_name,
+        "appointment_date": f"2030-02-01T{time_text}:00"
+    }
+
+
+async def test_doctor_not_on_duty(client, user_id):
+    response = await client.post("/api/appointments/", json=booking(user_id, "09:00", "张主任"))
+    assert response.status_code == 400
+    assert "08:00-08:30" in response.json()["detail"]
+
+    response = await client.post("/api/appointments/", json=booking(user_id, "09:00", "不存在的医生"))
+    assert response.status_code == 404
+
+
+async def test_book_and_full(client, user_id):
+    response = await client.post("/api/appointments/", json=booking(user_id, "10:00", "张主任"))
+    assert response.status_code == 200
+    response = await client.post("/api/appointments/", json=booking(user_id, "10:00", "张主任"))
+    assert response.status_code == 409
+
+
+async def test_time_outside_slots_is_booked_without_inventory(client, user_id):
+    response = await client.post("/api/appointments/", json=booking(user_id, "11:15", "钱医生"))
+    assert response.status_code == 200
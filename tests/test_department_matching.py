@@ -0,0 +1,38 @@
+"""
+科室匹配测试
+使用 data/hospitals.json 中的科室和科室别名，每个科室建一家医院，检查按标准名称、别名、
+包含关系、缩写和错别字查找医院时匹配到的科室
+"""
+import json
+import pytest
+from agents.hospital_catalog import HospitalCatalog, DEFAULT_DATA_PATH
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    with open(DEFAULT_DATA_PATH, encoding="utf-8") as f:
+        data = json.load(f)
+    departments = sorted({d for hospital in data["hospitals"] for d in hospital.get("departments", [])})
+    catalog = HospitalCatalog()
+    catalog.load_records(
+        [{"id": name, "name": name, "departments": [name]} for name in departments],
+        department_aliases=data.get("department_aliases", {})
+    )
+    return catalog, len(departments)
+
+
+# (查询词, 应匹配的科室)，空列表表示不应匹配到任何科室
+@pytest.mark.parametrize("query, expected", [
+    ("心血管内科", ["心血管内科"]),
+    ("心内科", ["心血管内科"]),  # 别名
+    ("心内", ["心血管内科"]),  # 缩写，别名"心内科"的前缀
+    ("小儿", ["儿科"]),  # 缩写，别名"小儿科"的前缀
+    ("消化", ["消化内科"]),  # 科室名的一部分
+    ("内科", ["中医内科", "内科", "心血管内科", "消化内科"]),
+    ("心血管内科门诊", ["心血管内科"]),  # 查询词包含科室名
+    ("针炙科", ["针灸科"]),  # 错别字，近似匹配
+    ("眼科", []),
+])
+def test_department_matching(catalog, query, expected):
+    catalog, size = catalog
+    assert sorted(h["name"] for h in catalog.search(query, limit=size)) == sorted(expected)
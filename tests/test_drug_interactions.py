@@ -0,0 +1,54 @@
+"""
+药物相互作用索引测试
+"""
+import pytest
+from agents.drug_interactions import DrugInteractionIndex
+
+
+@pytest.fixture(scope="module")
+def index():
+    return DrugInteractionIndex()
+
+
+def allergy_warnings(result):
+    return {w["medications"][0]: (w["allergen"], w["severity"]) for w in result["warnings"] if w["type"] == "allergy"}
+
+
+@pytest.mark.parametrize("allergies, drug, allergen", [
+    # 交叉过敏的过敏原写在前面时，直接过敏仍然应该为禁用
+    ("头孢过敏，青霉素过敏", "阿莫西林", "青霉素"),
+    ("阿司匹林过敏，布洛芬过敏", "布洛芬", "非甾体抗炎药"),
+])
+def test_direct_allergy_beats_cross_reactivity(index, allergies, drug, allergen):
+    warnings = allergy_warnings(index.check([drug], allergies))
+    assert warnings[drug] == (allergen, "contraindicated")
+
+
+def test_cross_reactivity_only(index):
+    warnings = allergy_warnings(index.check(["阿莫西林", "头孢呋辛"], "青霉素过敏"))
+    assert warnings == {
+        "阿莫西林": ("青霉素", "contraindicated"),
+        "头孢呋辛": ("青霉素", "moderate"),
+    }
+
+
+@pytest.mark.parametrize("allergies", ["无青霉素过敏", "否认青霉素过敏史", "无青霉素、头孢过敏", "对青霉素不过敏"])
+def test_negated_allergy(index, allergies):
+    assert allergy_warnings(index.check(["阿莫西林"], allergies)) == {}
+
+
+def test_one_warning_per_pair(index):
+    warnings = [w for w in index.check(["华法林", "阿司匹林"])["warnings"] if w["type"] == "interaction"]
+    assert len(warnings) == 1
+    assert warnings[0]["severity"] == "major"
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("拜阿司匹灵(阿司匹林肠溶片)", "阿司匹林"),
+    ("阿莫西林胶囊0.25g", "阿莫西林"),
+    ("复方smz", "复方磺胺甲噁唑"),
+    ("克林霉素", None),
+    ("asmza", None),
+])
+def test_resolve(index, name, expected):
+    assert index.resolve(name) == expected
@@ -0,0 +1,152 @@
+"""
+医院接口客户端测试
+在本地启动模拟医院HIS（scripts/fake_hospital_server.py），检查请求合并、重试、截止时间、
+熔断和幂等挂号
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+import pytest
+from aiohttp import web
+from agents.hospital_client import HospitalAPIClient, HospitalAPIError, CircuitOpenError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+from fake_hospital_server import create_app  # noqa: E402
+
+
+@pytest.fixture
+async def his():
+    """模拟医院HIS，返回其状态和地址"""
+    app = create_app()
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield app["state"], f"http://127.0.0.1:{port}"
+    finally:
+        await runner.cleanup()
+
+
+@pytest.fixture
+async def hospital_client(his):
+    _, base_url = his
+    client = HospitalAPIClient(
+        base_url, api_key="test", timeout=2.0, max_retries=3, retry_backoff=0.02,
+        failure_threshold=5, reset_timeout=0.5
+    )
+    try:
+        yield client
+    finally:
+        await client.close()
+
+
+async def test_concurrent_queries_are_coalesced(his, hospital_client):
+    state, _ = his
+    state["latency"] = 0.05
+    responses = await asyncio.gather(*[hospital_client.get_slots("h001", "内科", "2026-01-01") for _ in range(200)])
+    assert state["hits"]["slots"] == 1
+    assert all(r == responses[0] for r in responses)
+
+
+async def test_cancelled_leader_does_not_fail_followers(his, hospital_client):
+    """第一个发起查询的调用方被取消时，其他等待同一结果的调用方不受影响"""
+    state, _ = his
+    state["latency"] = 0.05
+    leader = asyncio.ensure_future(hospital_client.get_slots("h001", "内科", "2026-01-03"))
+    await asyncio.sleep(0.01)
+    followers = asyncio.gather(*[hospital_client.get_slots("h001", "内科", "2026-01-03") for _ in range(10)])
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    results = await asyncio.gather(followers, return_exceptions=True)
+    assert leader.cancelled()
+    assert not isinstance(results[0], BaseException)
+    assert state["hits"]["slots"] == 1
+
+
+async def test_retries_transient_errors(his, hospital_client, monkeypatch):
+    state, _ = his
+    state["failure_rate"] = 0.3
+    # 模拟HIS的随机错误使用固定种子，结果可重复
+    monkeypatch.setattr(random, "random", random.Random(7).random)
+    failures = 0
+    for i in range(100):
+        try:
+            await hospital_client.get_slots("h002", "外科", f"2026-01-{i % 28 + 1:02d}")
+        except HospitalAPIError:
+            failures += 1
+    # 每次调用最多发送4次，4次都失败的概率为 0.3^4
+    assert failures <= 3
+    assert hospital_client.retries > 0
+
+
+async def test_deadline_includes_retries(his, hospital_client):
+    state, _ = his
+    state["latency"] = 1.0
+    start = time.perf_counter()
+    with pytest.raises(HospitalAPIError):
+        await hospital_client.request(
+            "GET", "h004", "/hospitals/h004/slots",
+            params={"department": "内科", "date": "2026-01-01"}, timeout=0.3
+        )
+    assert time.perf_counter() - start < 0.8
+
+
+async def test_breaker_opens_per_hospital_and_recovers(his, hospital_client):
+    """每次调用（包括重试）只计一次失败，连续5次调用失败后打开，不影响其他医院"""
+    state, _ = his
+    state["down"].add("h003")
+    rejected = 0
+    for _ in range(50):
+        try:
+            await hospital_client.get_status("h003", "GH1")
+        except CircuitOpenError:
+            rejected += 1
+        except HospitalAPIError:
+            pass
+    assert rejected == 45
+    assert sum(state["hits"].values()) <= 5 * (hospital_client.max_retries + 1)
+
+    other = await hospital_client.get_slots("h001", "内科", "2026-01-02")
+    assert other["slots"]
+    assert hospital_client.breaker("h001").state == "closed"
+
+    # reset_timeout 后试探成功即关闭
+    state["down"].discard("h003")
+    await asyncio.sleep(0.6)
+    await hospital_client.get_slots("h003", "内科", "2026-01-01")
+    assert hospital_client.breaker("h003").state == "closed"
+
+
+async def test_half_open_probe_with_client_error_keeps_probing(his, hospital_client):
+    """半开状态的试探请求返回4xx时不关闭熔断器，下一个请求继续试探"""
+    state, _ = his
+    state["down"].add("h005")
+    for _ in range(5):
+        with pytest.raises(HospitalAPIError):
+            await hospital_client.get_status("h005", "GH1")
+    state["down"].discard("h005")
+    await asyncio.sleep(0.6)
+
+    with pytest.raises(HospitalAPIError) as error:
+        await hospital_client.get_status("h005", "GH-unknown")
+    assert error.value.status == 404
+    assert hospital_client.breaker("h005").state == "half_open"
+
+    await hospital_client.get_slots("h005", "内科", "2026-01-01")
+    assert hospital_client.breaker("h005").state == "closed"
+
+
+async def test_booking_is_idempotent(his, hospital_client):
+    state, _ = his
+    payload = {"department": "内科", "doctor": "张主任", "appointment_time": "2026-01-05T08:00:00"}
+    first = await hospital_client.book("h001", payload, idempotency_key="GH100")
+    second = await hospital_client.book("h001", payload, idempotency_key="GH100")
+    assert first == second
+    with pytest.raises(HospitalAPIError) as error:
+        await hospital_client.book("h001", payload, idempotency_key="GH101")
+    assert error.value.status == 409
+    assert len(state["booked"]) == 1
@@ -0,0 +1,60 @@
+"""
+ID生成器测试
+多个进程、每个进程多个线程同时生成ID，检查没有重复
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+import pytest
+from id_generator import SnowflakeGenerator, MAX_WORKER_ID
+
+THREADS = 4
+COUNT = 5000
+
+
+def generate(worker_id, threads: int = THREADS, count: int = COUNT) -> list:
+    """用多个线程共享一个生成器生成ID，子进程中调用时需要定义在模块级别"""
+    generator = SnowflakeGenerator(worker_id)
+    results = [None] * threads
+
+    def run(index: int):
+        results[index] = [generator.next_id() for _ in range(count)]
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [value for chunk in results for value in chunk]
+
+
+def generate_in_processes(worker_ids: list) -> list:
+    # 使用spawn与uvicorn多worker的启动方式一致
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(worker_ids), mp_context=context) as pool:
+        return [value for ids in pool.map(generate, worker_ids) for value in ids]
+
+
+def test_threads_share_generator():
+    ids = generate(1, threads=8, count=20000)
+    assert len(set(ids)) == len(ids)
+
+
+def test_ids_increase_within_thread():
+    generator = SnowflakeGenerator(1)
+    ids = [generator.next_id() for _ in range(10000)]
+    assert ids == sorted(set(ids))
+    assert generator.decode(ids[-1])["worker_id"] == 1
+
+
+@pytest.mark.parametrize("worker_ids", [[0, 1, 2, 3], [None] * 4], ids=["configured", "auto"])
+def test_processes_do_not_collide(worker_ids):
+    ids = generate_in_processes(worker_ids)
+    assert len(ids) == len(worker_ids) * THREADS * COUNT
+    assert len(set(ids)) == len(ids)
+
+
+@pytest.mark.parametrize("worker_id", [-1, MAX_WORKER_ID + 1])
+def test_rejects_invalid_worker_id(worker_id):
+    with pytest.raises(ValueError):
+        SnowflakeGenerator(worker_id)
@@ -0,0 +1,178 @@
+"""
+查询计划测试
+在单独的SQLite数据库上执行迁移并写入测试数据，调用各个列表/档案接口，
+对接口实际执行的每条SQL运行 EXPLAIN QUERY PLAN，检查没有全表扫描
+"""
+import os
+from datetime import datetime, timedelta
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from api.main import app
+from database import create_db_engine, create_async_db_engine, get_async_db
+from models import Base, User, Appointment, MedicalRecord, GuidanceLog, MedicationReminder
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 接口实际执行的SELECT语句至少应有的条数，少于该数量说明监听没有生效
+MIN_ROUTER_QUERIES = 12
+PHONE_PREFIX = "1370000"
+
+
+def create_schema(engine, url: str):
+    """建表后先回退再执行迁移，索引由迁移创建，同时验证迁移本身"""
+    Base.metadata.create_all(bind=engine)
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    config.set_main_option("sqlalchemy.url", url)
+    command.stamp(config, "head")
+    command.downgrade(config, "base")
+    command.upgrade(config, "head")
+
+
+def seed(engine) -> int:
+    """写入多个用户的历史数据，返回被检查用户的ID"""
+    db = sessionmaker(bind=engine)()
+    now = datetime.now()
+    users = [User(name=f"用户{i}", phone=f"{PHONE_PREFIX}{i:04d}") for i in range(50)]
+    db.add_all(users)
+    db.commit()
+    for user in users:
+        db.add_all([
+            Appointment(
+                user_id=user.id,
+                hospital_name="市第一人民医院",
+                department="内科",
+                appointment_date=now - timedelta(days=i),
+                appointment_number=f"A{user.id:04d}{i:04d}",
+                status="confirmed" if i % 3 else "cancelled"
+            )
+            for i in range(40)
+        ])
+        db.add_all([
+            MedicalRecord(
+                user_id=user.id,
+                visit_date=now - timedelta(days=i),
+                hospital_name="市第一人民医院",
+                department="内科",
+                prescriptions=[{"name": "阿莫西林"}] if i % 2 else None
+            )
+            for i in range(40)
+        ])
+        db.add_all([
+            GuidanceLog(user_id=user.id, guidance_type="registration", guidance_content="挂号")
+            for _ in range(40)
+        ])
+        db.add(MedicationReminder(
+            user_id=user.id,
+            medication="阿莫西林",
+            times=["08:00"],
+            start_date=now,
+            days=7,
+            next_fire_at=now
+        ))
+    db.commit()
+    user_id = users[0].id
+    db.close()
+    with engine.connect() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    return user_id
+
+
+@pytest.fixture
+async def plan_db(tmp_path):
+    """迁移并写入数据的数据库，接口在测试期间改用该数据库"""
+    url = f"sqlite:///{tmp_path / 'query_plans.db'}"
+    engine = create_db_engine(url)
+    async_engine = create_async_db_engine(url)
+    create_schema(engine, url)
+    user_id = seed(engine)
+    session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def get_plan_db():
+        async with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db] = get_plan_db
+    try:
+        yield engine, async_engine, user_id
+    finally:
+        app.dependency_overrides.pop(get_async_db, None)
+        await async_engine.dispose()
+        engine.dispose()
+
+
+async def capture_queries(client, engines, user_id: int) -> list:
+    """调用接口并记录实际执行的SELECT语句"""
+    captured = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    first = (await client.get(
+        f"/api/appointments/user/{user_id}/appointments", params={"limit": 5}
+    )).json()
+    requests = [
+        ("用户预约列表", f"/api/appointments/user/{user_id}/appointments", {"limit": 5}),
+        ("用户预约列表(翻页)", f"/api/appointments/user/{user_id}/appointments",
+         {"limit": 5, "cursor": first["next_cursor"]}),
+        ("用户预约列表(按状态)", f"/api/appointments/user/{user_id}/appointments",
+         {"status": "confirmed"}),
+        ("指导历史", f"/api/guidance/user/{user_id}/history", {}),
+        ("用药记录", f"/api/medications/user/{user_id}/medications", {}),
+        ("健康档案", f"/api/users/{user_id}/health-profile", {"refresh": True}),
+        ("提醒规则", f"/api/medications/user/{user_id}/reminder-rules", {}),
+        ("手机号查询用户", f"/api/users/phone/{PHONE_PREFIX}0000", {}),
+    ]
+
+    queries = []
+    for db_engine in engines:
+        event.listen(db_engine, "before_cursor_execute", before_execute)
+    try:
+        for name, url, params in requests:
+            captured.clear()
+            response = await client.get(url, params=params)
+            assert response.status_code == 200, f"{name} 请求失败: {response.text}"
+            assert captured, f"{name} 没有捕获到SQL语句"
+            queries.extend((name, statement, parameters) for statement, parameters in captured)
+    finally:
+        for db_engine in engines:
+            event.remove(db_engine, "before_cursor_execute", before_execute)
+    return queries
+
+
+def full_scans(engine, queries) -> list:
+    """对每条语句执行 EXPLAIN QUERY PLAN，返回全表扫描的语句"""
+    failures = []
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for name, statement, parameters in queries:
+            plan = cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+            # "SCAN 表名" 为全表扫描，"SCAN 表名 USING INDEX" 为按索引顺序扫描
+            scans = [row[-1] for row in plan if row[-1].startswith("SCAN") and "USING" not in row[-1]]
+            if scans:
+                failures.append(f"{name}: {', '.join(scans)}\n  {' '.join(statement.split())}")
+    finally:
+        raw.close()
+    return failures
+
+
+async def test_router_queries_use_indexes(client, plan_db):
+    engine, async_engine, user_id = plan_db
+    # 路由使用异步会话，语句在异步引擎底层的同步引擎上执行，两个引擎都监听
+    queries = await capture_queries(client, (engine, async_engine.sync_engine), user_id)
+    assert len(queries) >= MIN_ROUTER_QUERIES
+
+    # 挂号单号查询目前没有对应接口，直接检查
+    queries.append((
+        "挂号单号查询",
+        "SELECT id FROM appointments WHERE appointment_number = ?",
+        ("A00010001",)
+    ))
+    failures = full_scans(engine, queries)
+    assert not failures, "查询出现全表扫描:\n" + "\n".join(failures)
@@ -0,0 +1,123 @@
+"""
+号源库存测试
+"""
+from collections import Counter
+from datetime import date
+import asyncio
+import random
+import pytest
+from sqlalchemy import delete, select
+from database import AsyncSessionLocal, init_db
+from models import Appointment, DoctorSchedule, User
+from slot_inventory import SlotInventory, DoctorUnavailableError, SLOT_TIMES, DEFAULT_SCHEDULE
+
+STRESS_HOSPITAL = "h-stress"
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    init_db()
+
+
+async def test_reseed_after_rollback():
+    """生成排班的事务被回滚后（PostgreSQL下插入的行随之丢弃），同一天需要重新生成"""
+    inventory = SlotInventory(cache_ttl=0)
+    day = date(2030, 1, 1)
+    async with AsyncSessionLocal() as db:
+        await inventory.ensure_day(db, "h-rollback", "内科", day)
+        await db.rollback()
+        # 模拟回滚丢弃了生成的排班（SQLite在释放SAVEPOINT时已经写入）
+        await db.execute(delete(DoctorSchedule).where(DoctorSchedule.hospital_id == "h-rollback"))
+        await db.commit()
+
+        slot = await inventory.reserve(db, "h-rollback", "内科", day, 0)
+        await db.commit()
+    assert slot is not None
+    assert slot["doctor_name"] == "张主任"
+
+
+async def test_reserve_rejects_doctor_not_on_duty():
+    inventory = SlotInventory(cache_ttl=0)
+    day = date(2030, 1, 2)
+    async with AsyncSessionLocal() as db:
+        # 09:00（第2个时间段）是王医生出诊，张主任出诊 08:00 和 10:00
+        with pytest.raises(DoctorUnavailableError) as error:
+            await inventory.reserve(db, "h-doctor", "内科", day, 2, "张主任")
+        assert error.value.times == ["08:00-08:30", "10:00-10:30"]
+
+        with pytest.raises(DoctorUnavailableError) as error:
+            await inventory.reserve(db, "h-doctor", "内科", day, 2, "不存在的医生")
+        assert error.value.times == []
+
+        slot = await inventory.reserve(db, "h-doctor", "内科", day, 4, "张主任")
+        assert slot["slot_time"] == "10:00-10:30"
+        # 该医生出诊但已约满时返回None（接口返回409）
+        assert await inventory.reserve(db, "h-doctor", "内科", day, 4, "张主任") is None
+        await db.rollback()
+
+
+async def booked_slots() -> set:
+    """检查号源位图与有效预约一致、没有号源被重复预约，返回已预约的号源"""
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(Appointment.schedule_id, Appointment.slot_index).where(
+                Appointment.status == "confirmed", Appointment.hospital_id == STRESS_HOSPITAL
+            )
+        )).all()
+        masks = (await db.execute(
+            select(DoctorSchedule.id, DoctorSchedule.booked_mask).where(DoctorSchedule.hospital_id == STRESS_HOSPITAL)
+        )).all()
+    assert len(rows) == len(set(rows)), "号源被重复预约"
+    booked = {(schedule_id, i) for schedule_id, mask in masks for i in range(len(SLOT_TIMES)) if mask >> i & 1}
+    assert booked == set(rows), "号源位图与预约记录不一致"
+    return booked
+
+
+async def test_concurrent_booking_never_double_books(client):
+    departments = ["内科", "外科", "儿科"]
+    capacity = len(departments) * sum(len(slots) for _, _, slots in DEFAULT_SCHEDULE)
+    async with AsyncSessionLocal() as db:
+        users = [User(name=f"并发用户{i}", phone=f"138{i:08d}") for i in range(150)]
+        db.add_all(users)
+        await db.commit()
+        user_ids = [u.id for u in users]
+
+    async def book(user_id: int, department: str, time_text: str) -> int:
+        response = await client.post("/api/appointments/", json={
+            "user_id": user_id,
+            "hospital_id": STRESS_HOSPITAL,
+            "hospital_name": "市人民医院",
+            "department": department,
+            "appointment_date": f"2030-03-01T{time_text[:5]}:00"
+        })
+        return response.status_code
+
+    def every_slot() -> list:
+        # 每个号源各请求一次，未被抢到的号源也会约满
+        return [book(user_ids[0], d, t) for d in departments for t in SLOT_TIMES]
+
+    rng = random.Random(7)
+    jobs = [book(u, rng.choice(departments), rng.choice(SLOT_TIMES)) for u in user_ids]
+    statuses = Counter(await asyncio.gather(*jobs, *every_slot()))
+    assert set(statuses) <= {200, 409}
+    assert statuses[200] == capacity
+    booked = await booked_slots()
+    assert len(booked) == capacity
+
+    # 取消一半（重复取消不能多次释放号源）后重新并发预约
+    async with AsyncSessionLocal() as db:
+        ids = (await db.scalars(
+            select(Appointment.id).where(
+                Appointment.status == "confirmed", Appointment.hospital_id == STRESS_HOSPITAL
+            )
+        )).all()
+    cancelled = ids[::2]
+    for _ in range(2):
+        await asyncio.gather(*[client.put(f"/api/appointments/{i}/cancel") for i in cancelled])
+    assert len(await booked_slots()) == capacity - len(cancelled)
+
+    jobs = [book(u, rng.choice(departments), rng.choice(SLOT_TIMES)) for u in user_ids]
+    statuses = Counter(await asyncio.gather(*jobs, *every_slot()))
+    assert set(statuses) <= {200, 409}
+    assert statuses[200] == len(cancelled)
+    assert len(await booked_slots()) == capacity